@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark order list responses: stdlib JSON vs. orjson.
+
+Builds and renders a list response of 1000 orders the way OrderView used to
+(model instances, float() per Decimal, DRF's stdlib JSONRenderer) and the way
+it does now (values() rows rendered by FastJSONRenderer). Orders are written
+to a throwaway test database, and the order cache and metric files to a
+temporary directory, so a deployment's run/ directory is left alone.
+
+Run with: python benchmark_json.py [--orders 1000] [--rounds 50]
+"""
+import sys
+import os
+import copy
+import time
+import pathlib
+import tempfile
+import decimal
+import logging
+import argparse
+import django
+
+# Set up Django environment
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inter_broker.settings')
+django.setup()
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+from broker import fastjson
+from broker.metrics import REGISTRY
+from ib_gateway.models import Order
+from ib_gateway.views import OrderView, ORDER_LIST_FIELDS
+
+# Set up logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def legacy_response(limit):
+    """List response as OrderView built it with the stdlib renderer"""
+    orders = Order.objects.all().order_by('-created_at')[:limit]
+    data = {
+        'success': True,
+        'orders': [{
+            'id': order.id,
+            'order_id': order.order_id,
+            'action': order.action,
+            'symbol': order.symbol,
+            'quantity': float(order.quantity),
+            'order_type': order.order_type,
+            'status': order.status,
+            'filled_quantity': float(order.filled_quantity) if order.filled_quantity else 0,
+            'created_at': order.created_at
+        } for order in orders],
+    }
+    return JSONRenderer().render(data)
+
+
+def fast_response(limit):
+    """List response as OrderView builds it now"""
+    orders = Order.objects.all().order_by('-created_at').values(*ORDER_LIST_FIELDS)[:limit]
+    return fastjson.FastJSONRenderer().render({'success': True, 'orders': list(orders)})
+
+
+def view_response(limit):
+    """Full OrderView GET including DRF request handling"""
+    request = APIRequestFactory().get('/api/ib/orders/', {'limit': limit}, HTTP_ACCEPT='application/json')
+    response = OrderView.as_view()(request)
+    response.render()
+    return response.content
+
+
+def timed(func, limit, rounds):
+    """Return the mean time per call in milliseconds"""
+    func(limit)
+    start_time = time.perf_counter()
+    for _ in range(rounds):
+        func(limit)
+    return (time.perf_counter() - start_time) / rounds * 1000
+
+
+def benchmark(count, rounds):
+    with tempfile.TemporaryDirectory(prefix='inter_broker_benchmark_') as run_dir:
+        caches = copy.deepcopy(settings.CACHES)
+        caches['orders']['LOCATION'] = pathlib.Path(run_dir) / 'cache' / 'orders'
+        with override_settings(CACHES=caches, METRICS_DIR=pathlib.Path(run_dir) / 'metrics'):
+            settings.DEBUG = False
+            old_name = connection.creation.create_test_db(verbosity=0)
+            try:
+                Order.objects.bulk_create([
+                    Order(
+                        order_id=str(1000 + i),
+                        action='BUY' if i % 2 else 'SELL',
+                        symbol=('AAPL', 'MSFT', 'TSLA', 'NVDA')[i % 4],
+                        quantity=decimal.Decimal('10.5'),
+                        status=('FILLED', 'SUBMITTED', 'CANCELLED')[i % 3],
+                        filled_quantity=decimal.Decimal('10.5') if i % 3 == 0 else 0,
+                        avg_fill_price=decimal.Decimal('187.12345') if i % 3 == 0 else None,
+                    )
+                    for i in range(count)
+                ])
+
+                logger.info(f"JSON backend: {'orjson' if fastjson.orjson else 'stdlib json'}")
+                legacy = timed(legacy_response, count, rounds)
+                fast = timed(fast_response, count, rounds)
+                view = timed(view_response, count, rounds)
+                logger.info(f"Legacy (instances + stdlib json): {legacy:7.2f} ms per {count}-order response")
+                logger.info(f"Fast (values() + FastJSONRenderer): {fast:7.2f} ms per {count}-order response")
+                logger.info(f"Speedup: {legacy / fast:.2f}x")
+                logger.info(f"OrderView GET end to end: {view:7.2f} ms")
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                # Otherwise the exit flush would write the benchmark's metrics to METRICS_DIR
+                REGISTRY.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark order list JSON rendering")
+    parser.add_argument('--orders', type=int, default=1000, help='Orders in the list response')
+    parser.add_argument('--rounds', type=int, default=50, help='Responses rendered per variant')
+    args = parser.parse_args()
+
+    benchmark(args.orders, args.rounds)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark the webhook endpoint: DRF WebhookView vs. the lean WSGI endpoint.
+
+Both are called in-process through their WSGI entry points (no network), one
+request at a time, so the rate is what a single worker can sustain.
+Webhooks are written to a throwaway test database.
+
+Run with: python benchmark_webhook.py [--requests 2000]
+"""
+import sys
+import os
+import io
+import time
+import logging
+import argparse
+import django
+
+# Set up Django environment
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inter_broker.settings')
+django.setup()
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection
+from broker.lean import LeanWebhookApp
+from broker.models import Webhook
+
+# Set up logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+BODY = b'{"symbol": "AAPL", "action": "BUY", "quantity": 1}'
+
+
+def make_environ(body=BODY):
+    """Build the WSGI environ of a webhook POST as forwarded by nginx"""
+    return {
+        'REQUEST_METHOD': 'POST',
+        'PATH_INFO': '/api/webhook/',
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1',
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'HTTP_HOST': 'localhost',
+        'HTTP_USER_AGENT': 'Go-http-client/1.1',
+        'HTTP_X_FORWARDED_FOR': '52.89.214.238',
+        'HTTP_X_REAL_IP': '52.89.214.238',
+        'HTTP_X_FORWARDED_PROTO': 'https',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.url_scheme': 'http',
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+
+
+def run(app, requests):
+    """Send webhooks through a WSGI app and return the request rate"""
+    statuses = []
+
+    def start_response(status, headers, exc_info=None):
+        statuses.append(status)
+
+    start_time = time.perf_counter()
+    for _ in range(requests):
+        response = app(make_environ(), start_response)
+        b''.join(response)
+        if hasattr(response, 'close'):
+            response.close()
+    elapsed = time.perf_counter() - start_time
+
+    failed = [status for status in statuses if not status.startswith('201')]
+    if failed:
+        logger.error(f"{len(failed)} requests failed, e.g. {failed[0]}")
+    return requests / elapsed
+
+
+def benchmark(requests):
+    """Compare the DRF view and the lean endpoint"""
+    # Keep the query log and per-request debug logging out of the measurement
+    settings.DEBUG = False
+    logging.getLogger('broker').setLevel(logging.ERROR)
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        django_app = WSGIHandler()
+        lean_app = LeanWebhookApp(django_app)
+
+        # Warm up both paths (imports, URL resolver, header set cache)
+        run(django_app, 50)
+        run(lean_app, 50)
+
+        drf_rate = run(django_app, requests)
+        lean_rate = run(lean_app, requests)
+
+        logger.info(f"Stored {Webhook.objects.count()} webhooks")
+        logger.info(f"DRF WebhookView:  {drf_rate:8.0f} req/s per worker")
+        logger.info(f"Lean endpoint:    {lean_rate:8.0f} req/s per worker")
+        logger.info(f"Speedup:          {lean_rate / drf_rate:8.2f}x")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the webhook endpoint")
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per endpoint')
+    args = parser.parse_args()
+
+    benchmark(args.requests)
@@ -1,12 +1,40 @@
 from django.contrib import admin
-from .models import Webhook
+from .models import HeaderSet, Webhook, WebhookArchive
 
 @admin.register(Webhook)
 class WebhookAdmin(admin.ModelAdmin):
     list_display = ('received_at', 'source_ip')
     list_filter = ('received_at', 'source_ip')
-    readonly_fields = ('received_at', 'source_ip', 'payload', 'headers')
+    readonly_fields = ('received_at', 'source_ip', 'payload', 'stored_headers', 'header_set')
+    exclude = ('headers',)
     search_fields = ('source_ip',)
+    ordering = ('-received_at',)  # Served by webhook_received_idx
     
     def has_add_permission(self, request):
         return False  # Prevent manual creation of webhooks
+    
+    def stored_headers(self, obj):
+        """Headers as received, resolved from the shared header set if needed"""
+        return obj.get_headers()
+    
+    stored_headers.short_description = 'Headers'
+
+
+@admin.register(HeaderSet)
+class HeaderSetAdmin(admin.ModelAdmin):
+    list_display = ('digest', 'created_at')
+    readonly_fields = ('digest', 'headers', 'created_at')
+    search_fields = ('digest',)
+    
+    def has_add_permission(self, request):
+        return False  # Header sets are only created by incoming webhooks
+
+
+@admin.register(WebhookArchive)
+class WebhookArchiveAdmin(admin.ModelAdmin):
+    list_display = ('day', 'webhook_count', 'first_id', 'last_id', 'path', 'updated_at')
+    readonly_fields = ('day', 'path', 'compression', 'webhook_count', 'first_id', 'last_id', 'created_at', 'updated_at')
+    date_hierarchy = 'day'
+    
+    def has_add_permission(self, request):
+        return False  # Archives are only created by the archive_webhooks command
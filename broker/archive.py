@@ -0,0 +1,221 @@
+"""
+Retention for stored webhooks.
+
+Webhooks older than the retention period are moved out of the hot table into
+one compressed NDJSON file per day (gzip or lzma) under WEBHOOK_ARCHIVE_DIR.
+Each archived day gets a WebhookArchive row holding the file name, row count
+and id range, which is all that is needed to find an archived webhook again.
+"""
+
+import datetime
+import gzip
+import json
+import logging
+import lzma
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Webhook, WebhookArchive
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_OPENERS = {
+    'gzip': gzip.open,
+    'lzma': lzma.open,
+}
+
+ARCHIVE_EXTENSIONS = {
+    'gzip': 'gz',
+    'lzma': 'xz',
+}
+
+
+def get_archive_dir():
+    """Return the directory archive files are written to"""
+    return Path(getattr(settings, 'WEBHOOK_ARCHIVE_DIR', settings.BASE_DIR / 'archive' / 'webhooks'))
+
+
+def open_archive(archive, mode='rt'):
+    """Open the file of a WebhookArchive for reading or appending"""
+    opener = ARCHIVE_OPENERS[archive.compression]
+    return opener(get_archive_dir() / archive.path, mode, encoding='utf-8')
+
+
+def webhook_record(webhook, related):
+    """Build the archived representation of a webhook"""
+    return {
+        'id': webhook.id,
+        'received_at': webhook.received_at,
+        'source_ip': webhook.source_ip,
+        'payload': webhook.payload,
+        'headers': webhook.get_headers(),
+        'related': related.get(webhook.id, {}),
+    }
+
+
+def get_related_ids(webhook_ids):
+    """
+    Collect the rows that reference each webhook (e.g. orders), since their
+    foreign keys are cleared when the webhook is deleted
+
+    Returns:
+        dict: webhook id -> {model label: [ids]}
+    """
+    related = {}
+    for relation in Webhook._meta.related_objects:
+        if not relation.field.many_to_one:
+            continue
+        field_name = relation.field.name
+        label = relation.related_model._meta.label_lower
+        rows = relation.related_model._base_manager.filter(
+            **{f'{field_name}__in': webhook_ids}
+        ).values_list(f'{field_name}_id', 'pk')
+        for webhook_id, pk in rows:
+            related.setdefault(webhook_id, {}).setdefault(label, []).append(pk)
+    return related
+
+
+def archive_day(day, compression='gzip', batch_size=1000):
+    """
+    Move all webhooks received on a given day into the day's archive file
+
+    Webhooks already covered by the archive index (id <= last_id) are only
+    deleted, so an interrupted run can safely be repeated.
+
+    Args:
+        day (date): Day to archive (UTC)
+        compression (str): 'gzip' or 'lzma', used when the archive is new
+        batch_size (int): Number of rows read and deleted per query
+
+    Returns:
+        int: Number of webhooks written to the archive
+    """
+    archive, _ = WebhookArchive.objects.get_or_create(
+        day=day,
+        defaults={
+            'compression': compression,
+            'path': f"webhooks-{day.isoformat()}.ndjson.{ARCHIVE_EXTENSIONS[compression]}",
+        },
+    )
+
+    start = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min), datetime.timezone.utc)
+    day_webhooks = Webhook.objects.filter(received_at__gte=start, received_at__lt=start + datetime.timedelta(days=1))
+    pending = day_webhooks
+    if archive.last_id is not None:
+        pending = pending.filter(id__gt=archive.last_id)
+    pending = pending.select_related('header_set').order_by('id')
+
+    written = 0
+    first_id = None
+    last_id = None
+
+    if pending.exists():
+        get_archive_dir().mkdir(parents=True, exist_ok=True)
+        with open_archive(archive, 'at') as archive_file:
+            batch = []
+            for webhook in pending.iterator(chunk_size=batch_size):
+                batch.append(webhook)
+                if len(batch) >= batch_size:
+                    _write_batch(archive_file, batch)
+                    written += len(batch)
+                    first_id = first_id if first_id is not None else batch[0].id
+                    last_id = batch[-1].id
+                    batch = []
+            if batch:
+                _write_batch(archive_file, batch)
+                written += len(batch)
+                first_id = first_id if first_id is not None else batch[0].id
+                last_id = batch[-1].id
+
+        # Make sure the compressed data is on disk before rows are deleted
+        with open(get_archive_dir() / archive.path, 'rb') as archive_file:
+            os.fsync(archive_file.fileno())
+
+    # Record the archived range before deleting anything from the hot table
+    if written:
+        archive.webhook_count += written
+        if archive.first_id is None:
+            archive.first_id = first_id
+        archive.last_id = last_id
+        archive.save()
+        logger.info(f"Archived {written} webhooks from {day} to {archive.path}")
+
+    if archive.last_id is not None:
+        _delete_archived(day_webhooks.filter(id__lte=archive.last_id), batch_size)
+
+    return written
+
+
+def _write_batch(archive_file, batch):
+    """Append a batch of webhooks to an open archive file"""
+    related = get_related_ids([webhook.id for webhook in batch])
+    archive_file.write(''.join(
+        json.dumps(webhook_record(webhook, related), cls=DjangoJSONEncoder) + '\n'
+        for webhook in batch
+    ))
+
+
+def _delete_archived(queryset, batch_size):
+    """Delete archived webhooks in batches to keep transactions short"""
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        Webhook.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+    return deleted
+
+
+def archive_webhooks(days, compression='gzip', batch_size=1000):
+    """
+    Archive every webhook received more than `days` days ago
+
+    Returns:
+        dict: day -> number of webhooks archived
+    """
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    cutoff_day = cutoff.astimezone(datetime.timezone.utc).date()
+
+    # Only whole days are archived, so each file is written once per day
+    archive_days = (
+        Webhook.objects.filter(received_at__lt=cutoff)
+        .annotate(day=TruncDate('received_at', tzinfo=datetime.timezone.utc))
+        .filter(day__lt=cutoff_day)
+        .values_list('day', flat=True)
+        .distinct()
+        .order_by('day')
+    )
+
+    results = {}
+    for day in list(archive_days):
+        results[day] = archive_day(day, compression=compression, batch_size=batch_size)
+    return results
+
+
+def iter_archive(archive):
+    """Yield the archived webhook records of a WebhookArchive"""
+    with open_archive(archive) as archive_file:
+        for line in archive_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def find_archived_webhook(webhook_id):
+    """
+    Look up an archived webhook by its original ID
+
+    Returns:
+        dict: The archived record or None if not found
+    """
+    candidates = WebhookArchive.objects.filter(first_id__lte=webhook_id, last_id__gte=webhook_id)
+    for archive in candidates:
+        for record in iter_archive(archive):
+            if record['id'] == webhook_id:
+                return record
+    return None
@@ -0,0 +1,115 @@
+"""
+Per-process database write queue.
+
+With SQLITE_WRITE_QUEUE enabled, hot write paths (storing webhooks) hand
+their writes to one writer thread per process through run_write(). The
+writer thread commits the writes queued behind each other in one
+transaction, with a savepoint per write, so a burst costs a single commit
+and this process never competes with itself for the database lock. Readers
+are never blocked thanks to WAL (see DATABASES in settings.py).
+"""
+
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# Most writes committed together by the writer thread
+WRITE_BATCH_SIZE = 64
+
+
+def write_queue_enabled(using=DEFAULT_DB_ALIAS):
+    """Whether writes to the database go through the writer thread"""
+    return (getattr(settings, 'SQLITE_WRITE_QUEUE', False)
+            and connections[using].vendor == 'sqlite')
+
+
+class DatabaseWriter:
+    """Single writer thread committing queued writes in batches"""
+
+    def __init__(self, using=DEFAULT_DB_ALIAS, batch_size=WRITE_BATCH_SIZE):
+        self.using = using
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """Queue a write and return a Future with its result"""
+        self._ensure_thread()
+        future = Future()
+        self.queue.put((future, func, args, kwargs))
+        return future
+
+    def _ensure_thread(self):
+        """Start the writer thread (again after a fork, e.g. in gunicorn workers)"""
+        if self.pid == os.getpid():
+            return
+        with self._lock:
+            if self.pid != os.getpid():
+                self.queue = queue.Queue()
+                threading.Thread(target=self._run, args=(self.queue,), name='db-writer', daemon=True).start()
+                self.pid = os.getpid()
+
+    def _run(self, jobs):
+        while True:
+            batch = [jobs.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(jobs.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch):
+        """Run a batch of writes in one transaction, one savepoint each"""
+        close_old_connections()
+        results = []
+        try:
+            with transaction.atomic(using=self.using):
+                for future, func, args, kwargs in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with transaction.atomic(using=self.using):
+                            results.append((future, func(*args, **kwargs), None))
+                    except Exception as e:
+                        results.append((future, None, e))
+        except Exception as e:
+            # The commit itself failed, none of the writes are stored
+            logger.error(f"Error committing {len(batch)} queued writes: {str(e)}")
+            for future, _, _, _ in batch:
+                if future.running():
+                    future.set_exception(e)
+            connections[self.using].close_if_unusable_or_obsolete()
+            return
+
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+_writer = DatabaseWriter()
+
+
+def run_write(func, *args, **kwargs):
+    """
+    Run a database write, through the writer thread when the write queue is enabled
+
+    Writes made inside an atomic block run inline so they stay part of the
+    caller's transaction.
+
+    Returns:
+        The return value of func
+    """
+    if not write_queue_enabled() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return func(*args, **kwargs)
+    return _writer.submit(func, *args, **kwargs).result()
@@ -0,0 +1,80 @@
+"""
+Fast JSON encoding and decoding for the REST API.
+
+Uses orjson when it is installed and falls back to the stdlib json module
+otherwise. Everything orjson can't encode natively, and every datetime,
+date and time, goes through DRF's JSONEncoder, so decimals, lazy strings
+and timestamps (including their precision) come out the same as with
+DRF's renderer whichever backend is used.
+"""
+
+import json
+
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Datetimes are passed to DRF's encoder too: orjson's own format may differ from it (e.g. in precision)
+ORJSON_OPTIONS = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+# Escaped by DRF so output stays a strict JavaScript subset
+LINE_SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+# Encodes the types orjson doesn't handle natively, or is told to pass through
+_encoder = JSONEncoder()
+
+
+def dumps(data):
+    """Serialize data to compact UTF-8 JSON bytes"""
+    if orjson is not None:
+        content = orjson.dumps(data, default=_encoder.default, option=ORJSON_OPTIONS)
+    else:
+        content = json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    if b'\xe2\x80' in content:
+        for separator, escaped in LINE_SEPARATORS:
+            content = content.replace(separator, escaped)
+    return content
+
+
+def loads(content):
+    """Deserialize JSON from bytes or str"""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content, parse_constant=_reject_constant)
+
+
+def _reject_constant(value):
+    """Reject NaN and Infinity like DRF's strict parser and orjson do"""
+    raise ValueError(f"Invalid JSON constant: {value}")
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """JSONRenderer using orjson for compact output"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        # Pretty printed output (e.g. from the browsable API) stays on DRF's encoder
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        return dumps(data)
+
+
+class FastJSONParser(parsers.JSONParser):
+    """JSONParser using orjson"""
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return loads(stream.read())
+        except ValueError as exc:
+            raise ParseError(f"JSON parse error - {str(exc)}")
@@ -0,0 +1,107 @@
+"""
+Header storage for incoming webhooks.
+
+In 'full' mode every request header is stored on the webhook row, exactly as
+received. In 'compact' mode only the allowlisted headers are kept: the ones
+that are the same for every request from a client are stored once in
+HeaderSet and shared by reference, while per-request headers (the forwarded
+client addresses) stay on the webhook row so they don't create a header set
+per client IP.
+"""
+
+import collections
+import hashlib
+import json
+import logging
+import threading
+
+from django.conf import settings
+
+from .models import HeaderSet
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEADER_ALLOWLIST = (
+    'Host',
+    'User-Agent',
+    'Content-Type',
+    'X-Forwarded-Proto',
+)
+
+DEFAULT_REQUEST_HEADER_ALLOWLIST = (
+    'X-Forwarded-For',
+    'X-Real-Ip',
+)
+
+# Maximum number of digests remembered per process
+HEADER_SET_CACHE_SIZE = 1024
+
+# Process-local LRU map of digest -> HeaderSet id, so recurring header sets
+# don't need a lookup query on every webhook
+_header_set_ids = collections.OrderedDict()
+_header_set_ids_lock = threading.Lock()
+
+
+def get_header_storage():
+    """Return the configured header storage mode ('full' or 'compact')"""
+    return getattr(settings, 'WEBHOOK_HEADER_STORAGE', 'full')
+
+
+def filter_headers(headers, allowlist=None):
+    """Keep only the allowlisted headers (case-insensitive)"""
+    if allowlist is None:
+        allowlist = getattr(settings, 'WEBHOOK_HEADER_ALLOWLIST', DEFAULT_HEADER_ALLOWLIST)
+    allowed = {name.lower() for name in allowlist}
+    return {name: value for name, value in headers.items() if name.lower() in allowed}
+
+
+def filter_request_headers(headers, allowlist=None):
+    """Keep only the per-request headers stored on the webhook row (case-insensitive)"""
+    if allowlist is None:
+        allowlist = getattr(settings, 'WEBHOOK_REQUEST_HEADER_ALLOWLIST', DEFAULT_REQUEST_HEADER_ALLOWLIST)
+    allowed = {name.lower() for name in allowlist}
+    return {name: value for name, value in headers.items() if name.lower() in allowed}
+
+
+def header_digest(headers):
+    """Return the SHA-256 digest of the canonical JSON form of the headers"""
+    canonical = json.dumps(headers, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def get_header_set_id(headers):
+    """Return the id of the HeaderSet for these headers, creating it if needed"""
+    digest = header_digest(headers)
+    with _header_set_ids_lock:
+        header_set_id = _header_set_ids.get(digest)
+        if header_set_id is not None:
+            _header_set_ids.move_to_end(digest)
+            return header_set_id
+
+    header_set, created = HeaderSet.objects.get_or_create(digest=digest, defaults={'headers': headers})
+    if created:
+        logger.info(f"Stored new header set {digest[:12]}")
+
+    with _header_set_ids_lock:
+        _header_set_ids[digest] = header_set.id
+        # Forget the least recently used digests
+        while len(_header_set_ids) > HEADER_SET_CACHE_SIZE:
+            _header_set_ids.popitem(last=False)
+    return header_set.id
+
+
+def prepare_headers(headers):
+    """
+    Build the header fields of a webhook for the configured storage mode
+
+    Args:
+        headers (dict): Request headers as received
+
+    Returns:
+        tuple: (headers, header_set_id) to store on the webhook
+    """
+    headers = dict(headers)
+    if get_header_storage() != 'compact':
+        return headers, None
+
+    return filter_request_headers(headers), get_header_set_id(filter_headers(headers))
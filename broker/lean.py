@@ -0,0 +1,148 @@
+"""
+Lean webhook endpoint.
+
+A bare WSGI app mounted in front of Django (see inter_broker/wsgi.py) that
+handles POSTs to the webhook path itself: it reads the body, validates its
+size and content type and stores the webhook, without going through the
+Django middleware stack or DRF. Every other request is passed on to Django.
+
+Enabled with WEBHOOK_LEAN_ENDPOINT = True.
+"""
+
+import ipaddress
+import logging
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http.request import HttpHeaders
+
+from . import fastjson, metrics
+from .db import run_write
+from .headers import prepare_headers
+from .middleware import get_client_ip, get_webhook_allowlist
+from .models import Webhook
+
+logger = logging.getLogger(__name__)
+
+STATUS_LINES = {
+    201: '201 Created',
+    400: '400 Bad Request',
+    403: '403 Forbidden',
+    405: '405 Method Not Allowed',
+    411: '411 Length Required',
+    413: '413 Payload Too Large',
+    415: '415 Unsupported Media Type',
+    500: '500 Internal Server Error',
+}
+
+SUPPORTED_CONTENT_TYPES = ('text/plain', 'application/json')
+
+# Reason a webhook was refused, per status code, for the webhooks_rejected_total metric
+REJECTION_REASONS = {
+    400: 'invalid',
+    403: 'ip',
+    405: 'method',
+    411: 'length',
+    413: 'too_large',
+    415: 'content_type',
+    500: 'error',
+}
+
+
+class LeanWebhookApp:
+    """WSGI app serving the webhook path and delegating everything else"""
+
+    def __init__(self, application, path=None, max_body_size=None):
+        """
+        Args:
+            application: The Django WSGI application to delegate to
+            path (str): Webhook path handled by this app
+            max_body_size (int): Largest accepted body in bytes
+        """
+        self.application = application
+        self.path = path or getattr(settings, 'WEBHOOK_LEAN_PATH', '/api/webhook/')
+        self.max_body_size = max_body_size or getattr(settings, 'WEBHOOK_MAX_BODY_SIZE', 64 * 1024)
+        self.allowlist_enabled = getattr(settings, 'WEBHOOK_IP_ALLOWLIST_ENABLED', False)
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO') != self.path:
+            return self.application(environ, start_response)
+
+        with metrics.WEBHOOK_DURATION.timer(endpoint='lean'):
+            status_code, body = self.handle(environ)
+        if status_code == 201:
+            metrics.WEBHOOKS_RECEIVED.inc(endpoint='lean')
+        else:
+            metrics.WEBHOOKS_REJECTED.inc(endpoint='lean', reason=REJECTION_REASONS[status_code])
+        payload = fastjson.dumps(body)
+        start_response(STATUS_LINES[status_code], [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(payload))),
+        ])
+        return [payload]
+
+    def handle(self, environ):
+        """
+        Validate and store a webhook
+
+        Returns:
+            tuple: (status code, response body)
+        """
+        if environ.get('REQUEST_METHOD') != 'POST':
+            return 405, {"error": "Method not allowed"}
+
+        ip = get_client_ip(environ)
+        if self.allowlist_enabled and not get_webhook_allowlist().match(ip):
+            logger.warning(f"Rejected webhook from unauthorized IP {ip}")
+            return 403, {"error": "Unauthorized IP address", "received_ip": ip}
+
+        try:
+            content_length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return 411, {"error": "Invalid Content-Length"}
+        if content_length <= 0:
+            return 411, {"error": "Content-Length required"}
+        if content_length > self.max_body_size:
+            return 413, {"error": f"Body larger than {self.max_body_size} bytes"}
+
+        content_type = environ.get('CONTENT_TYPE', '').split(';')[0].strip().lower()
+        if content_type not in SUPPORTED_CONTENT_TYPES:
+            return 415, {"error": f"Unsupported Content-Type: {content_type}"}
+
+        body = environ['wsgi.input'].read(content_length)
+        try:
+            text_content = body.decode('utf-8')
+            if content_type == 'text/plain':
+                json_payload = {"text": text_content}
+            else:
+                json_payload = fastjson.loads(text_content)
+        except ValueError as e:
+            return 400, {"error": str(e)}
+
+        logger.debug(f"Webhook received from {ip} with Content-Type: {content_type}")
+
+        # Same connection handling as a regular Django request
+        close_old_connections()
+        try:
+            webhook = run_write(self.store, json_payload, HttpHeaders(environ), ip)
+        except Exception as e:
+            logger.error(f"Error storing webhook: {str(e)}")
+            return 500, {"error": "Failed to store webhook"}
+        finally:
+            close_old_connections()
+
+        return 201, {"id": webhook.id, "received_at": webhook.received_at.isoformat()}
+
+    def store(self, payload, headers, ip):
+        """Persist a webhook"""
+        try:
+            ipaddress.ip_address(ip)
+        except ValueError:
+            ip = None
+        headers, header_set_id = prepare_headers(headers)
+        return Webhook.objects.create(
+            payload=payload,
+            headers=headers,
+            header_set_id=header_set_id,
+            source_ip=ip
+        )
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from broker.archive import archive_webhooks, find_archived_webhook
+from broker.models import WebhookArchive
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Move old webhooks into compressed daily archive files'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'WEBHOOK_RETENTION_DAYS', 30),
+                            help='Archive webhooks older than this many days')
+        parser.add_argument('--compression', choices=['gzip', 'lzma'],
+                            default=getattr(settings, 'WEBHOOK_ARCHIVE_COMPRESSION', 'gzip'),
+                            help='Compression used for new archive files')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows read and deleted per query')
+        parser.add_argument('--lookup', type=int, help='Print an archived webhook by its ID instead of archiving')
+    
+    def handle(self, *args, **options):
+        if options.get('lookup'):
+            self.lookup(options['lookup'])
+            return
+            
+        days = options['days']
+        self.stdout.write(self.style.NOTICE(f"Archiving webhooks older than {days} days"))
+        
+        results = archive_webhooks(
+            days,
+            compression=options['compression'],
+            batch_size=options['batch_size']
+        )
+        
+        if not results:
+            self.stdout.write(self.style.NOTICE("No webhooks to archive"))
+            return
+            
+        for day, count in results.items():
+            archive = WebhookArchive.objects.get(day=day)
+            self.stdout.write(self.style.SUCCESS(f"{day}: archived {count} webhooks to {archive.path}"))
+            
+        self.stdout.write(self.style.SUCCESS(f"Archived {sum(results.values())} webhooks from {len(results)} days"))
+        
+    def lookup(self, webhook_id):
+        """Print a webhook from the archive"""
+        record = find_archived_webhook(webhook_id)
+        if record is None:
+            self.stdout.write(self.style.ERROR(f"Webhook {webhook_id} not found in the archive"))
+            return
+        self.stdout.write(json.dumps(record, indent=2))
@@ -0,0 +1,431 @@
+"""
+Prometheus metrics shared by all processes.
+
+Every process (gunicorn workers, update_orders --daemon) keeps its counters,
+gauges and histograms in memory and a flusher thread writes them every
+METRICS_FLUSH_INTERVAL seconds to a file of its own in METRICS_DIR. /metrics
+adds up the files of all processes and renders them in the Prometheus text
+format, so a scrape sees the whole deployment whichever worker serves it.
+
+Counts of exited processes keep counting: their files are merged into
+exited.json (mark_process_dead()) by gunicorn's child_exit hook and, for
+processes gunicorn doesn't know about (management commands, replay and bulk
+workers, scripts), by the next scrape that finds their pid gone. Gauges only
+describe live processes and are dropped with them.
+"""
+
+import atexit
+import contextlib
+import fcntl
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Seconds between writes of a process's metrics to its file
+METRICS_FLUSH_INTERVAL = 1.0
+
+# File collecting the counts of exited processes
+EXITED_FILE = 'exited.json'
+
+# File locked while a dead process's file is merged into exited.json
+LOCK_FILE = 'exited.lock'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FILL_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600, 4 * 3600, 24 * 3600)
+
+
+def get_metrics_dir():
+    """Directory shared by the processes' metric files, None to keep metrics per process"""
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+
+class Metric:
+    """A named metric, one value per combination of label values"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry if registry is not None else REGISTRY
+        self.registry.register(self)
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes the labels {', '.join(self.labelnames) or 'none'}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def merge(self, totals, key, value):
+        """Add the value of one process to the totals over all processes"""
+        totals[key] = totals.get(key, 0) + value
+
+    def samples(self, key, value):
+        """Lines of the text format for one value"""
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self.registry.add(self, self._key(labels), amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, mode='sum'):
+        """
+        Args:
+            mode (str): How the values of several processes combine, 'sum' or 'max'
+        """
+        super().__init__(name, documentation, labelnames, registry)
+        self.mode = mode
+
+    def set(self, value, **labels):
+        self.registry.set(self, self._key(labels), value)
+
+    def inc(self, amount=1, **labels):
+        self.registry.add(self, self._key(labels), amount)
+
+    def dec(self, amount=1, **labels):
+        self.registry.add(self, self._key(labels), -amount)
+
+    def merge(self, totals, key, value):
+        if self.mode == 'max' and key in totals:
+            totals[key] = max(totals[key], value)
+        else:
+            super().merge(totals, key, value)
+
+
+class Histogram(Metric):
+    """Observations counted per bucket; a value is [count per bucket..., count over the last bucket, sum]"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        self.registry.observe(self, self._key(labels), value)
+
+    @contextlib.contextmanager
+    def timer(self, **labels):
+        """Observe the seconds the block takes"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def empty(self):
+        return [0] * (len(self.buckets) + 2)
+
+    def merge(self, totals, key, value):
+        if len(value) != len(self.buckets) + 2:
+            # Written with other buckets (an older release)
+            return
+        current = totals.setdefault(key, self.empty())
+        for i, part in enumerate(value):
+            current[i] += part
+
+    def samples(self, key, value):
+        lines = []
+        cumulative = 0
+        names = self.labelnames + ('le',)
+        for bound, count in zip(self.buckets + (math.inf,), value):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_format_labels(names, key + (_format_value(bound),))} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(value[-1])}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """This process's metric values, and their totals over all processes"""
+
+    def __init__(self, directory=None, flush_interval=METRICS_FLUSH_INTERVAL):
+        """
+        Args:
+            directory (Path): Directory of the metric files (default: METRICS_DIR)
+            flush_interval (float): Seconds between flushes, 0 to only flush on request
+        """
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.metrics = {}
+        # {metric name: {label values: value}}
+        self.values = {}
+        self.dirty = False
+        self.pid = None
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+
+    def get_directory(self):
+        return self.directory if self.directory is not None else get_metrics_dir()
+
+    def _process_values(self, metric):
+        """Values of metric in this process, starting over after a fork (e.g. in gunicorn workers)"""
+        if self.pid != os.getpid():
+            self.values = {}
+            self.pid = os.getpid()
+            if self.flush_interval:
+                threading.Thread(target=self._run, name='metrics-flusher', daemon=True).start()
+                atexit.register(self.flush)
+        self.dirty = True
+        return self.values.setdefault(metric.name, {})
+
+    def add(self, metric, key, amount):
+        with self._lock:
+            values = self._process_values(metric)
+            values[key] = values.get(key, 0) + amount
+
+    def set(self, metric, key, value):
+        with self._lock:
+            self._process_values(metric)[key] = value
+
+    def observe(self, metric, key, value):
+        with self._lock:
+            values = self._process_values(metric)
+            counts = values.get(key)
+            if counts is None:
+                counts = values[key] = metric.empty()
+            for i, bound in enumerate(metric.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-2] += 1
+            counts[-1] += value
+
+    def _run(self):
+        pid = os.getpid()
+        while self.pid == pid:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error writing metrics: {str(e)}")
+
+    def _snapshot(self):
+        """Copy of this process's values that can be read without the lock"""
+        with self._lock:
+            self.dirty = False
+            return {
+                name: [(key, list(value) if isinstance(value, list) else value) for key, value in values.items()]
+                for name, values in self.values.items()
+            }
+
+    def flush(self):
+        """Write this process's values to its file"""
+        directory = self.get_directory()
+        if directory is None or self.pid != os.getpid():
+            return
+        path = os.path.join(directory, f"{self.pid}.json")
+        if not self.dirty and os.path.exists(path):
+            return
+        _write_file(path, self._snapshot())
+
+    def stop(self):
+        """Write this process's values one last time and stop writing them (e.g. at the end of a test run)"""
+        self.flush()
+        with self._lock:
+            self.pid = None
+            self.values = {}
+            self.dirty = False
+
+    def collect(self):
+        """
+        Values of every metric over all processes
+
+        Returns:
+            dict: {metric name: {label values: value}}
+        """
+        directory = self.get_directory()
+        if directory is None:
+            files = [(os.getpid(), self._snapshot())]
+        else:
+            self.flush()
+            files = _read_files(directory)
+            dead = [pid for pid, _ in files if pid is not None and pid != os.getpid() and not _pid_alive(pid)]
+            if dead:
+                for pid in dead:
+                    self.mark_process_dead(pid)
+                files = _read_files(directory)
+
+        totals = {}
+        for pid, values in files:
+            alive = pid is None or _pid_alive(pid)
+            for name, samples in values.items():
+                metric = self.metrics.get(name)
+                if metric is None or (metric.kind == 'gauge' and not alive):
+                    continue
+                merged = totals.setdefault(name, {})
+                for key, value in samples:
+                    metric.merge(merged, tuple(key), value)
+        return totals
+
+    def render(self):
+        """All metrics in the Prometheus text format"""
+        totals = self.collect()
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key, value in sorted(totals.get(name, {}).items()):
+                lines.extend(metric.samples(key, value))
+        return '\n'.join(lines) + '\n'
+
+    def mark_process_dead(self, pid):
+        """Fold the file of an exited process into exited.json, without its gauges"""
+        directory = self.get_directory()
+        if directory is None:
+            return
+        path = os.path.join(directory, f"{pid}.json")
+        os.makedirs(directory, exist_ok=True)
+        # Scrapes in several workers may find the same dead process, only one of them merges its file
+        with open(os.path.join(directory, LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            dead = dict(_read_files(directory, [f"{pid}.json"])).get(pid)
+            if dead is None:
+                return
+
+            exited_path = os.path.join(directory, EXITED_FILE)
+            exited = dict(_read_files(directory, [EXITED_FILE])).get(None, {})
+            totals = {name: {tuple(key): value for key, value in samples} for name, samples in exited.items()}
+            for name, samples in dead.items():
+                metric = self.metrics.get(name)
+                if metric is None or metric.kind == 'gauge':
+                    continue
+                merged = totals.setdefault(name, {})
+                for key, value in samples:
+                    metric.merge(merged, tuple(key), value)
+            _write_file(exited_path, {name: list(values.items()) for name, values in totals.items()})
+            os.remove(path)
+
+    def clear(self):
+        """Remove the metric files of all processes (when the server starts)"""
+        directory = self.get_directory()
+        if directory is None or not os.path.isdir(directory):
+            return
+        for name in os.listdir(directory):
+            if name.endswith('.json'):
+                os.remove(os.path.join(directory, name))
+
+
+def _write_file(path, values):
+    """Replace a metric file in one step, so readers never see half of it"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump({name: [[list(key), value] for key, value in samples] for name, samples in values.items()}, f)
+    os.replace(temp_path, path)
+
+
+def _read_files(directory, names=None):
+    """
+    Read metric files
+
+    Returns:
+        list: (pid, or None for exited.json, {metric name: [(label values, value)]}) per file
+    """
+    if names is None:
+        try:
+            names = [name for name in os.listdir(directory) if name.endswith('.json')]
+        except FileNotFoundError:
+            return []
+    files = []
+    for name in names:
+        try:
+            with open(os.path.join(directory, name)) as f:
+                values = json.load(f)
+        except (OSError, ValueError):
+            # Gone since it was listed
+            continue
+        pid = None if name == EXITED_FILE else int(name[:-len('.json')])
+        files.append((pid, values))
+    return files
+
+
+class QueryCounter:
+    """Database execute wrapper counting the queries run and their time"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+REGISTRY = MetricsRegistry()
+
+# HTTP (broker.middleware.RequestMetricsMiddleware)
+HTTP_REQUESTS = Counter('http_requests_total', "HTTP requests handled", ('view', 'method', 'status'))
+HTTP_REQUEST_DURATION = Histogram('http_request_duration_seconds', "Seconds spent handling requests", ('view',))
+DB_QUERIES = Counter('db_queries_total', "Database queries run by requests", ('view',))
+DB_QUERY_DURATION = Counter('db_query_seconds_total', "Seconds spent in database queries by requests", ('view',))
+
+# Webhooks (drf: broker.views.WebhookView, lean: broker.lean.LeanWebhookApp)
+WEBHOOKS_RECEIVED = Counter('webhooks_received_total', "Webhooks stored", ('endpoint',))
+WEBHOOKS_REJECTED = Counter('webhooks_rejected_total', "Webhooks refused", ('endpoint', 'reason'))
+WEBHOOK_DURATION = Histogram('webhook_duration_seconds', "Seconds spent handling a webhook", ('endpoint',))
+
+# Orders (ib_gateway.pipeline, ib_gateway.reconcile)
+ORDERS_PLACED = Counter('orders_placed_total', "Orders placed with IB")
+ORDER_STATUS_LATENCY = Histogram('order_status_latency_seconds',
+                                 "Seconds from placing an order to its first orderStatus")
+ORDER_FILL_LATENCY = Histogram('order_fill_latency_seconds', "Seconds from placing an order to its fill",
+                               buckets=FILL_BUCKETS)
+
+# IB API (ib_gateway.connection.IBApi, ib_gateway.daemon)
+IB_MESSAGES = Counter('ib_messages_total', "Messages received from IB")
+IB_CALLBACKS = Counter('ib_callbacks_total', "IB callbacks handled", ('callback',))
+IB_ERRORS = Counter('ib_errors_total', "Errors reported by IB", ('code',))
+IB_READER_BACKLOG = Gauge('ib_reader_backlog', "Messages read from IB and not yet decoded", ('config',))
+IB_PENDING_EVENTS = Gauge('ib_pending_events', "Order events received and not yet written", ('config',))
+
+# gunicorn (gunicorn_config.py)
+GUNICORN_THREADS = Gauge('gunicorn_threads', "Request threads of the live gunicorn workers")
+GUNICORN_BUSY_THREADS = Gauge('gunicorn_busy_threads', "Request threads handling a request")
@@ -0,0 +1,205 @@
+"""
+IP allowlist for the webhook endpoint, and request metrics.
+
+The allowlist is compiled once into sorted integer ranges per IP version, so a
+lookup is a single binary search. The check runs as the first middleware, so
+rejected requests never reach sessions, CSRF, auth or DRF.
+"""
+
+import bisect
+import contextlib
+import ipaddress
+import logging
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+from django.http import JsonResponse
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CIDRSet:
+    """A set of CIDR ranges with binary-searchable lookups and hit counters"""
+
+    def __init__(self, cidrs):
+        """
+        Args:
+            cidrs (list): CIDR strings, e.g. '52.89.214.238/32' or '10.0.0.0/8'
+        """
+        ranges = {4: [], 6: []}
+        for cidr in cidrs:
+            network = ipaddress.ip_network(cidr, strict=False)
+            ranges[network.version].append(
+                (int(network.network_address), int(network.broadcast_address), str(network))
+            )
+
+        # Overlapping ranges are merged so the ranges of each version are disjoint
+        self._starts = {}
+        self._ends = {}
+        self._labels = {}
+        for version, version_ranges in ranges.items():
+            merged = []
+            for start, end, label in sorted(version_ranges):
+                if merged and start <= merged[-1][1] + 1:
+                    last_start, last_end, last_label = merged[-1]
+                    merged[-1] = (last_start, max(last_end, end), f"{last_label},{label}")
+                else:
+                    merged.append((start, end, label))
+            self._starts[version] = [start for start, _, _ in merged]
+            self._ends[version] = [end for _, end, _ in merged]
+            self._labels[version] = [label for _, _, label in merged]
+
+        self._hits = {version: [0] * len(self._starts[version]) for version in (4, 6)}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._starts[4]) + len(self._starts[6])
+
+    def find(self, ip):
+        """
+        Find the range containing an IP address
+
+        Returns:
+            tuple: (version, index) of the matching range or None
+        """
+        try:
+            address = ipaddress.ip_address(ip)
+        except (TypeError, ValueError):
+            return None
+
+        version = address.version
+        if version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+            version = 4
+
+        value = int(address)
+        index = bisect.bisect_right(self._starts[version], value) - 1
+        if index >= 0 and value <= self._ends[version][index]:
+            return version, index
+        return None
+
+    def __contains__(self, ip):
+        return self.find(ip) is not None
+
+    def match(self, ip):
+        """Check an IP address and count the hit against its range"""
+        found = self.find(ip)
+        if found is None:
+            return False
+        version, index = found
+        with self._lock:
+            self._hits[version][index] += 1
+        return True
+
+    def hit_counts(self):
+        """Return the number of matches per range"""
+        with self._lock:
+            return {
+                label: hits
+                for version in (4, 6)
+                for label, hits in zip(self._labels[version], self._hits[version])
+            }
+
+
+@lru_cache(maxsize=None)
+def get_trusted_proxies():
+    """Return the proxies (e.g. our nginx) whose X-Forwarded-For entries are trusted"""
+    return CIDRSet(getattr(settings, 'TRUSTED_PROXIES', ['127.0.0.1/32', '::1/128']))
+
+
+@lru_cache(maxsize=None)
+def get_webhook_allowlist():
+    """Return the compiled webhook IP allowlist"""
+    return CIDRSet(getattr(settings, 'WEBHOOK_IP_ALLOWLIST', []))
+
+
+@lru_cache(maxsize=None)
+def get_metrics_allowlist():
+    """Return the compiled allowlist of the /metrics endpoint"""
+    return CIDRSet(getattr(settings, 'METRICS_ALLOWLIST', ['127.0.0.1/32', '::1/128']))
+
+
+@receiver(setting_changed)
+def reset_ip_ranges(*, setting, **kwargs):
+    """Recompile the ranges when the settings are overridden (e.g. in tests)"""
+    if setting in ('WEBHOOK_IP_ALLOWLIST', 'TRUSTED_PROXIES', 'METRICS_ALLOWLIST'):
+        get_trusted_proxies.cache_clear()
+        get_webhook_allowlist.cache_clear()
+        get_metrics_allowlist.cache_clear()
+
+
+def get_client_ip(meta):
+    """
+    Get the client's IP address from the request META
+
+    X-Forwarded-For is only honoured when the request comes from a trusted
+    proxy. Entries are read right to left, skipping our own proxies, because
+    only the entries appended by them can be trusted.
+    """
+    remote_addr = meta.get('REMOTE_ADDR')
+    x_forwarded_for = meta.get('HTTP_X_FORWARDED_FOR')
+    trusted_proxies = get_trusted_proxies()
+    if not x_forwarded_for or remote_addr not in trusted_proxies:
+        return remote_addr
+
+    forwarded = [entry.strip() for entry in x_forwarded_for.split(',') if entry.strip()]
+    for entry in reversed(forwarded):
+        if entry not in trusted_proxies:
+            return entry
+    return forwarded[0] if forwarded else remote_addr
+
+
+class WebhookIPAllowlistMiddleware:
+    """Reject webhook requests from IP addresses outside WEBHOOK_IP_ALLOWLIST"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'WEBHOOK_IP_ALLOWLIST_ENABLED', False):
+            raise MiddlewareNotUsed("Webhook IP allowlist is disabled")
+        self.get_response = get_response
+        self.paths = tuple(getattr(settings, 'WEBHOOK_IP_ALLOWLIST_PATHS', ['/api/webhook/']))
+        self.allowlist = get_webhook_allowlist()
+
+    def __call__(self, request):
+        if request.path_info.startswith(self.paths):
+            ip = get_client_ip(request.META)
+            if not self.allowlist.match(ip):
+                logger.warning(f"Rejected webhook from unauthorized IP {ip}")
+                metrics.WEBHOOKS_REJECTED.inc(endpoint='drf', reason='ip')
+                return JsonResponse(
+                    {"error": "Unauthorized IP address", "received_ip": ip},
+                    status=403
+                )
+        return self.get_response(request)
+
+
+class RequestMetricsMiddleware:
+    """Count requests, their duration and their database queries per view"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = metrics.QueryCounter()
+        start = time.perf_counter()
+        with contextlib.ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        metrics.HTTP_REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+        metrics.HTTP_REQUEST_DURATION.observe(duration, view=view)
+        if queries.count:
+            metrics.DB_QUERIES.inc(queries.count, view=view)
+            metrics.DB_QUERY_DURATION.inc(queries.duration, view=view)
+        return response
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.2 on 2026-10-19 00:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('broker', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HeaderSet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(help_text='SHA-256 of the canonical header JSON', max_length=64, unique=True)),
+                ('headers', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='webhook',
+            name='headers',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='webhook',
+            name='header_set',
+            field=models.ForeignKey(blank=True, help_text='Shared headers when stored in compact mode', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='webhooks', to='broker.headerset'),
+        ),
+    ]
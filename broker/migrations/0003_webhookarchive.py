@@ -0,0 +1,30 @@
+# Generated by Django 5.0.2 on 2026-10-19 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('broker', '0002_headerset'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(help_text='Day (UTC) the archived webhooks were received', unique=True)),
+                ('path', models.CharField(help_text='Archive file, relative to WEBHOOK_ARCHIVE_DIR', max_length=255)),
+                ('compression', models.CharField(choices=[('gzip', 'gzip'), ('lzma', 'lzma')], default='gzip', max_length=10)),
+                ('webhook_count', models.PositiveIntegerField(default=0, help_text='Number of webhooks in the archive')),
+                ('first_id', models.BigIntegerField(blank=True, help_text='Lowest archived webhook ID', null=True)),
+                ('last_id', models.BigIntegerField(blank=True, help_text='Highest archived webhook ID', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-day'],
+            },
+        ),
+    ]
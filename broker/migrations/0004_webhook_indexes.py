@@ -0,0 +1,21 @@
+# Generated by Django 5.0.2 on 2026-10-19 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('broker', '0003_webhookarchive'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='webhook',
+            index=models.Index(fields=['received_at'], name='webhook_received_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='webhook',
+            index=models.Index(fields=['source_ip', 'received_at'], name='webhook_source_received_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-19 01:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('broker', '0004_webhook_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhook',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, help_text="When the order pipeline consumed this webhook's signal (placed, or netted out by coalescing)", null=True),
+        ),
+    ]
@@ -2,11 +2,61 @@ from django.db import models
 
 # Create your models here.
 
+class HeaderSet(models.Model):
+    """Set of request headers shared by every webhook that sent it"""
+    digest = models.CharField(max_length=64, unique=True, help_text="SHA-256 of the canonical header JSON")
+    headers = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Header set {self.digest[:12]}"
+
+
 class Webhook(models.Model):
     payload = models.JSONField()
-    headers = models.JSONField()
+    headers = models.JSONField(default=dict, blank=True)
+    header_set = models.ForeignKey(HeaderSet, on_delete=models.PROTECT, null=True, blank=True, related_name='webhooks', help_text="Shared headers when stored in compact mode")
     received_at = models.DateTimeField(auto_now_add=True)
     source_ip = models.GenericIPAddressField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True, help_text="When the order pipeline consumed this webhook's signal (placed, or netted out by coalescing)")
+    
+    class Meta:
+        indexes = [
+            # Admin date filter and retention cutoff
+            models.Index(fields=['received_at'], name='webhook_received_idx'),
+            # Admin source IP filter/search
+            models.Index(fields=['source_ip', 'received_at'], name='webhook_source_received_idx'),
+        ]
     
     def __str__(self):
         return f"Webhook received at {self.received_at}"
+    
+    def get_headers(self):
+        """Return the stored headers regardless of the storage mode"""
+        if self.header_set_id:
+            # Per-request headers stay on the webhook row
+            return {**self.header_set.headers, **self.headers}
+        return self.headers
+
+
+class WebhookArchive(models.Model):
+    """Index entry for one day of webhooks moved to a compressed archive file"""
+    COMPRESSIONS = [
+        ('gzip', 'gzip'),
+        ('lzma', 'lzma'),
+    ]
+    
+    day = models.DateField(unique=True, help_text="Day (UTC) the archived webhooks were received")
+    path = models.CharField(max_length=255, help_text="Archive file, relative to WEBHOOK_ARCHIVE_DIR")
+    compression = models.CharField(max_length=10, choices=COMPRESSIONS, default='gzip')
+    webhook_count = models.PositiveIntegerField(default=0, help_text="Number of webhooks in the archive")
+    first_id = models.BigIntegerField(null=True, blank=True, help_text="Lowest archived webhook ID")
+    last_id = models.BigIntegerField(null=True, blank=True, help_text="Highest archived webhook ID")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-day']
+    
+    def __str__(self):
+        return f"Webhook archive for {self.day} ({self.webhook_count} webhooks)"
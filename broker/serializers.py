@@ -4,5 +4,11 @@ from .models import Webhook
 class WebhookSerializer(serializers.ModelSerializer):
     class Meta:
         model = Webhook
-        fields = ['id', 'payload', 'headers', 'received_at', 'source_ip']
-        read_only_fields = ['received_at'] 
\ No newline at end of file
+        fields = ['id', 'payload', 'headers', 'header_set', 'received_at', 'source_ip']
+        read_only_fields = ['received_at', 'header_set']
+        
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Compact webhooks keep their headers in the shared header set
+        data['headers'] = instance.get_headers()
+        return data
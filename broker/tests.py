@@ -1,3 +1,306 @@
-from django.test import TestCase
+import datetime
+import decimal
+import io
+import json
+import os
+import pathlib
+import tempfile
+import threading
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import TestCase, SimpleTestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from . import fastjson, metrics
+from . import headers as header_storage
+from .db import run_write
+from .lean import LeanWebhookApp
+from .middleware import CIDRSet, get_client_ip
+from .models import HeaderSet, Webhook
 
-# Create your tests here.
+
+class QueryPlanMixin:
+    """Assertions on the database query plan of a queryset"""
+    
+    def setUp(self):
+        super().setUp()
+        if connection.vendor == 'postgresql':
+            # Tiny test tables would otherwise always be sequentially scanned
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+    
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, f"Expected {index_name} in query plan:\n{plan}")
+
+
+class WebhookIndexTests(QueryPlanMixin, TestCase):
+    """The admin changelist and retention queries must stay index scans"""
+    
+    def test_received_at_filter_uses_index(self):
+        queryset = Webhook.objects.filter(received_at__gte=timezone.now()).order_by('-received_at', '-pk')
+        self.assertUsesIndex(queryset, 'webhook_received_idx')
+        
+    def test_retention_cutoff_uses_index(self):
+        queryset = Webhook.objects.filter(received_at__lt=timezone.now())
+        self.assertUsesIndex(queryset, 'webhook_received_idx')
+        
+    def test_changelist_ordering_uses_index(self):
+        queryset = Webhook.objects.order_by('-received_at', '-pk')[:100]
+        self.assertUsesIndex(queryset, 'webhook_received_idx')
+        
+    def test_source_ip_filter_uses_index(self):
+        queryset = Webhook.objects.filter(source_ip='52.89.214.238').order_by('-received_at', '-pk')
+        self.assertUsesIndex(queryset, 'webhook_source_received_idx')
+
+
+@override_settings(WEBHOOK_HEADER_STORAGE='compact')
+class HeaderStorageTests(TestCase):
+    def setUp(self):
+        header_storage._header_set_ids.clear()
+
+    def test_client_addresses_share_header_set(self):
+        stored = [
+            header_storage.prepare_headers({'User-Agent': 'Go-http-client/1.1', 'X-Forwarded-For': ip, 'Cookie': 'x'})
+            for ip in ('52.89.214.238', '34.212.75.30')
+        ]
+
+        self.assertEqual(HeaderSet.objects.count(), 1)
+        self.assertEqual(stored[0][1], stored[1][1])
+        self.assertEqual(stored[1][0], {'X-Forwarded-For': '34.212.75.30'})
+        webhook = Webhook.objects.create(payload={}, headers=stored[1][0], header_set_id=stored[1][1])
+        self.assertEqual(webhook.get_headers(), {'User-Agent': 'Go-http-client/1.1', 'X-Forwarded-For': '34.212.75.30'})
+
+    def test_header_set_cache_evicts_least_recently_used(self):
+        with mock.patch.object(header_storage, 'HEADER_SET_CACHE_SIZE', 2):
+            first = header_storage.header_digest({'User-Agent': 'a'})
+            for agent in ('a', 'b', 'a', 'c'):
+                header_storage.get_header_set_id({'User-Agent': agent})
+
+        self.assertEqual(list(header_storage._header_set_ids), [first, header_storage.header_digest({'User-Agent': 'c'})])
+
+
+class CIDRSetTests(SimpleTestCase):
+    def test_match_and_hit_counts(self):
+        ranges = CIDRSet(['52.89.214.238/32', '10.0.0.0/8', '2001:db8::/32'])
+        self.assertTrue(ranges.match('52.89.214.238'))
+        self.assertTrue(ranges.match('10.255.0.1'))
+        self.assertTrue(ranges.match('2001:db8::1'))
+        self.assertTrue(ranges.match('::ffff:10.1.2.3'))
+        self.assertFalse(ranges.match('52.89.214.239'))
+        self.assertFalse(ranges.match('11.0.0.0'))
+        self.assertFalse(ranges.match('not-an-ip'))
+        self.assertEqual(ranges.hit_counts(), {
+            '10.0.0.0/8': 2,
+            '52.89.214.238/32': 1,
+            '2001:db8::/32': 1,
+        })
+        
+    def test_overlapping_ranges_are_merged(self):
+        ranges = CIDRSet(['10.0.0.0/8', '10.1.0.0/16'])
+        self.assertEqual(len(ranges), 1)
+        self.assertIn('10.1.2.3', ranges)
+
+
+class ClientIPTests(SimpleTestCase):
+    def test_forwarded_for_ignored_from_untrusted_peer(self):
+        meta = {'REMOTE_ADDR': '198.51.100.7', 'HTTP_X_FORWARDED_FOR': '52.89.214.238'}
+        self.assertEqual(get_client_ip(meta), '198.51.100.7')
+        
+    def test_rightmost_untrusted_entry_behind_proxy(self):
+        # A client can put anything in the header; only the entry nginx appended is reliable
+        meta = {'REMOTE_ADDR': '127.0.0.1', 'HTTP_X_FORWARDED_FOR': '52.89.214.238, 198.51.100.7'}
+        self.assertEqual(get_client_ip(meta), '198.51.100.7')
+
+
+@override_settings(WEBHOOK_IP_ALLOWLIST_ENABLED=True, WEBHOOK_IP_ALLOWLIST=['52.89.214.238/32'])
+class WebhookIPAllowlistMiddlewareTests(TestCase):
+    def test_rejects_unlisted_ip(self):
+        response = self.client.post('/api/webhook/', 'price is 2000', content_type='text/plain',
+                                    REMOTE_ADDR='198.51.100.7', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()['received_ip'], '198.51.100.7')
+        self.assertFalse(Webhook.objects.exists())
+        
+    def test_accepts_listed_ip_behind_proxy(self):
+        response = self.client.post('/api/webhook/', 'price is 2000', content_type='text/plain',
+                                    REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR='52.89.214.238',
+                                    HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Webhook.objects.get().source_ip, '52.89.214.238')
+
+
+class LeanWebhookAppTests(TestCase):
+    def call(self, body, content_type='application/json', method='POST', path='/api/webhook/'):
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'REMOTE_ADDR': '52.89.214.238',
+            'CONTENT_TYPE': content_type,
+            'CONTENT_LENGTH': str(len(body)),
+            'HTTP_USER_AGENT': 'Go-http-client/1.1',
+            'wsgi.input': io.BytesIO(body),
+        }
+        statuses = []
+        app = LeanWebhookApp(lambda environ, start_response: [b'django'], max_body_size=1024)
+        response = b''.join(app(environ, lambda status, headers: statuses.append(status)))
+        return statuses[0] if statuses else None, response
+        
+    def test_stores_json_webhook(self):
+        status, response = self.call(b'{"text": "BTCUSD Greater Than 9000"}')
+        self.assertEqual(status, '201 Created')
+        webhook = Webhook.objects.get(id=json.loads(response)['id'])
+        self.assertEqual(webhook.payload, {"text": "BTCUSD Greater Than 9000"})
+        self.assertEqual(webhook.source_ip, '52.89.214.238')
+        self.assertEqual(webhook.get_headers()['User-Agent'], 'Go-http-client/1.1')
+        
+    def test_wraps_plain_text(self):
+        status, response = self.call(b'price is 2000', content_type='text/plain; charset=utf-8')
+        self.assertEqual(status, '201 Created')
+        self.assertEqual(Webhook.objects.get().payload, {"text": "price is 2000"})
+        
+    def test_rejects_invalid_requests(self):
+        self.assertEqual(self.call(b'{}', content_type='application/xml')[0], '415 Unsupported Media Type')
+        self.assertEqual(self.call(b'x' * 2048, content_type='text/plain')[0], '413 Payload Too Large')
+        self.assertEqual(self.call(b'{not json')[0], '400 Bad Request')
+        self.assertEqual(self.call(b'', method='GET')[0], '405 Method Not Allowed')
+        self.assertFalse(Webhook.objects.exists())
+        
+    def test_delegates_other_paths(self):
+        self.assertEqual(self.call(b'', method='GET', path='/admin/'), (None, b'django'))
+
+
+class FastJSONTests(SimpleTestCase):
+    data = {
+        'quantity': decimal.Decimal('10.50000'),
+        'created_at': datetime.datetime(2025, 5, 12, 14, 38, 0, 123456, tzinfo=datetime.timezone.utc),
+        'day': datetime.date(2025, 5, 12),
+        'local': datetime.datetime(2025, 5, 12, 16, 38, 0, 5, tzinfo=datetime.timezone(datetime.timedelta(hours=2))),
+        'at': datetime.time(14, 38, 0, 123456),
+        'text': 'BTCUSD \u2028 9000',
+        'avg_fill_price': None,
+    }
+    
+    def test_matches_drf_renderer(self):
+        expected = json.loads(JSONRenderer().render(self.data))
+        for backend in (fastjson.orjson, None):
+            with mock.patch.object(fastjson, 'orjson', backend):
+                content = fastjson.FastJSONRenderer().render(self.data)
+                self.assertEqual(json.loads(content), expected)
+                # Timestamps to the same precision as DRF's
+                for key in ('created_at', 'local', 'at'):
+                    self.assertIn(JSONRenderer().render(self.data[key]), content)
+                self.assertIn(b'\\u2028', content)
+                
+    def test_parser_rejects_invalid_json(self):
+        from rest_framework.exceptions import ParseError
+        for backend in (fastjson.orjson, None):
+            with mock.patch.object(fastjson, 'orjson', backend):
+                self.assertEqual(fastjson.FastJSONParser().parse(io.BytesIO(b'{"a": [1, 2.5]}')), {'a': [1, 2.5]})
+                with self.assertRaises(ParseError):
+                    fastjson.FastJSONParser().parse(io.BytesIO(b'{"a": NaN}'))
+
+
+@skipUnless(connection.vendor == 'sqlite', "The write queue is only used with SQLite")
+@override_settings(SQLITE_WRITE_QUEUE=True)
+class WriteQueueTests(TransactionTestCase):
+    """Tests for the per-process writer thread"""
+
+    def test_writes_run_on_writer_thread(self):
+        def store(text):
+            return Webhook.objects.create(payload={'text': text}, headers={}), threading.current_thread().name
+
+        results = [run_write(store, str(i)) for i in range(3)]
+
+        self.assertEqual({thread for _, thread in results}, {'db-writer'})
+        self.assertEqual(Webhook.objects.count(), 3)
+
+    def test_failed_write_doesnt_affect_batch(self):
+        def fail():
+            Webhook.objects.create(payload={'text': 'rolled back'}, headers={})
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            run_write(fail)
+        run_write(Webhook.objects.create, payload={'text': 'kept'}, headers={})
+        self.assertEqual(list(Webhook.objects.values_list('payload', flat=True)), [{'text': 'kept'}])
+
+    def test_atomic_block_writes_inline(self):
+        with transaction.atomic():
+            _, thread = run_write(lambda: (None, threading.current_thread().name))
+        self.assertEqual(thread, threading.current_thread().name)
+
+
+class MetricsTests(TestCase):
+    """Tests for the metrics shared by all processes"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.registry = metrics.MetricsRegistry(directory=self.directory, flush_interval=0)
+        self.requests = metrics.Counter('requests_total', "Requests", ('view',), registry=self.registry)
+        self.busy = metrics.Gauge('busy', "Busy threads", registry=self.registry)
+        self.latency = metrics.Histogram('latency_seconds', "Latency", buckets=(0.1, 1), registry=self.registry)
+
+    def test_test_run_leaves_the_deployments_metrics_alone(self):
+        self.assertFalse(pathlib.Path(settings.METRICS_DIR).is_relative_to(settings.BASE_DIR))
+
+    def test_renders_text_format(self):
+        self.requests.inc(view='orders')
+        self.requests.inc(2, view='orders')
+        self.latency.observe(0.05)
+        self.latency.observe(5)
+
+        text = self.registry.render()
+
+        self.assertIn('# TYPE requests_total counter\nrequests_total{view="orders"} 3.0\n', text)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1\n', text)
+        self.assertIn('latency_seconds_bucket{le="1.0"} 1\n', text)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 2\n', text)
+        self.assertIn('latency_seconds_sum 5.05\nlatency_seconds_count 2\n', text)
+        with self.assertRaises(ValueError):
+            self.requests.inc()
+
+    def test_adds_up_forked_processes(self):
+        self.requests.inc(view='orders')
+        self.busy.set(1)
+        pid = os.fork()
+        if pid == 0:
+            try:
+                # A worker starts from zero, not from the values of its parent
+                self.requests.inc(2, view='orders')
+                self.latency.observe(0.5)
+                self.busy.set(4)
+                self.registry.flush()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+
+        totals = self.registry.collect()
+
+        self.assertEqual(totals['requests_total'], {('orders',): 3})
+        self.assertEqual(totals['latency_seconds'], {(): [0, 1, 0, 0.5]})
+        # Gauges of exited processes are dropped, their counts kept
+        self.assertEqual(totals['busy'], {(): 1})
+
+        # The scrape merged the file of the exited process into exited.json
+        self.assertFalse(os.path.exists(os.path.join(self.directory, f"{pid}.json")))
+        exited = dict(metrics._read_files(self.directory, [metrics.EXITED_FILE]))[None]
+        self.assertEqual(exited['requests_total'], [[['orders'], 2]])
+        self.assertNotIn('busy', exited)
+        self.registry.mark_process_dead(pid)
+        self.assertEqual(self.registry.collect()['requests_total'], {('orders',): 3})
+
+    def test_metrics_endpoint(self):
+        with override_settings(METRICS_DIR=self.directory):
+            self.client.post('/api/webhook/', {'text': 'BTCUSD'}, content_type='application/json')
+            response = self.client.get('/metrics')
+            forbidden = self.client.get('/metrics', REMOTE_ADDR='10.0.0.1')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('webhooks_received_total{endpoint="drf"}', text)
+        self.assertIn('http_requests_total{view="webhook",method="POST",status="201"}', text)
+        self.assertIn('db_queries_total{view="webhook"}', text)
+        self.assertEqual(forbidden.status_code, 403)
@@ -4,4 +4,5 @@ from . import views
 urlpatterns = [
     path('', views.home, name='home'),
     path('api/webhook/', views.WebhookView.as_view(), name='webhook'),
+    path('metrics', views.metrics_view, name='metrics'),
 ] 
\ No newline at end of file
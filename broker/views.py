@@ -5,45 +5,42 @@ from rest_framework.response import Response
 from rest_framework import status
 from .models import Webhook
 from .serializers import WebhookSerializer
+from . import metrics
+from .db import run_write
+from .headers import prepare_headers
+from .middleware import get_client_ip, get_metrics_allowlist
 import time
 import logging
 
 logger = logging.getLogger(__name__)
 
-# TradingView webhook IPs (disabled for testing)
-# TRADINGVIEW_IPS = {
-#     '52.89.214.238',
-#     '34.212.75.30',
-#     '54.218.53.128',
-#     '52.32.178.7',
-#     '127.0.0.1',
-#     'localhost',
-#     '172.31.31.33',  # Your EC2 instance private IP
-#     '16.170.148.120'  # Your EC2 instance public IP
-# }
-
 # Create your views here.
 
 def home(request):
     return HttpResponse("Welcome to Inter-Broker Communication System!")
 
+def metrics_view(request):
+    """Metrics of all processes in the Prometheus text format"""
+    if not get_metrics_allowlist().match(get_client_ip(request.META)):
+        return HttpResponse("Forbidden", status=403, content_type='text/plain')
+    return HttpResponse(metrics.REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 class WebhookView(APIView):
     def post(self, request, *args, **kwargs):
-        start_time = time.time()
-        
-        # Get the client's IP address
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
+        with metrics.WEBHOOK_DURATION.timer(endpoint='drf'):
+            response = self.store(request)
+        if response.status_code == status.HTTP_201_CREATED:
+            metrics.WEBHOOKS_RECEIVED.inc(endpoint='drf')
         else:
-            ip = request.META.get('REMOTE_ADDR')
+            metrics.WEBHOOKS_REJECTED.inc(endpoint='drf', reason='invalid')
+        return response
 
-        # IP check disabled for testing
-        # if ip not in TRADINGVIEW_IPS:
-        #     return Response(
-        #         {"error": "Unauthorized IP address", "received_ip": ip},
-        #         status=status.HTTP_403_FORBIDDEN
-        #     )
+    def store(self, request):
+        start_time = time.time()
+        
+        # Get the client's IP address (the allowlist itself is enforced
+        # by WebhookIPAllowlistMiddleware before the request gets here)
+        ip = get_client_ip(request.META)
 
         # Log the content type and body for debugging
         logger.warning(f"Webhook received from {ip} with Content-Type: {request.content_type}")
@@ -63,15 +60,16 @@ class WebhookView(APIView):
             return Response({"error": str(e)}, status=400)
 
         # Create webhook data
+        headers, header_set_id = run_write(prepare_headers, request.headers)
         webhook_data = {
             'payload': json_payload,
-            'headers': dict(request.headers),
+            'headers': headers,
             'source_ip': ip
         }
 
         serializer = WebhookSerializer(data=webhook_data)
         if serializer.is_valid():
-            serializer.save()
+            run_write(serializer.save, header_set_id=header_set_id)
             
             # Check if we're approaching the 3-second timeout
             if time.time() - start_time > 2.5:  # Leave 0.5s buffer
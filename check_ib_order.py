@@ -10,7 +10,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inter_broker.settings')
 django.setup()
 
-from ib_gateway.models import IBConfig, Order
+from ib_gateway.configs import default_config
+from ib_gateway.models import Order
 from ib_gateway.connection import IBConnection
 
 # Set up logging
@@ -22,7 +23,7 @@ def check_order(order_id="63415"):
     """Check a specific order by ID"""
     
     # Get the active configuration
-    config = IBConfig.objects.filter(is_active=True).first()
+    config = default_config()
     if not config:
         logger.error("No active IB Gateway configuration found")
         return
@@ -38,7 +39,7 @@ def check_order(order_id="63415"):
     try:
         # Try to get the order from the database
         try:
-            db_order = Order.objects.get(order_id=order_id)
+            db_order = Order.objects.filter(config=config).with_order_id(order_id).get()
             logger.info(f"Found order in database: {db_order.order_id} - {db_order.symbol} {db_order.action} {db_order.quantity}")
             logger.info(f"Order status in DB: {db_order.status}")
         except Order.DoesNotExist:
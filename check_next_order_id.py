@@ -10,7 +10,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inter_broker.settings')
 django.setup()
 
-from ib_gateway.models import IBConfig, Order
+from ib_gateway.configs import default_config
+from ib_gateway.models import Order
 from ib_gateway.connection import IBConnection
 
 # Set up logging
@@ -22,7 +23,7 @@ def check_next_order_id():
     """Check the next valid order ID from IB Gateway"""
     
     # Get the active configuration
-    config = IBConfig.objects.filter(is_active=True).first()
+    config = default_config()
     if not config:
         logger.error("No active IB Gateway configuration found")
         return
@@ -39,37 +40,40 @@ def check_next_order_id():
         # Check the next valid order ID
         logger.info(f"Next valid order ID from IB Gateway: {ib.api.next_order_id}")
         
-        # Get all orders from the database
-        db_orders = Order.objects.filter(order_id__isnull=False).order_by('-created_at')
+        # Get the gateway's orders from the database (order IDs are only unique per gateway)
+        gateway_orders = Order.objects.filter(config=config)
+        db_orders = gateway_orders.filter(order_id__isnull=False).order_by('-created_at')
         logger.info(f"Found {db_orders.count()} orders with IDs in the database:")
         
         # Show the most recent orders
         for order in db_orders[:10]:
-            try:
-                order_id_int = int(order.order_id)
-                logger.info(f"Order ID: {order.order_id} (int: {order_id_int}) - {order.symbol} {order.action} {order.quantity} - Status: {order.status}")
-            except (ValueError, TypeError):
+            if order.order_number is not None:
+                logger.info(f"Order ID: {order.order_id} (int: {order.order_number}) - {order.symbol} {order.action} {order.quantity} - Status: {order.status}")
+            else:
                 logger.info(f"Order ID: {order.order_id} (not an integer) - {order.symbol} {order.action} {order.quantity} - Status: {order.status}")
         
+        max_order_id = gateway_orders.max_order_id()
+        logger.info(f"Highest order ID in the database: {max_order_id}")
+        
         # Check if any order IDs are close to the next valid order ID
         if ib.api.next_order_id:
-            high_order_ids = []
-            for order in db_orders:
-                try:
-                    order_id_int = int(order.order_id)
-                    if order_id_int > ib.api.next_order_id - 1000 and order_id_int < ib.api.next_order_id:
-                        high_order_ids.append((order_id_int, order))
-                except (ValueError, TypeError):
-                    pass
-                    
-            if high_order_ids:
-                high_order_ids.sort(reverse=True)
-                logger.info(f"Found {len(high_order_ids)} order IDs close to the next valid order ID:")
-                for order_id_int, order in high_order_ids[:5]:
-                    logger.info(f"  Order ID: {order_id_int} - {order.symbol} {order.action} {order.quantity}")
+            next_order_id = ib.api.next_order_id
+            high_orders = gateway_orders.order_id_range(next_order_id - 999, next_order_id).order_by('-order_number')
+            high_count = high_orders.count()
+            if high_count:
+                logger.info(f"Found {high_count} order IDs close to the next valid order ID:")
+                for order in high_orders[:5]:
+                    logger.info(f"  Order ID: {order.order_number} - {order.symbol} {order.action} {order.quantity}")
+                
+                gaps = gateway_orders.order_id_gaps(next_order_id - 999, next_order_id)
+                if gaps:
+                    logger.info(f"Unused order ID ranges among them: {', '.join(f'{first}-{last}' for first, last in gaps[:10])}")
+            
+            if max_order_id is not None and max_order_id >= next_order_id:
+                logger.warning(f"Order ID {max_order_id} in the database is not below the next valid order ID")
             
             # Suggest an order ID to use
-            suggested_id = ib.api.next_order_id
+            suggested_id = next_order_id
             logger.info(f"Suggested order ID to use: {suggested_id}")
             
     except Exception as e:
@@ -41,6 +41,15 @@ ExecStart=/home/ubuntu/mhd_interactive/venv/bin/gunicorn -c gunicorn_config.py i
 WantedBy=multi-user.target
 EOF
 
+# Install the daily webhook archival timer
+sudo cp inter_broker_archive.service inter_broker_archive.timer /etc/systemd/system/
+
+# Install the order status sync daemon
+sudo cp inter_broker_sync.service /etc/systemd/system/
+sudo systemctl daemon-reload
+
 # Start and enable service
 sudo systemctl start inter_broker
-sudo systemctl enable inter_broker 
\ No newline at end of file
+sudo systemctl enable inter_broker
+sudo systemctl enable --now inter_broker_archive.timer
+sudo systemctl enable --now inter_broker_sync 
\ No newline at end of file
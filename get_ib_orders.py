@@ -10,7 +10,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inter_broker.settings')
 django.setup()
 
-from ib_gateway.models import IBConfig, Order
+from ib_gateway.configs import default_config
+from ib_gateway.models import Order
 from ib_gateway.connection import IBConnection
 
 # Set up logging
@@ -22,7 +23,7 @@ def get_orders_from_ib_directly():
     """Query orders directly from IB Gateway"""
     
     # Get the active configuration
-    config = IBConfig.objects.filter(is_active=True).first()
+    config = default_config()
     if not config:
         logger.error("No active IB Gateway configuration found")
         return
@@ -168,7 +169,7 @@ def get_orders_from_ib_directly():
             
         # Compare with orders in the database
         logger.info("\nComparing with orders in the database...")
-        db_orders = Order.objects.all().order_by('-created_at')
+        db_orders = Order.objects.filter(config=config).order_by('-created_at')
         
         for db_order in db_orders:
             if not db_order.order_id:
@@ -10,7 +10,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inter_broker.settings')
 django.setup()
 
-from ib_gateway.models import IBConfig, Order
+from ib_gateway.configs import default_config
+from ib_gateway.models import Order
 from ib_gateway.connection import IBConnection
 
 # Set up logging
@@ -20,7 +21,7 @@ logger = logging.getLogger(__name__)
 
 def get_orders_from_ib():
     # Get the active configuration
-    config = IBConfig.objects.filter(is_active=True).first()
+    config = default_config()
     if not config:
         logger.error("No active IB Gateway configuration found")
         return
@@ -35,7 +36,7 @@ def get_orders_from_ib():
     
     try:
         # Fetch orders from the database first
-        db_orders = Order.objects.all().order_by('-created_at')
+        db_orders = Order.objects.filter(config=config).order_by('-created_at')
         logger.info(f"Found {db_orders.count()} orders in the database:")
         
         for order in db_orders:
@@ -1,9 +1,52 @@
 import multiprocessing
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inter_broker.settings')
 
 bind = "0.0.0.0:8000"
 workers = multiprocessing.cpu_count() * 2 + 1
+# Threads per worker, so long-polls of /api/ib/stream/ waiting for order events don't hold whole workers
+worker_class = "gthread"
+threads = 50
 timeout = 120
 keepalive = 5
 errorlog = "gunicorn_error.log"
 accesslog = "gunicorn_access.log"
-loglevel = "info" 
\ No newline at end of file
+loglevel = "info"
+
+
+# Metrics hooks (broker.metrics): every worker writes its own metrics file,
+# /metrics adds them up
+
+
+def on_starting(server):
+    """Start counting afresh, files of a previous run belong to dead processes"""
+    from broker.metrics import REGISTRY
+    REGISTRY.clear()
+
+
+def post_worker_init(worker):
+    from broker import metrics
+    metrics.GUNICORN_THREADS.set(worker.cfg.threads)
+
+
+def pre_request(worker, req):
+    from broker import metrics
+    metrics.GUNICORN_BUSY_THREADS.inc()
+
+
+def post_request(worker, req, environ, resp):
+    from broker import metrics
+    metrics.GUNICORN_BUSY_THREADS.dec()
+
+
+def worker_exit(server, worker):
+    """Write the last counts of a worker that is shutting down"""
+    from broker.metrics import REGISTRY
+    REGISTRY.flush()
+
+
+def child_exit(server, worker):
+    """Keep the counts of an exited worker, drop its gauges"""
+    from broker.metrics import REGISTRY
+    REGISTRY.mark_process_dead(worker.pid)
@@ -3,11 +3,14 @@ from django import forms
 from django.shortcuts import redirect
 from django.urls import path
 from django.utils.html import format_html
-from .models import IBConfig, Order
+from .models import IBConfig, Order, OrderEvent, PositionAggregate
+from .bulk import CONFLICT, FAILED, NOT_FOUND, OUTCOMES, SKIPPED, UNCHANGED, UPDATED, run_bulk_action
+from .configs import config_for_account, config_for_order, default_config
 from .connection import IBConnection
-from .views import map_ib_status
+from .live import (EXECUTION_SORT_FIELDS, LIVE_PAGE_SIZE, ORDER_SORT_FIELDS, fetch_live_orders, live_page,
+                   load_live_orders, store_live_orders)
+from .pipeline import map_ib_status, save_order_status
 import logging
-import decimal
 import time
 from django.urls import reverse
 from django.http import HttpResponseRedirect
@@ -19,11 +22,40 @@ logger = logging.getLogger(__name__)
 
 @admin.register(IBConfig)
 class IBConfigAdmin(admin.ModelAdmin):
-    list_display = ('host', 'port', 'client_id', 'is_active', 'updated_at')
+    list_display = ('host', 'port', 'client_id', 'sync_client_id', 'account', 'is_active', 'updated_at')
     list_filter = ('is_active',)
     search_fields = ('host',)
 
 
+@admin.register(PositionAggregate)
+class PositionAggregateAdmin(admin.ModelAdmin):
+    """Read-only positions, maintained from the order fills"""
+    list_display = ('account', 'symbol', 'quantity', 'avg_cost', 'realized_pnl', 'fill_count', 'updated_at')
+    list_filter = ('account',)
+    search_fields = ('symbol',)
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class OrderEventInline(admin.TabularInline):
+    """Read-only status and fill history of an order"""
+    model = OrderEvent
+    fields = ('ib_time', 'kind', 'status', 'filled_quantity', 'avg_fill_price')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 class OrderAdminForm(forms.ModelForm):
     """Custom form for Order admin to handle order submission to IB Gateway"""
     
@@ -60,9 +92,9 @@ class OrderAdmin(admin.ModelAdmin):
     form = OrderAdminForm
     
     list_display = ('order_id', 'action', 'symbol', 'quantity', 'order_type', 'get_ib_status', 'filled_quantity', 'created_at')
-    list_filter = ('action', 'status', 'order_type', 'created_at')
-    search_fields = ('order_id', 'symbol')
-    readonly_fields = ('order_id', 'filled_quantity', 'avg_fill_price', 'status', 'created_at', 'updated_at')
+    list_filter = ('action', 'status', 'order_type', 'config', 'created_at')
+    search_fields = ('order_id', 'symbol', 'account')
+    readonly_fields = ('config', 'order_id', 'filled_quantity', 'avg_fill_price', 'status', 'created_at', 'updated_at')
     
     # Define fieldsets for adding a new order
     add_fieldsets = (
@@ -73,7 +105,7 @@ class OrderAdmin(admin.ModelAdmin):
             'fields': ('symbol', 'sec_type', 'exchange', 'currency')
         }),
         ('Order Details', {
-            'fields': ('action', 'quantity', 'order_type', 'limit_price', 'stop_price')
+            'fields': ('account', 'action', 'quantity', 'order_type', 'limit_price', 'stop_price')
         }),
         ('References', {
             'fields': ('webhook',)
@@ -86,10 +118,10 @@ class OrderAdmin(admin.ModelAdmin):
             'fields': ('symbol', 'sec_type', 'exchange', 'currency')
         }),
         ('Order Details', {
-            'fields': ('action', 'quantity', 'order_type', 'limit_price', 'stop_price')
+            'fields': ('account', 'action', 'quantity', 'order_type', 'limit_price', 'stop_price')
         }),
         ('Status & Results', {
-            'fields': ('order_id', 'status', 'filled_quantity', 'avg_fill_price')
+            'fields': ('config', 'order_id', 'status', 'filled_quantity', 'avg_fill_price')
         }),
         ('References', {
             'fields': ('webhook',)
@@ -99,11 +131,19 @@ class OrderAdmin(admin.ModelAdmin):
         }),
     )
     
+    # Order fields the change form can write
+    editable_fields = ('symbol', 'sec_type', 'exchange', 'currency', 'account', 'action', 'quantity',
+                       'order_type', 'limit_price', 'stop_price', 'webhook')
+    
     # Add a custom action button to fetch all orders
     change_list_template = 'admin/ib_gateway/order_changelist.html'
     
     # Add action buttons for order refresh
-    actions = ['refresh_order_status', 'fetch_all_orders_from_ib']
+    actions = ['refresh_order_status', 'cancel_orders', 'resync_orders', 'fetch_all_orders_from_ib']
+    
+    def get_inlines(self, request, obj=None):
+        """Show the event history of existing orders"""
+        return [OrderEventInline] if obj else []
     
     def get_fieldsets(self, request, obj=None):
         """Return different fieldsets for add and change views"""
@@ -132,6 +172,11 @@ class OrderAdmin(admin.ModelAdmin):
         # If this is a new order and we want to submit to IB
         if not change and form.cleaned_data.get('submit_to_ib'):
             self._submit_to_ib_gateway(obj)
+        elif change:
+            # Status and fill are only written by status updates (compare-and-swap on version)
+            fields = [name for name in form.changed_data if name in self.editable_fields]
+            if fields:
+                obj.save(update_fields=fields + ['updated_at'])
         else:
             # Just save to database without IB submission
             super().save_model(request, obj, form, change)
@@ -139,10 +184,12 @@ class OrderAdmin(admin.ModelAdmin):
     def _submit_to_ib_gateway(self, order_obj):
         """Submit the order to IB Gateway"""
         try:
-            # Get the active configuration
-            config = IBConfig.objects.filter(is_active=True).first()
+            # Get the gateway of the order's account (or the default one)
+            config = config_for_account(order_obj.account)
             if not config:
                 raise Exception("No active IB Gateway configuration found")
+            order_obj.config = config
+            order_obj.account = order_obj.account or config.account
                 
             # Connect to IB Gateway
             ib = IBConnection(config.host, config.port, config.client_id)
@@ -180,6 +227,8 @@ class OrderAdmin(admin.ModelAdmin):
                 
                 if not ib_order:
                     raise Exception("Failed to create order")
+                if order_obj.account:
+                    ib_order.account = order_obj.account
                     
                 # Place the order
                 order_id = ib.place_order(contract, ib_order)
@@ -212,20 +261,10 @@ class OrderAdmin(admin.ModelAdmin):
                     if order_status:
                         logger.info(f"Received order status: {order_status}")
                         # Update the order in the database
-                        status_name = map_ib_status(order_status['status'])
-                        order_obj.status = status_name
-                        
-                        if order_status['filled'] > 0:
-                            order_obj.filled_quantity = decimal.Decimal(order_status['filled'])
-                            
-                        if order_status['avgFillPrice'] > 0:
-                            order_obj.avg_fill_price = decimal.Decimal(order_status['avgFillPrice'])
-                            
-                        # Save the updated order
-                        order_obj.save()
+                        save_order_status(order_obj, order_status)
                         
                         # If the order is filled completely, break the loop
-                        if status_name == 'FILLED' or float(order_status['filled']) >= float(order_obj.quantity):
+                        if order_obj.status == 'FILLED' or float(order_status['filled']) >= float(order_obj.quantity):
                             logger.info(f"Order {order_id} is filled, no need to check again")
                             filled = True
                             break
@@ -253,77 +292,53 @@ class OrderAdmin(admin.ModelAdmin):
             return False  # Prevent deletion of orders that have an order_id
         return super().has_delete_permission(request, obj)
     
-    def refresh_order_status(self, request, queryset):
-        """Action to refresh the status of selected orders"""
-        updated = 0
-        errors = []
+    def _run_bulk_action(self, request, queryset, action):
+        """Run a bulk action over one connection per gateway and report every order's outcome"""
+        try:
+            results = run_bulk_action(queryset, action=action, timeout=5)
+        except Exception as e:
+            logger.error(f"Error running bulk {action}: {str(e)}")
+            self.message_user(request, f"Error running bulk {action}: {str(e)}", level='ERROR')
+            return
         
-        for order in queryset:
-            if not order.order_id:
-                continue
-                
-            try:
-                # Get the active configuration
-                config = IBConfig.objects.filter(is_active=True).first()
-                if not config:
-                    self.message_user(request, "No active IB Gateway configuration found", level='ERROR')
-                    return
-                    
-                # Connect to IB Gateway
-                ib = IBConnection(config.host, config.port, config.client_id)
-                if not ib.connect():
-                    self.message_user(request, "Failed to connect to IB Gateway", level='ERROR')
-                    return
-                    
-                try:
-                    # Check order status
-                    order_status = ib.wait_for_order_status(order.order_id, timeout=3)
-                    
-                    if order_status:
-                        # Update the order in the database
-                        status_name = map_ib_status(order_status['status'])
-                        old_status = order.status
-                        order.status = status_name
-                        
-                        if order_status['filled'] > 0:
-                            order.filled_quantity = decimal.Decimal(order_status['filled'])
-                            
-                        if order_status['avgFillPrice'] > 0:
-                            order.avg_fill_price = decimal.Decimal(order_status['avgFillPrice'])
-                            
-                        order.save()
-                        updated += 1
-                    
-                finally:
-                    # Always disconnect from IB Gateway
-                    ib.disconnect()
-                    
-            except Exception as e:
-                # Special handling for duplicate order ID errors
-                error_message = str(e)
-                if "Duplicate order id" in error_message or "duplicate order id" in error_message.lower():
-                    errors.append(f"Order {order.order_id} could not be refreshed: IB Gateway reported duplicate order ID. This order ID may be conflicting with another order.")
-                else:
-                    # Log the error
-                    logger.error(f"Error refreshing order {order.order_id}: {str(e)}")
-                    errors.append(f"Error refreshing order {order.order_id}: {str(e)}")
+        if not results:
+            self.message_user(request, "None of the selected orders has an IB Gateway order ID", level='WARNING')
+            return
         
-        if updated > 0:
-            self.message_user(request, f"Successfully updated {updated} orders", level='SUCCESS')
-        else:
-            self.message_user(request, "No orders were updated", level='WARNING')
-            
-        # Report any errors
-        for error in errors:
-            self.message_user(request, error, level='ERROR')
+        by_outcome = {}
+        for order, (outcome, detail) in results.items():
+            by_outcome.setdefault(outcome, []).append(f"{order.order_id} ({detail})" if detail else order.order_id)
+        levels = {UPDATED: 'SUCCESS', UNCHANGED: 'INFO', SKIPPED: 'INFO', NOT_FOUND: 'WARNING',
+                  CONFLICT: 'WARNING', FAILED: 'ERROR'}
+        for outcome in OUTCOMES:
+            if outcome in by_outcome:
+                orders = by_outcome[outcome]
+                self.message_user(request, f"{outcome.capitalize()}: {len(orders)} orders: {', '.join(orders)}",
+                                  level=levels[outcome])
+    
+    def refresh_order_status(self, request, queryset):
+        """Action to refresh the status of selected orders"""
+        self._run_bulk_action(request, queryset, 'refresh')
     
     refresh_order_status.short_description = "Refresh order status from IB Gateway"
     
+    def cancel_orders(self, request, queryset):
+        """Action to cancel the selected open orders at IB Gateway"""
+        self._run_bulk_action(request, queryset, 'cancel')
+    
+    cancel_orders.short_description = "Cancel selected orders at IB Gateway"
+    
+    def resync_orders(self, request, queryset):
+        """Action to resync status and fills of selected orders, including finished ones"""
+        self._run_bulk_action(request, queryset, 'resync')
+    
+    resync_orders.short_description = "Resync status and fills from IB Gateway (including finished orders)"
+    
     def fetch_all_orders_from_ib(self, request, queryset):
         """Fetch all orders from IB Gateway and sync with database"""
         try:
             # Get the active configuration
-            config = IBConfig.objects.filter(is_active=True).first()
+            config = default_config()
             if not config:
                 self.message_user(request, "No active IB Gateway configuration found", level='ERROR')
                 return
@@ -360,6 +375,7 @@ class OrderAdmin(admin.ModelAdmin):
                         'filled': orderState.filled if hasattr(orderState, 'filled') else 0,
                         'remaining': orderState.remaining if hasattr(orderState, 'remaining') else 0,
                         'avgFillPrice': orderState.avgFillPrice if hasattr(orderState, 'avgFillPrice') else 0,
+                        'account': order.account,
                     })
                     
                     # Call the original method if it exists
@@ -428,9 +444,9 @@ class OrderAdmin(admin.ModelAdmin):
                     
                     # Check if this order exists in our database
                     try:
-                        db_order = Order.objects.get(order_id=order_id)
+                        db_order = Order.objects.filter(config=config).with_order_id(order_id).get()
                         
-                        # Update the existing order
+                        # Update the existing order; status and fill go through the state machine
                         db_order.symbol = ib_order['symbol']
                         db_order.action = ib_order['action']
                         db_order.sec_type = ib_order['secType']
@@ -438,10 +454,9 @@ class OrderAdmin(admin.ModelAdmin):
                         db_order.currency = ib_order['currency']
                         db_order.quantity = ib_order['quantity']
                         db_order.order_type = ib_order['orderType']
-                        db_order.status = map_ib_status(ib_order['status'])
-                        db_order.filled_quantity = ib_order['filled']
-                        db_order.avg_fill_price = ib_order['avgFillPrice']
-                        db_order.save()
+                        db_order.save(update_fields=['symbol', 'action', 'sec_type', 'exchange', 'currency',
+                                                     'quantity', 'order_type', 'updated_at'])
+                        save_order_status(db_order, ib_order)
                         
                         updated_count += 1
                         
@@ -449,6 +464,8 @@ class OrderAdmin(admin.ModelAdmin):
                         # Create a new order in our database
                         db_order = Order(
                             order_id=order_id,
+                            config=config,
+                            account=ib_order['account'],
                             symbol=ib_order['symbol'],
                             action=ib_order['action'],
                             sec_type=ib_order['secType'],
@@ -474,15 +491,11 @@ class OrderAdmin(admin.ModelAdmin):
                         
                     # Check if this order exists in our database
                     try:
-                        db_order = Order.objects.get(order_id=order_id)
+                        db_order = Order.objects.filter(config=config).with_order_id(order_id).get()
                         
                         # Update the existing order with execution details
-                        if float(db_order.filled_quantity or 0) < float(exec_detail['shares']):
-                            db_order.filled_quantity = exec_detail['shares']
-                            db_order.avg_fill_price = exec_detail['price']
-                            db_order.status = 'FILLED'
-                            db_order.save()
-                            
+                        if save_order_status(db_order, {'status': 'Filled', 'filled': exec_detail['shares'],
+                                                        'avgFillPrice': exec_detail['price']}):
                             execution_matched += 1
                             
                     except Order.DoesNotExist:
@@ -490,6 +503,8 @@ class OrderAdmin(admin.ModelAdmin):
                         action = 'BUY' if exec_detail['side'] == 'BOT' else 'SELL'
                         db_order = Order(
                             order_id=order_id,
+                            config=config,
+                            account=exec_detail['account'],
                             symbol=exec_detail['symbol'],
                             action=action,
                             sec_type=exec_detail['secType'],
@@ -539,12 +554,14 @@ class OrderAdmin(admin.ModelAdmin):
             return obj.status
         
         # Create connection object - but don't actually connect unless the user clicks the value
-        status_html = f'<span>{obj.status}</span>'
+        # The changelist keeps the status up to date from the order stream (/api/ib/stream/)
+        status_html = format_html('<span class="ib-status" data-order-id="{}">{}</span>', obj.order_id, obj.status)
         if obj.status != 'FILLED' and obj.status != 'CANCELLED' and obj.status != 'REJECTED':
             refresh_url = f'/admin/ib_gateway/order/{obj.id}/refresh_status/'
-            status_html += f' <a href="{refresh_url}" class="button" style="padding: 0 5px; margin-left: 5px;">↻</a>'
+            status_html += format_html(' <a href="{}" class="button ib-status-refresh" data-order-id="{}" '
+                                       'style="padding: 0 5px; margin-left: 5px;">↻</a>', refresh_url, obj.order_id)
         
-        return format_html(status_html)
+        return status_html
     
     get_ib_status.short_description = 'Status'
     get_ib_status.admin_order_field = 'status'
@@ -587,8 +604,8 @@ class OrderAdmin(admin.ModelAdmin):
             return HttpResponseRedirect(reverse('admin:ib_gateway_order_changelist'))
             
         try:
-            # Get the active configuration
-            config = IBConfig.objects.filter(is_active=True).first()
+            # Get the order's gateway
+            config = config_for_order(order)
             if not config:
                 self.message_user(request, "No active IB Gateway configuration found", level='ERROR')
                 return HttpResponseRedirect(reverse('admin:ib_gateway_order_changelist'))
@@ -605,18 +622,10 @@ class OrderAdmin(admin.ModelAdmin):
                 
                 if order_status:
                     # Update the order in the database
-                    status_name = map_ib_status(order_status['status'])
-                    old_status = order.status
-                    order.status = status_name
-                    
-                    if order_status['filled'] > 0:
-                        order.filled_quantity = decimal.Decimal(order_status['filled'])
-                        
-                    if order_status['avgFillPrice'] > 0:
-                        order.avg_fill_price = decimal.Decimal(order_status['avgFillPrice'])
-                        
-                    order.save()
-                    self.message_user(request, f"Successfully updated order {order.order_id} status to {status_name}", level='SUCCESS')
+                    if save_order_status(order, order_status):
+                        self.message_user(request, f"Successfully updated order {order.order_id} status to {order.status}", level='SUCCESS')
+                    else:
+                        self.message_user(request, f"Order {order.order_id} is already up to date ({order.status})", level='INFO')
                 else:
                     self.message_user(request, f"Order {order.order_id} not found in IB Gateway or no status available", level='WARNING')
                 
@@ -641,120 +650,32 @@ class OrderAdmin(admin.ModelAdmin):
             return HttpResponseRedirect(reverse('admin:ib_gateway_order_changelist')) 
 
 def live_orders_view(request):
+    """Live orders page; a refresh fetches open orders and executions, the table loads from live_orders_data_view"""
     from django.template.response import TemplateResponse
     from django.contrib import messages
     
-    context = dict(
-        admin.site.each_context(request),
-        title="Live Orders from IB Gateway",
-    )
-    
     # Only process if user requested refresh
     if request.method == 'POST' and request.POST.get('action') == 'refresh':
-        orders = []
-        executions = []
-        
         try:
             # Get the active configuration
-            config = IBConfig.objects.filter(is_active=True).first()
+            config = default_config()
             if not config:
                 messages.error(request, "No active IB Gateway configuration found")
-                return TemplateResponse(request, "admin/ib_gateway/live_orders.html", context)
+                return HttpResponseRedirect(request.path)
                 
             # Connect to IB Gateway
             ib = IBConnection(config.host, config.port, config.client_id)
             if not ib.connect():
                 messages.error(request, "Failed to connect to IB Gateway")
-                return TemplateResponse(request, "admin/ib_gateway/live_orders.html", context)
+                return HttpResponseRedirect(request.path)
                 
             try:
-                # Set up the wrapper to handle opened orders
-                orders_received = []
-                executions_received = []
-                
-                # Store the original methods
-                original_openOrder = ib.api.openOrder
-                original_openOrderEnd = ib.api.openOrderEnd
-                original_execDetails = ib.api.execDetails
-                
-                # Create a handler for openOrder events
-                def handle_open_order(orderId, contract, order, orderState):
-                    logger.info(f"Received open order: {orderId}")
-                    orders_received.append({
-                        'orderId': orderId,
-                        'symbol': contract.symbol,
-                        'secType': contract.secType,
-                        'exchange': contract.exchange,
-                        'currency': contract.currency,
-                        'action': order.action,
-                        'quantity': order.totalQuantity,
-                        'orderType': order.orderType,
-                        'status': orderState.status,
-                        'filled': orderState.filled if hasattr(orderState, 'filled') else 0,
-                        'remaining': orderState.remaining if hasattr(orderState, 'remaining') else 0,
-                        'avgFillPrice': orderState.avgFillPrice if hasattr(orderState, 'avgFillPrice') else 0,
-                    })
-                    
-                    # Call the original method if it exists
-                    if original_openOrder is not None:
-                        original_openOrder(orderId, contract, order, orderState)
-                
-                # Create a handler for openOrderEnd events
-                def handle_open_order_end():
-                    logger.info(f"Open orders request completed. Received {len(orders_received)} orders.")
-                    # Call the original method if it exists
-                    if original_openOrderEnd is not None:
-                        original_openOrderEnd()
-                
-                # Create a handler for execution details
-                def handle_exec_details(reqId, contract, execution):
-                    logger.info(f"Received execution details for order {execution.orderId}")
-                    executions_received.append({
-                        'orderId': execution.orderId,
-                        'execId': execution.execId,
-                        'time': execution.time,
-                        'symbol': contract.symbol,
-                        'secType': contract.secType,
-                        'exchange': execution.exchange,
-                        'side': execution.side,
-                        'shares': execution.shares,
-                        'price': execution.price,
-                        'account': execution.acctNumber
-                    })
-                    
-                    # Call the original method if it exists
-                    if original_execDetails is not None:
-                        original_execDetails(reqId, contract, execution)
+                # Both requests at once, done when both end markers arrived
+                orders, executions, complete = fetch_live_orders(ib, client_id=config.client_id)
+                store_live_orders(request.user.pk, orders, executions)
                 
-                # Replace the methods
-                ib.api.openOrder = handle_open_order
-                ib.api.openOrderEnd = handle_open_order_end
-                ib.api.execDetails = handle_exec_details
-                
-                # Request open orders
-                logger.info("Requesting open orders from IB Gateway...")
-                ib.api.reqOpenOrders()
-                
-                # Wait for data to be received
-                time.sleep(3)
-                
-                # Request executions
-                from ibapi.execution import ExecutionFilter
-                exec_filter = ExecutionFilter()
-                exec_filter.clientId = config.client_id
-                exec_filter.time = ""  # Empty string gets all executions
-                
-                # Request executions
-                ib.api.reqExecutions(1, exec_filter)
-                
-                # Wait for data to be received
-                time.sleep(3)
-                
-                # Process results
-                orders = orders_received
-                executions = executions_received
-                
-                # Update context with results
+                if not complete:
+                    messages.warning(request, "IB Gateway didn't finish answering in time, the lists may be incomplete")
                 if orders:
                     messages.success(request, f"Found {len(orders)} open orders in IB Gateway")
                 else:
@@ -771,34 +692,75 @@ def live_orders_view(request):
             logger.error(f"Error fetching orders from IB Gateway: {str(e)}")
             messages.error(request, f"Error fetching orders from IB Gateway: {str(e)}")
         
-        # Add results to context
-        context.update({
-            'orders': orders,
-            'executions': executions,
-            'refresh_time': time.strftime('%Y-%m-%d %H:%M:%S'),
-        })
-        
+        # Post/redirect/get, so reloading the page doesn't fetch again
+        return HttpResponseRedirect(request.path)
+    
+    snapshot = load_live_orders(request.user.pk)
+    context = dict(
+        admin.site.each_context(request),
+        title="Live Orders from IB Gateway",
+        refresh_time=snapshot['refresh_time'] if snapshot else None,
+        order_count=len(snapshot['orders']) if snapshot else 0,
+        execution_count=len(snapshot['executions']) if snapshot else 0,
+        page_size=LIVE_PAGE_SIZE,
+    )
     return TemplateResponse(request, "admin/ib_gateway/live_orders.html", context)
 
+
+def live_orders_data_view(request):
+    """
+    One page of the last fetched live orders or executions, as JSON
+    
+    Query parameters:
+        kind: 'orders' (default) or 'executions'
+        order_id: Only the executions of this order
+        sort, dir: Field to sort by and 'asc' or 'desc'
+        page, limit: Page number and rows per page
+    """
+    from django.http import JsonResponse
+    
+    snapshot = load_live_orders(request.user.pk)
+    if snapshot is None:
+        return JsonResponse({'success': False, 'message': 'No live orders fetched, refresh first'}, status=404)
+    
+    try:
+        page = int(request.GET.get('page', 1))
+        limit = int(request.GET.get('limit', LIVE_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'page and limit must be integers'}, status=400)
+    
+    if request.GET.get('kind') == 'executions':
+        rows, sort_fields = snapshot['executions'], EXECUTION_SORT_FIELDS
+        if request.GET.get('order_id'):
+            rows = [row for row in rows if str(row['orderId']) == request.GET['order_id']]
+    else:
+        rows, sort_fields = snapshot['orders'], ORDER_SORT_FIELDS
+    
+    data = live_page(rows, sort_fields, sort=request.GET.get('sort'), direction=request.GET.get('dir', 'asc'),
+                     page=page, limit=limit)
+    return JsonResponse(dict(data, success=True, refresh_time=snapshot['refresh_time']))
+
 # Register the custom view by adding the URLs directly
 original_get_urls = admin.AdminSite.get_urls
 
 def get_urls(self):
     urls = original_get_urls(self)
     from django.urls import path
-    # Add the live orders view URL
-    urls.append(
+    custom_urls = [
+        # Add the live orders view URL
         path('ib_gateway/live-orders/', 
              self.admin_view(live_orders_view), 
-             name="ib_gateway_live_orders")
-    )
-    # Add the fetch all orders URL
-    urls.append(
+             name="ib_gateway_live_orders"),
+        path('ib_gateway/live-orders/data/',
+             self.admin_view(live_orders_data_view),
+             name="ib_gateway_live_orders_data"),
+        # Add the fetch all orders URL
         path('ib_gateway/fetch-all-orders/',
              self.admin_view(fetch_all_orders_view),
-             name="fetch_all_orders")
-    )
-    return urls
+             name="fetch_all_orders"),
+    ]
+    # Ahead of the admin's catch-all URL, which would otherwise answer them
+    return custom_urls + urls
 
 # Monkey patch the AdminSite.get_urls method
 admin.AdminSite.get_urls = get_urls
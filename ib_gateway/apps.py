@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class IbGatewayConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'ib_gateway' 
\ No newline at end of file
+    name = 'ib_gateway'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,180 @@
+"""
+Bulk order actions (admin refresh, cancel and resync).
+
+The selected orders are grouped by gateway and each gateway gets one
+connection, all gateways in parallel. Over that connection every order is
+asked for at once (reqAllOpenOrders, reqCompletedOrders and reqExecutions)
+instead of connecting and waiting for each order in turn. The answers of a
+gateway are applied to its orders with one OrderReconciler, i.e. one
+compare-and-swap UPDATE per batch, and every order gets an outcome.
+"""
+
+import collections
+import logging
+import time
+
+from ibapi.execution import ExecutionFilter
+
+from .configs import config_for_order, run_per_config
+from .connection import IBConnection
+from .daemon import EXECUTIONS_REQUEST_ID, OrderSnapshot, latest_executions, snapshot_updates
+from .models import Order
+from .pipeline import ORDER_STATUS_TRANSITIONS, map_ib_status
+from .reconcile import OPEN_ORDER_STATUSES, OrderReconciler
+
+logger = logging.getLogger(__name__)
+
+# Outcomes of a bulk action per order, in the order they are reported
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+NOT_FOUND = 'not found'
+SKIPPED = 'skipped'
+CONFLICT = 'conflict'
+FAILED = 'failed'
+OUTCOMES = (UPDATED, UNCHANGED, SKIPPED, NOT_FOUND, CONFLICT, FAILED)
+
+ALL_ORDER_STATUSES = tuple(status for status, _ in Order.ORDER_STATUSES)
+
+# IB error code confirming a cancel ("Order Canceled")
+ORDER_CANCELED_CODE = 202
+
+
+def fetch_order_updates(ib, order_ids, cancel=(), timeout=5):
+    """
+    Ask a connected gateway for the current state of orders, all at once
+
+    Args:
+        ib (IBConnection): Connected gateway session
+        order_ids (iterable): IB order IDs to get the state of
+        cancel (iterable): IB order IDs to cancel first
+        timeout (float): Most seconds to wait for the answers
+
+    Returns:
+        dict: (kind, update) list per IB order ID found, kind being 'status' or 'execution'
+    """
+    order_ids = {str(order_id) for order_id in order_ids}
+    cancel = {str(order_id) for order_id in cancel}
+    snapshot = OrderSnapshot(executions=True)
+    snapshot.attach(ib)
+    # Cancels IB refuses (e.g. the order is already filled) are answered with an error
+    refused = set()
+    log_error = ib.api.error
+
+    def error(reqId, errorCode, errorString, *args):
+        if str(reqId) in cancel and errorCode != ORDER_CANCELED_CODE:
+            refused.add(str(reqId))
+        log_error(reqId, errorCode, errorString, *args)
+
+    ib.api.error = error
+
+    for order_id in cancel:
+        ib.api.cancelOrder(int(order_id))
+    ib.api.reqAllOpenOrders()
+    ib.api.reqCompletedOrders(False)
+    # Completed orders come without their fill price, executions have it
+    ib.api.reqExecutions(EXECUTIONS_REQUEST_ID, ExecutionFilter())
+
+    def answered():
+        if not snapshot.done():
+            return False
+        # Cancelled orders are done once IB confirms a final status
+        return all(order_id in refused or (
+            order_id in ib.api.order_states
+            and not ORDER_STATUS_TRANSITIONS[map_ib_status(ib.api.order_states[order_id]['status'])]
+        ) for order_id in cancel)
+
+    deadline = time.monotonic() + timeout
+    while not answered() and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    updates = collections.defaultdict(list)
+    for update in snapshot_updates(snapshot):
+        if update['orderId'] in order_ids:
+            updates[update['orderId']].append(('status', update))
+    # orderStatus callbacks carry the fill, which the snapshot doesn't
+    for order_id, update in list(ib.api.order_states.items()):
+        if order_id in order_ids:
+            updates[order_id].append(('status', update))
+    for execution in latest_executions(ib, order_ids):
+        updates[execution['orderId']].append(('execution', execution))
+    return updates
+
+
+def run_bulk_action(orders, action='refresh', timeout=5, connection_class=IBConnection):
+    """
+    Refresh, cancel or resync orders over one connection per gateway
+
+    Args:
+        orders (iterable): Orders to act on
+        action (str): 'refresh' (the open orders), 'cancel' (cancel the open
+            orders, then refresh them) or 'resync' (all orders, also fixing the
+            fill of finished ones)
+        timeout (float): Most seconds to wait for each gateway's answers
+        connection_class (callable): Creates the connection from (host, port, client_id)
+
+    Returns:
+        dict: (outcome, detail) per order, outcome being one of OUTCOMES and
+            detail a short explanation (may be empty)
+    """
+    statuses = ALL_ORDER_STATUSES if action == 'resync' else OPEN_ORDER_STATUSES
+    results = {}
+    by_config = {}
+    for order in orders:
+        if not order.order_id:
+            continue
+        if order.status not in statuses:
+            results[order] = (SKIPPED, f"already {order.status}")
+            continue
+        config = config_for_order(order)
+        if config is None:
+            results[order] = (FAILED, "no active IB Gateway configuration")
+            continue
+        by_config.setdefault(config.pk, (config, []))[1].append(order)
+
+    def fetch(config):
+        config_orders = by_config[config.pk][1]
+        cancel = [order.order_id for order in config_orders] if action == 'cancel' else []
+        ib = connection_class(config.host, config.port, config.client_id)
+        if not ib.connect():
+            raise ConnectionError(f"Failed to connect to IB Gateway at {config.host}:{config.port}")
+        try:
+            return fetch_order_updates(ib, [order.order_id for order in config_orders], cancel=cancel,
+                                       timeout=timeout)
+        finally:
+            ib.disconnect()
+
+    for config, updates, error in run_per_config(fetch, [config for config, _ in by_config.values()]):
+        config_orders = by_config[config.pk][1]
+        if error is not None:
+            for order in config_orders:
+                results[order] = (FAILED, str(error))
+            continue
+
+        # IB order IDs are only unique per gateway, so every gateway is reconciled on its own
+        reconciler = OrderReconciler(statuses=statuses)
+        reconciler.load(order_ids=updates, pks=[order.pk for order in config_orders])
+        for order_id, order_updates in updates.items():
+            for kind, update in order_updates:
+                if kind == 'execution':
+                    reconciler.apply_execution(update)
+                else:
+                    reconciler.apply(update)
+        reconciler.save()
+
+        saved = set(reconciler.saved)
+        for order in config_orders:
+            order_id = order.order_id
+            current = reconciler.orders.get(order_id, order)
+            if order_id in saved:
+                old_status, _ = reconciler.changed[order_id]
+                results[order] = (UPDATED, f"{old_status} -> {current.status}" if old_status != current.status
+                                  else f"{current.filled_quantity} filled at {current.avg_fill_price}")
+            elif order_id in reconciler.changed:
+                results[order] = (CONFLICT, "changed by someone else, try again")
+            elif order_id not in updates:
+                results[order] = (NOT_FOUND, '')
+            else:
+                results[order] = (UNCHANGED, current.status)
+    logger.info(f"Bulk {action} of {len(results)} orders: "
+                f"{dict(collections.Counter(outcome for outcome, _ in results.values()))}")
+    return results
@@ -0,0 +1,117 @@
+"""
+Cached order API responses.
+
+Order detail and list responses are cached in the 'orders' cache together
+with an ETag, so repeat polls cost a cache lookup, or a 304 when the client
+sends If-None-Match. Changing an order deletes its detail entry and bumps
+the version that all list keys carry, which leaves every cached list
+unreachable. Both happen right away and again once the change commits.
+"""
+
+import hashlib
+import json
+import time
+
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import parse_order_number
+
+ORDER_CACHE_ALIAS = 'orders'
+LIST_VERSION_KEY = 'orders:list-version'
+
+
+def get_order_cache():
+    return caches[ORDER_CACHE_ALIAS]
+
+
+def _version(key):
+    # Start from the clock so a culled version key never goes back to an old value
+    return get_order_cache().get_or_set(key, time.time_ns(), None)
+
+
+def _bump(key):
+    cache = get_order_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def detail_cache_key(order_id, config_id=None):
+    """Cache key of an order detail request, looked up on one gateway or on all of them"""
+    # The same order as Order.objects.with_order_id() finds, e.g. '0042' and '42'
+    order_number = parse_order_number(order_id)
+    if order_number is not None:
+        order_id = order_number
+    if config_id is None:
+        return f"orders:detail:{order_id}"
+    return f"orders:detail:{config_id}:{order_id}"
+
+
+def list_cache_key(query):
+    """Cache key of an order list request, from its query parameters in any order"""
+    params = json.dumps(sorted((key, sorted(values)) for key, values in query.lists()))
+    digest = hashlib.md5(params.encode()).hexdigest()
+    return f"orders:list:{_version(LIST_VERSION_KEY)}:{digest}"
+
+
+def invalidate_orders(orders):
+    """Drop the cached responses of these (order_id, config_id) pairs and of every order list"""
+    keys = []
+    for order_id, config_id in orders:
+        keys += [detail_cache_key(order_id), detail_cache_key(order_id, config_id)]
+    get_order_cache().delete_many(keys)
+    _bump(LIST_VERSION_KEY)
+
+
+def invalidate_orders_on_commit(orders):
+    """
+    Invalidate the cached responses of changed orders
+
+    Runs now and again once the transaction commits, so a response built
+    from the data before the change doesn't outlive the transaction.
+    """
+    orders = [(order.order_id, order.config_id) for order in orders]
+    invalidate_orders(orders)
+    transaction.on_commit(lambda: invalidate_orders(orders))
+
+
+def make_etag(data):
+    """Strong ETag of a response body"""
+    body = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True)
+    return quote_etag(hashlib.md5(body.encode()).hexdigest())
+
+
+def cached_response(request, key, build):
+    """
+    Serve a GET response from the order cache
+
+    Args:
+        request: The request, checked for If-None-Match
+        key (str): Cache key of the response
+        build (callable): Returns the Response on a cache miss; only 200
+            responses are cached
+
+    Returns:
+        Response: The cached or built response, or a 304 if the client's copy is current
+    """
+    cache = get_order_cache()
+    entry = cache.get(key)
+    if entry is None:
+        response = build()
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        entry = (make_etag(response.data), response.data)
+        cache.set(key, entry)
+
+    etag, data = entry
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(data, headers=headers)
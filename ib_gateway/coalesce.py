@@ -0,0 +1,181 @@
+"""
+Per-symbol signal coalescing.
+
+Strategies often fire several alerts for the same symbol within a few hundred
+milliseconds (e.g. close short, then open long). SignalCoalescer holds signals
+for ORDER_COALESCE_WINDOW_MS after the first one of a burst and submits a
+single net order per account and contract when the window closes. Signals
+only net with others of the same order type and prices; a burst that nets to
+zero places no order at all.
+
+Every webhook of a burst is marked processed once its bucket is consumed,
+whether its signal went into an order or netted out, so a replay never
+submits the absorbed signals again.
+"""
+
+import decimal
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from .pipeline import mark_webhooks_processed, submit_order
+
+logger = logging.getLogger(__name__)
+
+# Signal fields that must match for two signals to be netted
+COALESCE_KEY_FIELDS = ('account', 'symbol', 'sec_type', 'exchange', 'currency',
+                       'order_type', 'limit_price', 'stop_price')
+
+
+def get_coalesce_window():
+    """Coalescing window in seconds (0 disables coalescing)"""
+    return max(0, getattr(settings, 'ORDER_COALESCE_WINDOW_MS', 0)) / 1000
+
+
+class _Bucket:
+    """Signals collected for one key during one window"""
+
+    __slots__ = ('deadline', 'net', 'signals', 'webhook_ids')
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.net = decimal.Decimal(0)
+        self.signals = 0
+        self.webhook_ids = []
+
+
+class SignalCoalescer:
+    """Nets signals per account and contract over a time window before submission"""
+
+    def __init__(self, ib, window=None, submit=None, clock=time.monotonic, wait=5, netted_out=None):
+        """
+        Args:
+            ib (IBConnection): Connected gateway session
+            window (float): Window in seconds (default: ORDER_COALESCE_WINDOW_MS)
+            submit (callable): submit(ib, signal, webhook_ids) placing one order for
+                the webhooks of a burst, defaults to pipeline.submit_order linking
+                the order to the last webhook and marking all of them processed
+            clock (callable): Time source for signals added without a timestamp
+            wait (int): Seconds to wait for each order status with the default submit
+            netted_out (callable): netted_out(webhook_ids) called for a burst that
+                nets to zero, defaults to pipeline.mark_webhooks_processed
+        """
+        self.ib = ib
+        self.window = get_coalesce_window() if window is None else window
+        self.wait = wait
+        self.submit = submit or self.submit_order
+        self.netted_out = netted_out or mark_webhooks_processed
+        self.clock = clock
+        self.stats = {'signals': 0, 'orders': 0, 'netted_out': 0, 'failed': 0}
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._stop = None
+
+    def submit_order(self, ib, signal, webhook_ids):
+        """Place an order for a burst, linked to its last webhook, and mark all its webhooks processed"""
+        return submit_order(ib, signal, webhook_ids[-1], wait=self.wait, webhook_ids=webhook_ids)
+
+    def add(self, signal, webhook_id=None, at=None):
+        """
+        Queue a signal for its window, or submit it right away if coalescing is off
+
+        Args:
+            signal (dict): Order parameters from parse_signal()
+            webhook_id (int): Webhook that carried the signal
+            at (float): Signal time in seconds (default: clock()), e.g. the
+                webhook's received_at timestamp when replaying
+
+        Returns:
+            list: Submission results if orders were placed, otherwise empty
+        """
+        at = self.clock() if at is None else at
+        key = tuple(signal[field] for field in COALESCE_KEY_FIELDS)
+        quantity = signal['quantity'] if signal['action'] == 'BUY' else -signal['quantity']
+
+        with self._lock:
+            self.stats['signals'] += 1
+            bucket = self._buckets.get(key)
+            if bucket is None or not self.window:
+                bucket = _Bucket(at + self.window)
+                if self.window:
+                    self._buckets[key] = bucket
+            bucket.net += quantity
+            bucket.signals += 1
+            bucket.webhook_ids.append(webhook_id)
+
+        if not self.window:
+            return self._submit([(key, bucket)])
+        return []
+
+    def flush_due(self, now=None):
+        """Submit the net orders of all windows that have closed by now"""
+        now = self.clock() if now is None else now
+        with self._lock:
+            due = [key for key, bucket in self._buckets.items() if bucket.deadline <= now]
+            buckets = [(key, self._buckets.pop(key)) for key in due]
+        return self._submit(buckets)
+
+    def flush(self):
+        """Submit the net orders of all open windows"""
+        with self._lock:
+            buckets = list(self._buckets.items())
+            self._buckets.clear()
+        return self._submit(buckets)
+
+    def _submit(self, buckets):
+        """Place one net order per bucket"""
+        results = []
+        for key, bucket in buckets:
+            signal = dict(zip(COALESCE_KEY_FIELDS, key))
+
+            if bucket.net == 0:
+                logger.info(f"Coalesced {bucket.signals} signals for {signal['symbol']} net to zero, no order placed")
+                try:
+                    self.netted_out(bucket.webhook_ids)
+                except Exception as e:
+                    logger.error(f"Error recording netted out webhooks {bucket.webhook_ids}: {str(e)}")
+                with self._lock:
+                    self.stats['netted_out'] += bucket.signals
+                continue
+
+            signal['action'] = 'BUY' if bucket.net > 0 else 'SELL'
+            signal['quantity'] = abs(bucket.net)
+            if bucket.signals > 1:
+                logger.info(f"Coalesced {bucket.signals} signals (webhooks {bucket.webhook_ids}) into "
+                            f"{signal['action']} {signal['quantity']} {signal['symbol']}")
+
+            with self._lock:
+                self.stats['netted_out'] += bucket.signals - 1
+            try:
+                results.append(self.submit(self.ib, signal, bucket.webhook_ids))
+            except Exception as e:
+                # Keep going so one failed order doesn't hold back other symbols
+                logger.error(f"Error submitting coalesced order for {signal['symbol']}: {str(e)}")
+                with self._lock:
+                    self.stats['failed'] += 1
+                continue
+            with self._lock:
+                self.stats['orders'] += 1
+        return results
+
+    def start(self, interval=None):
+        """Flush closed windows from a background thread until stop() is called"""
+        if self._stop is not None or not self.window:
+            return
+        interval = interval or min(self.window / 4, 0.05)
+        self._stop = threading.Event()
+
+        def run(stop):
+            while not stop.wait(interval):
+                self.flush_due()
+
+        threading.Thread(target=run, args=(self._stop,), name='signal-coalescer', daemon=True).start()
+
+    def stop(self):
+        """Stop the background thread and submit whatever is still pending"""
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+        return self.flush()
@@ -0,0 +1,149 @@
+"""
+Active IB Gateway configurations.
+
+Every active IBConfig is a gateway with its own connection. Orders are
+routed to a gateway by account and tagged with the config they were placed
+through, so sync and reconciliation can run per gateway, in parallel.
+
+The active configs are cached per process. Saving or deleting an IBConfig
+clears the cache of the process that made the change and, once committed,
+touches IB_CONFIG_VERSION_FILE; other processes reload when its modification
+time changes. Lookups cost a stat() instead of a query.
+"""
+
+import concurrent.futures
+import logging
+import os
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+
+from .models import IBConfig
+
+logger = logging.getLogger(__name__)
+
+_cache = {'version': None, 'configs': None}
+_cache_lock = threading.Lock()
+
+
+def _config_version():
+    """Modification time of the version file, None if no config was changed yet"""
+    try:
+        return os.stat(settings.IB_CONFIG_VERSION_FILE).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _cached_configs():
+    """Active configs, oldest first, loaded once per version"""
+    version = _config_version()
+    configs = _cache['configs']
+    if configs is not None and _cache['version'] == version:
+        return configs
+    with _cache_lock:
+        if _cache['configs'] is None or _cache['version'] != version:
+            _cache['configs'] = tuple(IBConfig.objects.filter(is_active=True).order_by('id'))
+            _cache['version'] = version
+        return _cache['configs']
+
+
+def clear_config_cache():
+    """Drop this process's cached configs"""
+    with _cache_lock:
+        _cache['configs'] = None
+
+
+def bump_config_version():
+    """Make every process reload its configs"""
+    clear_config_cache()
+    path = Path(settings.IB_CONFIG_VERSION_FILE)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+    except OSError as e:
+        logger.error(f"Error updating IB config version file {path}: {str(e)}")
+
+
+def active_configs():
+    """All active gateway configurations, oldest first"""
+    return list(_cached_configs())
+
+
+def default_config():
+    """The gateway used when no account is given (the oldest active config)"""
+    configs = _cached_configs()
+    return configs[0] if configs else None
+
+
+def config_by_id(config_id):
+    """Active gateway configuration by primary key, None if inactive or unknown"""
+    return next((config for config in _cached_configs() if config.pk == config_id), None)
+
+
+def config_for_account(account=None):
+    """
+    Gateway for an IB account
+
+    Returns:
+        IBConfig: The active config of the account, or the default config if
+        no account is given or none is configured for it
+    """
+    if account:
+        config = next((config for config in _cached_configs() if config.account == account), None)
+        if config:
+            return config
+    return default_config()
+
+
+def config_for_order(order):
+    """Gateway to query for an order: the one it was placed through if still active"""
+    if order.config_id:
+        config = config_by_id(order.config_id)
+        if config:
+            return config
+    return config_for_account(order.account)
+
+
+def run_per_config(func, configs=None, max_workers=None):
+    """
+    Run func(config) for every active gateway concurrently, one thread each
+
+    Args:
+        func (callable): Called with an IBConfig
+        configs (list): Gateways to run for (default: all active)
+        max_workers (int): Most gateways handled at the same time
+
+    Returns:
+        list: (config, result, exception) per gateway, in config order
+    """
+    configs = active_configs() if configs is None else configs
+    if not configs:
+        return []
+    if len(configs) == 1:
+        # Nothing to run in parallel
+        try:
+            return [(configs[0], func(configs[0]), None)]
+        except Exception as e:
+            logger.error(f"Error for IB Gateway {configs[0].host}:{configs[0].port}: {str(e)}")
+            return [(configs[0], None, e)]
+
+    def run(config):
+        try:
+            return func(config)
+        finally:
+            # Database connections are per thread
+            connections.close_all()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or len(configs),
+                                               thread_name_prefix='ib-gateway') as executor:
+        futures = [executor.submit(run, config) for config in configs]
+
+    results = []
+    for config, future in zip(configs, futures):
+        error = future.exception()
+        if error is not None:
+            logger.error(f"Error for IB Gateway {config.host}:{config.port}: {str(error)}")
+        results.append((config, None if error else future.result(), error))
+    return results
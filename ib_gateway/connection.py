@@ -2,11 +2,14 @@ from ibapi.client import EClient
 from ibapi.wrapper import EWrapper
 from ibapi.contract import Contract
 from ibapi.order import Order
+import collections
 import threading
 import time
 import logging
 import queue
 
+from broker import metrics
+
 logger = logging.getLogger(__name__)
 
 class IBApi(EWrapper, EClient):
@@ -16,11 +19,31 @@ class IBApi(EWrapper, EClient):
         self.next_order_id = None
         self.account_info = {}
         self.order_status_updates = queue.Queue()
+        self.execution_updates = queue.Queue()
         self.execution_details = {}
         self.order_states = {}
+        # Connection health, read by the heartbeat (health.py)
+        self.last_message_at = None
+        self.error_counts = collections.Counter()
+        self.server_time = None
+        self.server_time_received_at = None
+        
+    def msgLoopRec(self):
+        """Called after every message received"""
+        self.last_message_at = time.time()
+        metrics.IB_MESSAGES.inc()
+        
+    def currentTime(self, server_time):
+        """Called with the server time requested by reqCurrentTime (the heartbeat)"""
+        metrics.IB_CALLBACKS.inc(callback='currentTime')
+        self.server_time = server_time
+        self.server_time_received_at = time.time()
         
     def error(self, reqId, errorCode, errorString):
         logger.error(f"Error {errorCode}: {errorString}")
+        self.error_counts[errorCode] += 1
+        metrics.IB_CALLBACKS.inc(callback='error')
+        metrics.IB_ERRORS.inc(code=errorCode)
         # TWS/IB Gateway can notify about connection status through error messages
         if errorCode == 502:  # Couldn't connect to TWS
             self.connected = False
@@ -30,12 +53,14 @@ class IBApi(EWrapper, EClient):
     def nextValidId(self, orderId):
         """Called when connection is established and an order ID is received"""
         logger.info(f"Next valid order ID: {orderId}")
+        metrics.IB_CALLBACKS.inc(callback='nextValidId')
         self.next_order_id = orderId
         self.connected = True
         
     def connectionClosed(self):
         """Called when connection is closed"""
         logger.info("IB Gateway connection closed")
+        metrics.IB_CALLBACKS.inc(callback='connectionClosed')
         self.connected = False
         
     def updateAccountValue(self, key, val, currency, accountName):
@@ -58,6 +83,7 @@ class IBApi(EWrapper, EClient):
     def orderStatus(self, orderId, status, filled, remaining, avgFillPrice, permId, parentId, lastFillPrice, clientId, whyHeld, mktCapPrice):
         """Called when order status changes"""
         logger.info(f"Order status update: Order {orderId} - Status: {status}, Filled: {filled}, Remaining: {remaining}, Avg Fill Price: {avgFillPrice}")
+        metrics.IB_CALLBACKS.inc(callback='orderStatus')
         
         # Store the order status info in a queue for processing
         update = {
@@ -65,7 +91,9 @@ class IBApi(EWrapper, EClient):
             'status': status,
             'filled': filled,
             'remaining': remaining,
-            'avgFillPrice': avgFillPrice
+            'avgFillPrice': avgFillPrice,
+            # IB doesn't timestamp status updates, record when it arrived
+            'time': time.time()
         }
         self.order_status_updates.put(update)
         
@@ -75,12 +103,13 @@ class IBApi(EWrapper, EClient):
     def execDetails(self, reqId, contract, execution):
         """Called when an order is executed"""
         logger.info(f"Execution: Order {execution.orderId} - {execution.shares} shares of {contract.symbol} @ {execution.price}")
+        metrics.IB_CALLBACKS.inc(callback='execDetails')
         
         # Save execution details
         if str(execution.orderId) not in self.execution_details:
             self.execution_details[str(execution.orderId)] = []
         
-        self.execution_details[str(execution.orderId)].append({
+        detail = {
             'executionId': execution.execId,
             'time': execution.time,
             'account': execution.acctNumber,
@@ -90,8 +119,14 @@ class IBApi(EWrapper, EClient):
             'price': execution.price,
             'permId': execution.permId,
             'clientId': execution.clientId,
-            'liquidation': execution.liquidation
-        })
+            'liquidation': execution.liquidation,
+            'cumQty': execution.cumQty,
+            'avgPrice': execution.avgPrice
+        }
+        self.execution_details[str(execution.orderId)].append(detail)
+        
+        # Also queue it for consumers following executions as they arrive
+        self.execution_updates.put(dict(detail, orderId=str(execution.orderId)))
 
 
 class IBConnection:
@@ -0,0 +1,338 @@
+"""
+Continuous order reconciliation (update_orders --daemon).
+
+OrderSyncDaemon keeps one connection to IB Gateway open and follows order
+status and execution events as they arrive. Events are collected by a
+BatchedPersister and written with one bulk_update per flush interval. Every
+diff interval the daemon also requests all open and completed orders and
+the day's executions from IB and diffs them against the open orders in the
+database, to catch events missed while disconnected. Completed orders come
+without their fill price, which the executions carry. A Heartbeat on the same connection records the
+gateway's health for /api/ib/status/.
+
+The session uses the config's sync client ID, so it can stay connected while
+order placement, refreshes and the admin connect with the regular client ID
+(IB refuses a second session with a client ID in use, error 326). IB only
+sends a session the status of its own orders, unless its client ID is the
+gateway's Master API client ID; otherwise the periodic diff picks up the
+orders placed by the other clients.
+"""
+
+import logging
+import queue
+import threading
+import time
+
+from django.db import close_old_connections
+from ibapi.execution import ExecutionFilter
+
+from broker import metrics
+
+from .connection import IBConnection
+from .health import HEARTBEAT_INTERVAL, Heartbeat, record_disconnected
+from .reconcile import OrderReconciler
+
+logger = logging.getLogger(__name__)
+
+# Request ID of the executions requests
+EXECUTIONS_REQUEST_ID = 9001
+
+
+class BatchedPersister:
+    """Collects status and execution events and saves them in bulk"""
+
+    def __init__(self, flush_interval=1.0, batch_size=500, config=None):
+        """
+        Args:
+            flush_interval (float): Most seconds an event waits before it is saved
+            batch_size (int): Events that trigger a flush before the interval is up
+            config (IBConfig): Gateway the events come from
+        """
+        self.config = config
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.events = []
+        self.first_event_at = None
+        self.totals = {'events': 0, 'saved': 0}
+
+    def add(self, kind, event):
+        """Queue a 'status' or 'execution' event"""
+        if not self.events:
+            self.first_event_at = time.monotonic()
+        self.events.append((kind, event))
+
+    def due(self):
+        """Whether the queued events should be flushed now"""
+        return bool(self.events) and (
+            len(self.events) >= self.batch_size
+            or time.monotonic() - self.first_event_at >= self.flush_interval
+        )
+
+    def flush(self):
+        """
+        Apply the queued events to their orders and save the changed ones
+
+        Returns:
+            OrderReconciler: The reconciler used, with the transitions saved
+        """
+        # Events of a failed flush are dropped, the next order diff repairs them
+        events, self.events = self.events, []
+        reconciler = OrderReconciler(config=self.config)
+        if not events:
+            return reconciler
+
+        close_old_connections()
+        reconciler.load(order_ids={str(event['orderId']) for _, event in events})
+        for kind, event in events:
+            if kind == 'execution':
+                reconciler.apply_execution(event)
+            else:
+                reconciler.apply(event)
+        saved = reconciler.save()
+
+        self.totals['events'] += len(events)
+        self.totals['saved'] += saved
+        for (old_status, new_status), count in reconciler.transitions.items():
+            logger.info(f"{count} orders {old_status} -> {new_status}")
+        return reconciler
+
+
+class OrderSnapshot:
+    """Collects the responses to reqAllOpenOrders, reqCompletedOrders and optionally reqExecutions"""
+
+    def __init__(self, executions=False):
+        """
+        Args:
+            executions (bool): Also wait for the end of a reqExecutions request
+                (the executions themselves are kept by IBApi.execution_details)
+        """
+        self.open_orders = {}
+        self.completed_orders = {}
+        self.open_done = threading.Event()
+        self.completed_done = threading.Event()
+        self.executions_done = threading.Event()
+        if not executions:
+            self.executions_done.set()
+        self.requested_at = time.monotonic()
+
+    def done(self):
+        return self.open_done.is_set() and self.completed_done.is_set() and self.executions_done.is_set()
+
+    def attach(self, ib):
+        """Collect the snapshot from the callbacks of a connection"""
+        ib.api.openOrder = self.open_order
+        ib.api.openOrderEnd = self.open_order_end
+        ib.api.completedOrder = self.completed_order
+        ib.api.completedOrdersEnd = self.completed_orders_end
+        ib.api.execDetailsEnd = self.executions_end
+
+    def open_order(self, orderId, contract, order, orderState):
+        self.open_orders[str(orderId)] = {
+            'orderId': str(orderId),
+            'status': orderState.status,
+            'filled': 0,
+            'avgFillPrice': 0,
+        }
+
+    def open_order_end(self):
+        self.open_done.set()
+
+    def completed_order(self, contract, order, orderState):
+        # Orders placed by other sessions can come back without an order ID
+        if order.orderId:
+            filled = order.filledQuantity if 0 < order.filledQuantity < float('inf') else 0
+            self.completed_orders[str(order.orderId)] = {
+                'orderId': str(order.orderId),
+                'status': orderState.status,
+                'filled': float(filled),
+                'avgFillPrice': 0,
+            }
+
+    def completed_orders_end(self):
+        self.completed_done.set()
+
+    def executions_end(self, reqId):
+        self.executions_done.set()
+
+
+def snapshot_updates(snapshot):
+    """
+    Turn an order snapshot into status updates
+
+    Completed orders win over open ones (an order can show up in both while
+    it is being filled).
+
+    Returns:
+        list: Status updates in the format of IBApi.order_status_updates
+    """
+    updates = dict(snapshot.open_orders)
+    updates.update(snapshot.completed_orders)
+    return list(updates.values())
+
+
+def latest_executions(ib, order_ids=None):
+    """
+    The latest execution of every order a connection received executions for
+
+    Returns:
+        list: Executions in the format of IBApi.execution_updates (orderId, cumQty, avgPrice)
+    """
+    executions = []
+    for order_id, details in list(ib.api.execution_details.items()):
+        if details and (order_ids is None or order_id in order_ids):
+            executions.append(dict(max(details, key=lambda detail: detail['cumQty']), orderId=order_id))
+    return executions
+
+
+class OrderSyncDaemon:
+    """Keeps order statuses in the database in sync with IB Gateway"""
+
+    def __init__(self, config, flush_interval=1.0, diff_interval=60, snapshot_timeout=30,
+                 reconnect_delay=5, heartbeat_interval=HEARTBEAT_INTERVAL, connection_class=IBConnection):
+        """
+        Args:
+            config (IBConfig): Gateway to connect to
+            flush_interval (float): Seconds between bulk writes of queued events
+            diff_interval (float): Seconds between full open/completed order diffs
+            snapshot_timeout (float): Seconds to wait for a full order snapshot
+            reconnect_delay (float): Seconds to wait before reconnecting
+            heartbeat_interval (float): Seconds between heartbeats (reqCurrentTime)
+        """
+        self.config = config
+        self.persister = BatchedPersister(flush_interval=flush_interval, config=config)
+        self.diff_interval = diff_interval
+        self.snapshot_timeout = snapshot_timeout
+        self.reconnect_delay = reconnect_delay
+        self.heartbeat_interval = heartbeat_interval
+        self.connection_class = connection_class
+        self.ib = None
+        self.heartbeat = None
+        self.snapshot = None
+        self.last_diff = None
+        self.stop_event = threading.Event()
+
+    def connect(self):
+        """Open the gateway connection and hook up the snapshot callbacks"""
+        ib = self.connection_class(self.config.host, self.config.port, self.config.get_sync_client_id())
+        if not ib.connect():
+            return False
+
+        # Snapshot callbacks go to the snapshot being collected, if any
+        def forward(handler):
+            def callback(*args):
+                if self.snapshot is not None:
+                    getattr(self.snapshot, handler)(*args)
+            return callback
+
+        ib.api.openOrder = forward('open_order')
+        ib.api.openOrderEnd = forward('open_order_end')
+        ib.api.completedOrder = forward('completed_order')
+        ib.api.completedOrdersEnd = forward('completed_orders_end')
+        ib.api.execDetailsEnd = forward('executions_end')
+
+        self.ib = ib
+        self.heartbeat = Heartbeat(self.config, ib, interval=self.heartbeat_interval)
+        self.snapshot = None
+        # Diff right away to catch up with anything missed while disconnected
+        self.last_diff = None
+        return True
+
+    def request_snapshot(self):
+        """Ask IB for all open and completed orders and the day's executions"""
+        self.snapshot = OrderSnapshot(executions=True)
+        self.ib.api.reqAllOpenOrders()
+        self.ib.api.reqCompletedOrders(False)
+        self.ib.api.reqExecutions(EXECUTIONS_REQUEST_ID, ExecutionFilter())
+        self.last_diff = time.monotonic()
+
+    def apply_snapshot(self, snapshot):
+        """Diff a complete order snapshot against the open orders in the database"""
+        # Pending events first, so the snapshot is applied on top of them
+        self.persister.flush()
+
+        close_old_connections()
+        reconciler = OrderReconciler(config=self.config)
+        reconciler.load()
+        for update in snapshot_updates(snapshot):
+            reconciler.apply(update)
+        # Completed orders come without their fill price
+        for execution in latest_executions(self.ib):
+            reconciler.apply_execution(execution)
+        saved = reconciler.save()
+        logger.info(f"Order diff: {len(snapshot.open_orders)} open and {len(snapshot.completed_orders)} "
+                    f"completed orders at IB, {saved} orders corrected")
+        return reconciler
+
+    def step(self, timeout=0.2):
+        """Consume the events that arrived, then flush or diff when due"""
+        api = self.ib.api
+        try:
+            self.persister.add('status', api.order_status_updates.get(timeout=timeout))
+        except queue.Empty:
+            pass
+        while True:
+            try:
+                self.persister.add('status', api.order_status_updates.get_nowait())
+            except queue.Empty:
+                break
+        while True:
+            try:
+                self.persister.add('execution', api.execution_updates.get_nowait())
+            except queue.Empty:
+                break
+
+        if self.persister.due():
+            self.persister.flush()
+
+        if self.snapshot is not None:
+            if self.snapshot.done():
+                snapshot, self.snapshot = self.snapshot, None
+                self.apply_snapshot(snapshot)
+            elif time.monotonic() - self.snapshot.requested_at > self.snapshot_timeout:
+                logger.warning("Timed out waiting for the open/completed order snapshot")
+                self.snapshot = None
+        elif self.last_diff is None or time.monotonic() - self.last_diff >= self.diff_interval:
+            self.request_snapshot()
+
+        self.heartbeat.tick()
+        self.record_backlog()
+
+    def record_backlog(self):
+        """Update the gauges of messages and events waiting to be processed"""
+        api = self.ib.api
+        metrics.IB_READER_BACKLOG.set(api.msg_queue.qsize(), config=self.config.pk)
+        metrics.IB_PENDING_EVENTS.set(
+            len(self.persister.events) + api.order_status_updates.qsize() + api.execution_updates.qsize(),
+            config=self.config.pk
+        )
+
+    def run(self):
+        """Sync until stop() is called, reconnecting whenever the connection drops"""
+        try:
+            while not self.stop_event.is_set():
+                if self.ib is None or not self.ib.is_connected():
+                    if self.ib is not None:
+                        logger.warning("Lost connection to IB Gateway, reconnecting")
+                        record_disconnected(self.config, "Lost connection")
+                        self.ib.disconnect()
+                        self.ib = None
+                    if not self.connect():
+                        logger.error(f"Failed to connect to IB Gateway at {self.config.host}:{self.config.port}")
+                        record_disconnected(self.config, "Failed to connect")
+                        self.stop_event.wait(self.reconnect_delay)
+                        continue
+                    logger.info(f"Following order events from {self.config.host}:{self.config.port}")
+
+                try:
+                    self.step()
+                except Exception as e:
+                    logger.error(f"Error syncing orders: {str(e)}")
+                    self.stop_event.wait(self.reconnect_delay)
+        finally:
+            self.persister.flush()
+            if self.ib is not None:
+                self.ib.disconnect()
+                record_disconnected(self.config, "Sync daemon stopped")
+
+    def stop(self):
+        self.stop_event.set()
@@ -0,0 +1,137 @@
+"""
+Gateway health from a background heartbeat.
+
+The update_orders daemon holds one session per gateway. Its Heartbeat sends
+reqCurrentTime over that session every HEARTBEAT_INTERVAL seconds and
+records whether the gateway answered, the round trip, the age of the last
+message from IB and the errors IB reported, in the shared 'orders' cache.
+/api/ib/status/ and the readiness check read that record instead of opening
+a new IB session.
+"""
+
+import logging
+import time
+
+from .cache import get_order_cache
+
+logger = logging.getLogger(__name__)
+
+# Seconds between heartbeats
+HEARTBEAT_INTERVAL = 10
+
+# Seconds to wait for the answer to a heartbeat
+HEARTBEAT_TIMEOUT = 5
+
+# A health record not updated for this many seconds is stale (the daemon isn't running)
+HEALTH_STALE_AFTER = 3 * HEARTBEAT_INTERVAL
+
+
+def health_cache_key(config_id):
+    return f"ib-health:{config_id}"
+
+
+def record_health(config, **state):
+    """Store the health of a gateway, stamped with the current time"""
+    health = dict(state, updated_at=time.time())
+    # Kept a little past stale, so a stopped daemon shows up as stale rather than unknown
+    get_order_cache().set(health_cache_key(config.pk), health, HEALTH_STALE_AFTER * 10)
+    return health
+
+
+def gateway_health(config, now=None):
+    """
+    Last recorded health of a gateway
+
+    Returns:
+        dict: The recorded state with its age and stale flag, or None if nothing was recorded
+    """
+    health = get_order_cache().get(health_cache_key(config.pk))
+    if health is None:
+        return None
+    now = time.time() if now is None else now
+    age = now - health['updated_at']
+    return dict(health, age=round(age, 3), stale=age > HEALTH_STALE_AFTER)
+
+
+def is_healthy(health):
+    """Whether a gateway_health() record shows a live, answering gateway"""
+    return bool(health) and not health['stale'] and health['connected'] and health['responding']
+
+
+class Heartbeat:
+    """Sends reqCurrentTime over a session and records the gateway's health"""
+
+    def __init__(self, config, ib, interval=HEARTBEAT_INTERVAL, timeout=HEARTBEAT_TIMEOUT, clock=time.time):
+        """
+        Args:
+            config (IBConfig): Gateway of the session
+            ib (IBConnection): Connected session
+            interval (float): Seconds between heartbeats
+            timeout (float): Seconds to wait for an answer before the gateway counts as not responding
+        """
+        self.config = config
+        self.ib = ib
+        self.interval = interval
+        self.timeout = timeout
+        self.clock = clock
+        self.sent_at = None
+        self.latency = None
+        self.responding = True
+        self.missed = 0
+
+    def tick(self):
+        """Send a heartbeat when one is due and record the answer to the last one"""
+        now = self.clock()
+        api = self.ib.api
+        if self.sent_at is not None:
+            if api.server_time_received_at is not None and api.server_time_received_at >= self.sent_at:
+                self.latency = api.server_time_received_at - self.sent_at
+                self.responding = True
+                self.sent_at = None
+                self.record()
+            elif now - self.sent_at > self.timeout:
+                logger.warning(f"No heartbeat answer from IB Gateway at {self.config.host}:{self.config.port} "
+                               f"within {self.timeout}s")
+                self.responding = False
+                self.missed += 1
+                self.sent_at = None
+                self.record()
+            return
+
+        last = self.ib.api.server_time_received_at
+        if last is None or now - last >= self.interval:
+            self.sent_at = now
+            api.reqCurrentTime()
+            # Stamp the record between answers too, so it doesn't look stale
+            self.record()
+
+    def record(self, **extra):
+        """Record the session's current health"""
+        api = self.ib.api
+        return record_health(
+            self.config,
+            connected=self.ib.is_connected(),
+            responding=self.responding,
+            latency_ms=round(self.latency * 1000, 1) if self.latency is not None else None,
+            last_message_at=api.last_message_at,
+            server_time=api.server_time,
+            missed_heartbeats=self.missed,
+            error_counts={str(code): count for code, count in api.error_counts.items()},
+            **extra
+        )
+
+
+def record_disconnected(config, error):
+    """Record that the daemon can't reach a gateway"""
+    previous = get_order_cache().get(health_cache_key(config.pk)) or {}
+    return record_health(
+        config,
+        connected=False,
+        responding=False,
+        latency_ms=None,
+        last_message_at=previous.get('last_message_at'),
+        server_time=previous.get('server_time'),
+        missed_heartbeats=previous.get('missed_heartbeats', 0),
+        error_counts=previous.get('error_counts', {}),
+        error=error,
+    )
@@ -0,0 +1,163 @@
+"""
+Data behind the admin's live orders page.
+
+fetch_live_orders() sends the open orders and executions requests together
+over one connection and returns as soon as IB has sent the end marker of
+both (openOrderEnd, execDetailsEnd). The result is stored per user in the
+'orders' cache; the page then loads it a page at a time, sorted on the
+server, and an order's executions only when they are opened.
+"""
+
+import threading
+import time
+
+from ibapi.execution import ExecutionFilter
+
+from .cache import get_order_cache
+
+# Seconds a fetched snapshot is kept for paging through it
+LIVE_ORDERS_TIMEOUT = 15 * 60
+
+# Request ID of the executions request
+EXECUTIONS_REQUEST_ID = 1
+
+LIVE_PAGE_SIZE = 50
+MAX_LIVE_PAGE_SIZE = 500
+
+ORDER_SORT_FIELDS = ('orderId', 'symbol', 'action', 'quantity', 'orderType', 'status', 'filled', 'remaining',
+                     'avgFillPrice', 'executions')
+EXECUTION_SORT_FIELDS = ('orderId', 'execId', 'time', 'symbol', 'side', 'shares', 'price', 'exchange', 'account')
+
+
+def fetch_live_orders(ib, client_id=None, timeout=10):
+    """
+    Get the open orders and executions of a connected gateway
+
+    Both requests are sent right away and the call returns once both end
+    markers arrived, or after timeout seconds with what arrived so far.
+
+    Args:
+        ib (IBConnection): Connected gateway session
+        client_id (int): Only executions of orders placed by this client
+        timeout (float): Most seconds to wait for both answers
+
+    Returns:
+        tuple: (open orders, executions, complete), complete being False on timeout
+    """
+    orders = []
+    executions = []
+    orders_done = threading.Event()
+    executions_done = threading.Event()
+
+    def handle_open_order(orderId, contract, order, orderState):
+        orders.append({
+            'orderId': orderId,
+            'symbol': contract.symbol,
+            'secType': contract.secType,
+            'exchange': contract.exchange,
+            'currency': contract.currency,
+            'action': order.action,
+            'quantity': float(order.totalQuantity),
+            'orderType': order.orderType,
+            'status': orderState.status,
+            'account': order.account,
+        })
+
+    def handle_exec_details(reqId, contract, execution):
+        executions.append({
+            'orderId': execution.orderId,
+            'execId': execution.execId,
+            'time': execution.time,
+            'symbol': contract.symbol,
+            'secType': contract.secType,
+            'exchange': execution.exchange,
+            'side': execution.side,
+            'shares': float(execution.shares),
+            'price': execution.price,
+            'account': execution.acctNumber,
+        })
+
+    ib.api.openOrder = handle_open_order
+    ib.api.openOrderEnd = orders_done.set
+    ib.api.execDetails = handle_exec_details
+    ib.api.execDetailsEnd = lambda reqId: executions_done.set()
+
+    exec_filter = ExecutionFilter()
+    if client_id is not None:
+        exec_filter.clientId = client_id
+    ib.api.reqOpenOrders()
+    ib.api.reqExecutions(EXECUTIONS_REQUEST_ID, exec_filter)
+
+    deadline = time.monotonic() + timeout
+    complete = orders_done.wait(timeout) and executions_done.wait(max(0, deadline - time.monotonic()))
+
+    # Fill and average price come with the orderStatus callbacks that follow each openOrder
+    executions_per_order = {}
+    for execution in executions:
+        executions_per_order[execution['orderId']] = executions_per_order.get(execution['orderId'], 0) + 1
+    for order in orders:
+        status = ib.api.order_states.get(str(order['orderId']), {})
+        order['filled'] = float(status.get('filled', 0))
+        order['remaining'] = float(status.get('remaining', order['quantity'] - order['filled']))
+        order['avgFillPrice'] = float(status.get('avgFillPrice', 0))
+        order['executions'] = executions_per_order.get(order['orderId'], 0)
+    return orders, executions, complete
+
+
+def live_orders_key(user_id):
+    return f"live-orders:{user_id}"
+
+
+def store_live_orders(user_id, orders, executions):
+    """Keep a fetched snapshot for the user to page through"""
+    get_order_cache().set(live_orders_key(user_id), {
+        'orders': orders,
+        'executions': executions,
+        'refresh_time': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }, LIVE_ORDERS_TIMEOUT)
+
+
+def load_live_orders(user_id):
+    """The user's last fetched snapshot, or None"""
+    return get_order_cache().get(live_orders_key(user_id))
+
+
+def _sort_key(value):
+    """Numbers before text before empty values, so mixed columns still sort"""
+    if value is None or value == '':
+        return (2, 0)
+    if isinstance(value, (int, float)):
+        return (0, value)
+    return (1, str(value))
+
+
+def live_page(rows, sort_fields, sort=None, direction='asc', page=1, limit=LIVE_PAGE_SIZE):
+    """
+    One sorted page of rows
+
+    Args:
+        rows (list): Row dicts
+        sort_fields (tuple): Fields rows may be sorted by
+        sort (str): Field to sort by (ignored unless in sort_fields)
+        direction (str): 'asc' or 'desc'
+        page (int): Page number, from 1
+        limit (int): Rows per page (at most MAX_LIVE_PAGE_SIZE)
+
+    Returns:
+        dict: rows, total, page, pages, sort and direction
+    """
+    limit = max(1, min(limit, MAX_LIVE_PAGE_SIZE))
+    if sort in sort_fields:
+        rows = sorted(rows, key=lambda row: _sort_key(row.get(sort)), reverse=(direction == 'desc'))
+    else:
+        sort = None
+    pages = max(1, -(-len(rows) // limit))
+    page = max(1, min(page, pages))
+    return {
+        'rows': rows[(page - 1) * limit:page * limit],
+        'total': len(rows),
+        'page': page,
+        'pages': pages,
+        'sort': sort,
+        'direction': direction,
+    }
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from ib_gateway.models import OrderCount
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Reset the running order total of the orders API to an exact count'
+    
+    def handle(self, *args, **options):
+        before = OrderCount.objects.values_list('total', flat=True).first()
+        total = OrderCount.recount()
+        if before != total:
+            logger.warning(f"Running order total was {before}, corrected to {total}")
+            self.stdout.write(self.style.WARNING(f"Corrected the running order total from {before} to {total}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Running order total is correct: {total}"))
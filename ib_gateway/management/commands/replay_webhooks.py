@@ -0,0 +1,159 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from ib_gateway.coalesce import get_coalesce_window
+from ib_gateway.configs import default_config
+from ib_gateway.pipeline import parse_signal
+from ib_gateway.replay import init_worker, partition_of, process_chunk, replayable_webhooks
+import concurrent.futures
+import datetime
+import logging
+import multiprocessing
+import os
+import statistics
+import time
+
+logger = logging.getLogger(__name__)
+
+def _parse_time(value, end_of_day=False):
+    """Parse an ISO date or datetime argument"""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Invalid date or datetime: {value}")
+        parsed = datetime.datetime.combine(day, datetime.time.max if end_of_day else datetime.time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, datetime.timezone.utc)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = ('Replay stored webhooks through the order pipeline in parallel, against a simulated gateway '
+            'unless --live is given')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--since', required=True, help='Start of the time range (ISO date or datetime)')
+        parser.add_argument('--until', help='End of the time range (default: now)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Number of worker processes')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Webhooks read and dispatched per chunk')
+        parser.add_argument('--live', action='store_true',
+                            help='Place real orders through the default IB Gateway and keep them '
+                                 '(default: simulated gateway, all database writes rolled back)')
+        parser.add_argument('--yes', action='store_true', help='Place live orders without asking for confirmation')
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive',
+                            help='Never prompt; --live then needs --yes')
+        parser.add_argument('--include-processed', action='store_true',
+                            help='Also replay webhooks that were already turned into an order or netted out')
+        parser.add_argument('--wait', type=int, default=5, help='Seconds to wait for each order status')
+        parser.add_argument('--coalesce-ms', type=int,
+                            help='Net signals per symbol and account over this window (default: ORDER_COALESCE_WINDOW_MS)')
+    
+    def handle(self, *args, **options):
+        since = _parse_time(options['since'])
+        until = _parse_time(options['until'], end_of_day=True) if options.get('until') else timezone.now()
+        workers = max(1, options['workers'])
+        chunk_size = max(1, options['chunk_size'])
+        dry_run = not options['live']
+        window = get_coalesce_window() if options['coalesce_ms'] is None else max(0, options['coalesce_ms']) / 1000
+        
+        gateway = {'host': None, 'port': None, 'client_id': 100, 'config_id': None}
+        if not dry_run:
+            # Replayed orders go through the default gateway
+            config = default_config()
+            if not config:
+                raise CommandError("No active IB Gateway configuration found")
+            gateway = {'host': config.host, 'port': config.port, 'client_id': config.client_id + 1,
+                       'config_id': config.id}
+            
+        webhooks = replayable_webhooks(since, until, options['include_processed'])
+        rows = webhooks.values_list('id', 'payload', 'received_at').iterator(chunk_size=chunk_size)
+        
+        if not dry_run and not options['yes']:
+            if not options['interactive']:
+                raise CommandError("Live replay places real orders, pass --yes to confirm")
+            answer = input(f"Place LIVE orders for {webhooks.count()} webhooks through "
+                           f"{gateway['host']}:{gateway['port']}? Type 'yes' to continue: ")
+            if answer.strip().lower() != 'yes':
+                raise CommandError("Live replay cancelled")
+        
+        mode = "dry run (simulated gateway)" if dry_run else f"live ({gateway['host']}:{gateway['port']})"
+        self.stdout.write(self.style.NOTICE(f"Replaying webhooks from {since} to {until} with {workers} workers, {mode}"))
+        if window:
+            self.stdout.write(self.style.NOTICE(f"Coalescing signals per symbol over {window * 1000:.0f} ms windows"))
+        
+        totals = {'placed': 0, 'coalesced': 0, 'skipped': 0, 'failed': 0}
+        latencies = []
+        
+        # Workers open their own database connections
+        connections.close_all()
+        context = multiprocessing.get_context('spawn')
+        worker_counter = context.Value('i', 0)
+        
+        start_time = time.perf_counter()
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=init_worker,
+            initargs=(dry_run, gateway, worker_counter, options['wait'], window)
+        ) as executor:
+            # Signals are split into one partition per worker by account and symbol.
+            # A partition has at most one chunk running, so its signals are placed in order.
+            partitions = [[] for _ in range(workers)]
+            running = {}
+            buffered = 0
+            
+            def dispatch(partition):
+                nonlocal buffered
+                chunk = partitions[partition][:chunk_size]
+                if chunk and partition not in running:
+                    running[partition] = executor.submit(process_chunk, chunk)
+                    del partitions[partition][:chunk_size]
+                    buffered -= len(chunk)
+            
+            def wait_any():
+                done, _ = concurrent.futures.wait(running.values(), return_when=concurrent.futures.FIRST_COMPLETED)
+                for partition, future in list(running.items()):
+                    if future in done:
+                        del running[partition]
+                        result = future.result()
+                        for key in totals:
+                            totals[key] += result[key]
+                        latencies.extend(result['latencies'])
+                for partition in range(workers):
+                    dispatch(partition)
+                    
+            for row in rows:
+                signal = parse_signal(row[1])
+                if signal is None:
+                    totals['skipped'] += 1
+                    continue
+                partition = partition_of(signal, workers)
+                partitions[partition].append(row)
+                buffered += 1
+                if len(partitions[partition]) >= chunk_size:
+                    dispatch(partition)
+                # Bound the number of rows held in memory
+                while buffered >= workers * chunk_size * 2 and running:
+                    wait_any()
+            for partition in range(workers):
+                dispatch(partition)
+            while running:
+                wait_any()
+        elapsed = time.perf_counter() - start_time
+        
+        processed = sum(totals.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {processed} webhooks in {elapsed:.2f}s: "
+            f"{totals['placed']} orders placed, {totals['coalesced']} signals coalesced, "
+            f"{totals['skipped']} not order signals, {totals['failed']} failed"
+        ))
+        if elapsed > 0:
+            self.stdout.write(self.style.SUCCESS(f"Throughput: {processed / elapsed:.1f} webhooks/s"))
+        if len(latencies) >= 2:
+            cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+            self.stdout.write(self.style.SUCCESS(
+                f"Latency per order: p50 {cuts[49] * 1000:.1f} ms, p90 {cuts[89] * 1000:.1f} ms, "
+                f"p99 {cuts[98] * 1000:.1f} ms, max {max(latencies) * 1000:.1f} ms"
+            ))
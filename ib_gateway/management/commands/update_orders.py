@@ -1,10 +1,14 @@
 from django.core.management.base import BaseCommand
-from ib_gateway.models import IBConfig, Order
+from ib_gateway.configs import active_configs, config_for_account, config_for_order, run_per_config
+from ib_gateway.models import Order
 from ib_gateway.connection import IBConnection
-from ib_gateway.views import map_ib_status
+from ib_gateway.pipeline import save_order_status
+from ib_gateway.daemon import OrderSyncDaemon
+from ib_gateway.reconcile import OrderReconciler
+import queue
+import signal
 import time
 import logging
-import decimal
 
 logger = logging.getLogger(__name__)
 
@@ -13,136 +17,166 @@ class Command(BaseCommand):
     
     def add_arguments(self, parser):
         parser.add_argument('--order-id', type=str, help='Specific order ID to update')
+        parser.add_argument('--account', type=str,
+                            help='Account of the --order-id order, to pick its gateway (order IDs are unique per gateway)')
         parser.add_argument('--all', action='store_true', help='Update all open orders')
         parser.add_argument('--wait', type=int, default=5, help='Time to wait for updates in seconds')
+        parser.add_argument('--daemon', action='store_true',
+                            help='Keep running and follow order events on a persistent connection')
+        parser.add_argument('--flush-interval', type=float, default=1.0,
+                            help='Daemon: seconds between bulk writes of order events')
+        parser.add_argument('--diff-interval', type=float, default=60,
+                            help='Daemon: seconds between full diffs against open and completed orders at IB')
     
     def handle(self, *args, **options):
         order_id = options.get('order_id')
         update_all = options.get('all')
         wait_time = options.get('wait')
         
-        if not (order_id or update_all):
-            self.stdout.write(self.style.ERROR("Please specify --order-id or --all"))
+        if not (order_id or update_all or options['daemon']):
+            self.stdout.write(self.style.ERROR("Please specify --order-id, --all or --daemon"))
             return
             
-        # Get the active configuration
-        config = IBConfig.objects.filter(is_active=True).first()
-        if not config:
+        if order_id:
+            # Update a specific order through its own gateway
+            orders = Order.objects.with_order_id(order_id)
+            if options.get('account'):
+                orders = orders.filter(config=config_for_account(options['account']))
+            try:
+                order = orders.get()
+            except Order.DoesNotExist:
+                self.stdout.write(self.style.ERROR(f"Order with ID {order_id} not found"))
+                return
+            except Order.MultipleObjectsReturned:
+                self.stdout.write(self.style.ERROR(f"Order ID {order_id} was used on several gateways, pass --account"))
+                return
+            config = config_for_order(order)
+            configs = [config] if config else []
+        else:
+            configs = active_configs()
+            
+        if not configs:
             self.stdout.write(self.style.ERROR("No active IB Gateway configuration found"))
             return
             
-        # Connect to IB Gateway
+        if options['daemon']:
+            self.run_daemons(configs, options['flush_interval'], options['diff_interval'])
+            return
+            
+        if order_id:
+            self.sync_gateway(configs[0], lambda ib: self.update_order(ib, order, wait_time))
+        else:
+            # Sync every gateway at the same time
+            run_per_config(lambda config: self.sync_gateway(
+                config, lambda ib: self.update_all_orders(ib, wait_time, config)
+            ), configs)
+            
+    def sync_gateway(self, config, sync):
+        """Connect to a gateway, run sync(ib) and disconnect"""
         self.stdout.write(self.style.NOTICE(f"Connecting to IB Gateway at {config.host}:{config.port}"))
         ib = IBConnection(config.host, config.port, config.client_id)
         if not ib.connect():
-            self.stdout.write(self.style.ERROR("Failed to connect to IB Gateway"))
+            self.stdout.write(self.style.ERROR(f"Failed to connect to IB Gateway at {config.host}:{config.port}"))
             return
             
         try:
-            if order_id:
-                # Update a specific order
-                self.update_order(ib, order_id, wait_time)
-            elif update_all:
-                # Update all open orders
-                self.update_all_orders(ib, wait_time)
+            sync(ib)
         finally:
             # Disconnect from IB Gateway
             ib.disconnect()
-            self.stdout.write(self.style.SUCCESS("Disconnected from IB Gateway"))
+            self.stdout.write(self.style.SUCCESS(f"Disconnected from IB Gateway at {config.host}:{config.port}"))
             
-    def update_order(self, ib, order_id, wait_time):
+    def run_daemons(self, configs, flush_interval, diff_interval):
+        """Sync order statuses of every gateway continuously until SIGTERM or SIGINT"""
+        daemons = [
+            OrderSyncDaemon(config, flush_interval=flush_interval, diff_interval=diff_interval)
+            for config in configs
+        ]
+        
+        def stop(signum, frame):
+            self.stdout.write(self.style.NOTICE("Stopping order sync"))
+            for daemon in daemons:
+                daemon.stop()
+                
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        
+        for config in configs:
+            self.stdout.write(self.style.NOTICE(
+                f"Syncing orders from {config.host}:{config.port} "
+                f"(flush every {flush_interval}s, full diff every {diff_interval}s)"
+            ))
+        # One thread per gateway
+        run_per_config(lambda config: daemons[configs.index(config)].run(), configs)
+        
+        events = sum(daemon.persister.totals['events'] for daemon in daemons)
+        saved = sum(daemon.persister.totals['saved'] for daemon in daemons)
+        self.stdout.write(self.style.SUCCESS(f"Processed {events} order events, saved {saved} order updates"))
+        
+    def update_order(self, ib, order, wait_time):
         """Update a specific order"""
-        try:
-            order = Order.objects.get(order_id=order_id)
-            self.stdout.write(self.style.NOTICE(f"Updating order {order_id} - {order.action} {order.quantity} {order.symbol}"))
+        order_id = order.order_id
+        self.stdout.write(self.style.NOTICE(f"Updating order {order_id} - {order.action} {order.quantity} {order.symbol}"))
+        
+        # Check order status
+        order_status = ib.get_order_status(order_id)
+        if not order_status:
+            # Wait for a status update
+            self.stdout.write(self.style.NOTICE(f"Waiting for order status updates (up to {wait_time} seconds)"))
+            order_status = ib.wait_for_order_status(order_id, timeout=wait_time)
             
-            # Check order status
-            order_status = ib.get_order_status(order_id)
-            if not order_status:
-                # Wait for a status update
-                self.stdout.write(self.style.NOTICE(f"Waiting for order status updates (up to {wait_time} seconds)"))
-                order_status = ib.wait_for_order_status(order_id, timeout=wait_time)
-                
-            if order_status:
-                self.stdout.write(self.style.SUCCESS(f"Received order status: {order_status}"))
-                # Update the order in the database
-                status_name = map_ib_status(order_status['status'])
-                old_status = order.status
-                order.status = status_name
-                
-                if order_status['filled'] > 0:
-                    order.filled_quantity = decimal.Decimal(order_status['filled'])
-                    
-                if order_status['avgFillPrice'] > 0:
-                    order.avg_fill_price = decimal.Decimal(order_status['avgFillPrice'])
-                    
-                order.save()
-                
-                if old_status != status_name:
-                    self.stdout.write(self.style.SUCCESS(f"Order status changed from {old_status} to {status_name}"))
-            else:
-                self.stdout.write(self.style.WARNING(f"No status updates received for order {order_id}"))
-                
-        except Order.DoesNotExist:
-            self.stdout.write(self.style.ERROR(f"Order with ID {order_id} not found"))
+        if order_status:
+            self.stdout.write(self.style.SUCCESS(f"Received order status: {order_status}"))
+            # Update the order in the database
+            old_status = order.status
+            if not save_order_status(order, order_status):
+                self.stdout.write(self.style.NOTICE(f"Order {order_id} is already up to date"))
+            elif old_status != order.status:
+                self.stdout.write(self.style.SUCCESS(f"Order status changed from {old_status} to {order.status}"))
+        else:
+            self.stdout.write(self.style.WARNING(f"No status updates received for order {order_id}"))
             
-    def update_all_orders(self, ib, wait_time):
-        """Update all open orders"""
-        # Get all orders that are not in a final state
-        open_statuses = ['PENDING', 'SUBMITTED', 'ACCEPTED']
-        open_orders = Order.objects.filter(status__in=open_statuses)
+    def update_all_orders(self, ib, wait_time, config=None):
+        """Update all open orders of a gateway in one set-based pass"""
+        reconciler = OrderReconciler(config=config)
+        open_orders = reconciler.load()
         
         if not open_orders:
             self.stdout.write(self.style.NOTICE("No open orders to update"))
             return
             
-        self.stdout.write(self.style.NOTICE(f"Updating {open_orders.count()} open orders"))
+        self.stdout.write(self.style.NOTICE(f"Updating {len(open_orders)} open orders"))
         
-        # Request real-time updates for orders
+        # Ask IB to report the status of every open order
+        ib.api.reqAllOpenOrders()
         self.stdout.write(self.style.NOTICE(f"Waiting for order status updates (up to {wait_time} seconds)"))
         
         start_time = time.time()
-        updated_orders = set()
+        seen = set()
         
-        # Let some updates come in
-        while time.time() - start_time < wait_time:
+        # Apply updates in memory as they come in, until every open order has reported
+        while time.time() - start_time < wait_time and not seen.issuperset(open_orders):
             try:
-                # Process updates from the queue
-                if ib.api.order_status_updates.empty():
-                    time.sleep(0.5)
-                    continue
-                    
-                update = ib.api.order_status_updates.get(block=False)
-                order_id = update['orderId']
+                update = ib.api.order_status_updates.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            seen.add(update['orderId'])
+            reconciler.apply(update)
+            
+        # Orders without a queued update may still have a known status
+        for order_id in open_orders.keys() - seen:
+            order_status = ib.get_order_status(order_id)
+            if order_status:
+                seen.add(order_id)
+                reconciler.apply(order_status)
                 
-                try:
-                    order = Order.objects.get(order_id=order_id)
-                    updated_orders.add(order_id)
-                    
-                    # Update the order in the database
-                    status_name = map_ib_status(update['status'])
-                    old_status = order.status
-                    order.status = status_name
-                    
-                    if update['filled'] > 0:
-                        order.filled_quantity = decimal.Decimal(update['filled'])
-                        
-                    if update['avgFillPrice'] > 0:
-                        order.avg_fill_price = decimal.Decimal(update['avgFillPrice'])
-                        
-                    order.save()
-                    
-                    if old_status != status_name:
-                        self.stdout.write(self.style.SUCCESS(f"Order {order_id} status changed from {old_status} to {status_name}"))
-                        
-                except Order.DoesNotExist:
-                    self.stdout.write(self.style.WARNING(f"Received update for unknown order {order_id}"))
-                    
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f"Error processing update: {str(e)}"))
+        saved = reconciler.save()
         
-        # Check any orders that didn't get updates
-        for order in open_orders:
-            if order.order_id not in updated_orders:
-                self.stdout.write(self.style.NOTICE(f"No updates received for order {order.order_id}, checking status directly"))
-                self.update_order(ib, order.order_id, 1)  # Quick check 
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS(f"Saved {saved} changed orders with a bulk update"))
+        for (old_status, new_status), count in sorted(reconciler.transitions.items()):
+            self.stdout.write(self.style.SUCCESS(f"  {old_status} -> {new_status}: {count}"))
+        missing = len(open_orders.keys() - seen)
+        if missing:
+            self.stdout.write(self.style.WARNING(f"No status received for {missing} open orders"))
+        if reconciler.unknown:
+            self.stdout.write(self.style.WARNING(f"Received updates for {len(reconciler.unknown)} unknown or closed orders"))
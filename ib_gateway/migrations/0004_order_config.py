@@ -0,0 +1,44 @@
+# Generated by Django 5.0.2 on 2026-10-19 00:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def assign_default_config(apps, schema_editor):
+    """Existing orders were all placed through the first active gateway"""
+    IBConfig = apps.get_model('ib_gateway', 'IBConfig')
+    Order = apps.get_model('ib_gateway', 'Order')
+    config = IBConfig.objects.filter(is_active=True).order_by('id').first()
+    if config:
+        Order.objects.filter(config__isnull=True).update(config=config)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('broker', '0004_webhook_indexes'),
+        ('ib_gateway', '0003_order_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ibconfig',
+            name='account',
+            field=models.CharField(blank=True, default='', help_text='IB account traded through this gateway (orders for it are routed here)', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='account',
+            field=models.CharField(blank=True, default='', help_text='IB account', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='config',
+            field=models.ForeignKey(blank=True, help_text='Gateway the order was placed through', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='ib_gateway.ibconfig'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['config', 'status'], name='order_config_status_idx'),
+        ),
+        migrations.RunPython(assign_default_config, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.0.2 on 2026-10-19 00:40
+
+from django.db import migrations, models
+
+
+def seed_order_count(apps, schema_editor):
+    """Start the running total at the current number of orders"""
+    Order = apps.get_model('ib_gateway', 'Order')
+    OrderCount = apps.get_model('ib_gateway', 'OrderCount')
+    OrderCount.objects.create(pk=1, total=Order.objects.count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('broker', '0004_webhook_indexes'),
+        ('ib_gateway', '0004_order_config'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Order Count',
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_status_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_symbol_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='order_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['symbol', 'created_at', 'id'], name='order_symbol_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at', 'id'], name='order_created_idx'),
+        ),
+        migrations.RunPython(seed_order_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.0.2 on 2026-10-19 00:44
+
+import itertools
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def record_current_state(apps, schema_editor):
+    """Start the history of existing orders with their current state"""
+    Order = apps.get_model('ib_gateway', 'Order')
+    OrderEvent = apps.get_model('ib_gateway', 'OrderEvent')
+    events = (
+        OrderEvent(order_id=order.pk, kind='CREATED', status=order.status, filled_quantity=order.filled_quantity,
+                   avg_fill_price=order.avg_fill_price, ib_time=order.updated_at)
+        for order in Order.objects.iterator(chunk_size=2000)
+    )
+    while True:
+        batch = list(itertools.islice(events, 2000))
+        if not batch:
+            break
+        OrderEvent.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ib_gateway', '0005_order_keyset'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('CREATED', 'Created'), ('STATUS', 'Status update'), ('EXECUTION', 'Execution')], help_text='What reported the change', max_length=10)),
+                ('status', models.CharField(choices=[('SUBMITTED', 'Submitted'), ('ACCEPTED', 'Accepted'), ('FILLED', 'Filled'), ('CANCELLED', 'Cancelled'), ('REJECTED', 'Rejected'), ('PENDING', 'Pending')], help_text='Order status after the change', max_length=20)),
+                ('filled_quantity', models.DecimalField(decimal_places=5, default=0, help_text='Quantity filled after the change', max_digits=15)),
+                ('avg_fill_price', models.DecimalField(blank=True, decimal_places=5, help_text='Average fill price after the change', max_digits=15, null=True)),
+                ('ib_time', models.DateTimeField(help_text='When IB reported the change (execution time, or when the update was received)')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(help_text='Order that changed', on_delete=django.db.models.deletion.CASCADE, related_name='events', to='ib_gateway.order')),
+            ],
+            options={
+                'verbose_name': 'IB Order Event',
+                'verbose_name_plural': 'IB Order Events',
+                'ordering': ['ib_time', 'id'],
+                'indexes': [models.Index(fields=['order', 'ib_time', 'id'], name='orderevent_order_time_idx')],
+            },
+        ),
+        migrations.RunPython(record_current_state, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-19 00:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ib_gateway', '0006_order_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='version',
+            field=models.PositiveIntegerField(default=0, help_text='Bumped by every status or fill update (compare-and-swap)'),
+        ),
+    ]
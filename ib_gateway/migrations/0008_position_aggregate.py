@@ -0,0 +1,75 @@
+# Generated by Django 5.0.2 on 2026-10-19 00:51
+
+import decimal
+
+from django.db import migrations, models
+
+# Copy of ib_gateway.positions.apply_fill as of this migration, so later
+# changes to the app code don't change what this migration does
+QUANTUM = decimal.Decimal('0.00001')
+
+
+def apply_fill(position, quantity, price):
+    """Apply a fill to a position with the average cost method (without saving)"""
+    held = position.quantity
+    if held == 0 or (held > 0) == (quantity > 0):
+        position.avg_cost = ((position.avg_cost * abs(held) + price * abs(quantity)) / abs(held + quantity)).quantize(QUANTUM)
+    else:
+        closed = min(abs(quantity), abs(held))
+        direction = 1 if held > 0 else -1
+        position.realized_pnl = (position.realized_pnl + closed * (price - position.avg_cost) * direction).quantize(QUANTUM)
+        if abs(quantity) > abs(held):
+            position.avg_cost = price
+        elif abs(quantity) == abs(held):
+            position.avg_cost = decimal.Decimal(0)
+    position.quantity = held + quantity
+    position.fill_count += 1
+
+
+def build_positions(apps, schema_editor):
+    """Replay the fills of existing orders, one fill per order at its average price"""
+    Order = apps.get_model('ib_gateway', 'Order')
+    PositionAggregate = apps.get_model('ib_gateway', 'PositionAggregate')
+    positions = {}
+    orders = (Order.objects.filter(filled_quantity__gt=0, avg_fill_price__gt=0)
+              .order_by('created_at', 'id').iterator(chunk_size=2000))
+    for order in orders:
+        key = (order.account, order.symbol)
+        if key not in positions:
+            positions[key] = PositionAggregate(account=order.account, symbol=order.symbol)
+        quantity = order.filled_quantity if order.action == 'BUY' else -order.filled_quantity
+        apply_fill(positions[key], quantity, order.avg_fill_price)
+    PositionAggregate.objects.bulk_create(positions.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ib_gateway', '0007_order_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PositionAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account', models.CharField(blank=True, default='', help_text='IB account', max_length=32)),
+                ('symbol', models.CharField(help_text='Ticker symbol', max_length=20)),
+                ('quantity', models.DecimalField(decimal_places=5, default=0, help_text='Net position (negative when short)', max_digits=15)),
+                ('avg_cost', models.DecimalField(decimal_places=5, default=0, help_text='Average cost of the open position', max_digits=15)),
+                ('realized_pnl', models.DecimalField(decimal_places=5, default=0, help_text='Realized P&L of closed quantity', max_digits=20)),
+                ('fill_count', models.PositiveIntegerField(default=0, help_text='Fills applied')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Position',
+                'verbose_name_plural': 'Positions',
+                'ordering': ['account', 'symbol'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='positionaggregate',
+            constraint=models.UniqueConstraint(fields=('account', 'symbol'), name='position_account_symbol_uniq'),
+        ),
+        migrations.RunPython(build_positions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.2 on 2026-10-19 00:53
+
+from django.db import migrations, models
+
+
+def fill_order_numbers(apps, schema_editor):
+    """Set order_number of the existing orders with a numeric order ID"""
+    Order = apps.get_model('ib_gateway', 'Order')
+    batch = []
+    # Read up front: SQLite cursors don't isolate reads from the updates below
+    for pk, order_id in list(Order.objects.values_list('pk', 'order_id')):
+        try:
+            batch.append(Order(pk=pk, order_number=int(order_id)))
+        except (TypeError, ValueError):
+            continue
+        if len(batch) == 2000:
+            Order.objects.bulk_update(batch, ['order_number'])
+            batch = []
+    Order.objects.bulk_update(batch, ['order_number'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('broker', '0004_webhook_indexes'),
+        ('ib_gateway', '0008_position_aggregate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='order_number',
+            field=models.BigIntegerField(blank=True, editable=False, help_text='IB Order ID as an integer, for range queries (empty if not numeric)', null=True),
+        ),
+        migrations.RunPython(fill_order_numbers, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['order_number'], name='order_number_idx'),
+        ),
+    ]
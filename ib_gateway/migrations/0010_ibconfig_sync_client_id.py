@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-19 01:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ib_gateway', '0009_order_number'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ibconfig',
+            name='sync_client_id',
+            field=models.IntegerField(blank=True, help_text='Client ID of the update_orders --daemon session, which stays connected (default: client ID + 100). Set it as the Master API client ID in IB Gateway so the daemon gets the status of orders placed by every client', null=True),
+        ),
+    ]
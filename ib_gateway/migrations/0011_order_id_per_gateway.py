@@ -0,0 +1,35 @@
+# Generated by Django 5.0.2 on 2026-10-19 01:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('broker', '0005_webhook_processed_at'),
+        ('ib_gateway', '0010_ibconfig_sync_client_id'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_number_idx',
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='order_id',
+            field=models.CharField(help_text='IB Order ID (unique per gateway, IB hands them out per client session)', max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['config', 'order_number'], name='order_config_number_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(fields=('config', 'order_id'), name='order_config_order_id_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('config__isnull', True)), fields=('order_id',), name='order_no_config_order_id_uniq'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.2 on 2026-10-19 01:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ib_gateway', '0011_order_id_per_gateway'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('SUBMITTED', 'Submitted'), ('ACCEPTED', 'Accepted'), ('INACTIVE', 'Inactive'), ('FILLED', 'Filled'), ('CANCELLED', 'Cancelled'), ('REJECTED', 'Rejected'), ('PENDING', 'Pending')], default='PENDING', help_text='Order status', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='orderevent',
+            name='status',
+            field=models.CharField(choices=[('SUBMITTED', 'Submitted'), ('ACCEPTED', 'Accepted'), ('INACTIVE', 'Inactive'), ('FILLED', 'Filled'), ('CANCELLED', 'Cancelled'), ('REJECTED', 'Rejected'), ('PENDING', 'Pending')], help_text='Order status after the change', max_length=20),
+        ),
+    ]
@@ -1,4 +1,9 @@
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models.functions import Lag
+
+# Client ID of the sync daemon's session when sync_client_id is empty, relative to client_id
+SYNC_CLIENT_ID_OFFSET = 100
 
 
 class IBConfig(models.Model):
@@ -6,6 +11,8 @@ class IBConfig(models.Model):
     host = models.CharField(max_length=255, default='127.0.0.1', help_text="IB Gateway host address")
     port = models.IntegerField(default=4002, help_text="IB Gateway port (4001 for live, 4002 for paper)")
     client_id = models.IntegerField(default=1, help_text="Client ID for connection")
+    sync_client_id = models.IntegerField(null=True, blank=True, help_text="Client ID of the update_orders --daemon session, which stays connected (default: client ID + 100). Set it as the Master API client ID in IB Gateway so the daemon gets the status of orders placed by every client")
+    account = models.CharField(max_length=32, blank=True, default='', help_text="IB account traded through this gateway (orders for it are routed here)")
     is_active = models.BooleanField(default=True, help_text="Whether this configuration is active")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -14,8 +21,82 @@ class IBConfig(models.Model):
         verbose_name = "IB Gateway Configuration"
         verbose_name_plural = "IB Gateway Configurations"
         
+    def clean(self):
+        if self.get_sync_client_id() == self.client_id:
+            raise ValidationError({'sync_client_id': "The sync daemon needs a client ID of its own, IB refuses a second session with the same one"})
+        
+    def get_sync_client_id(self):
+        """Client ID of the sync daemon's permanent session"""
+        if self.sync_client_id is not None:
+            return self.sync_client_id
+        return self.client_id + SYNC_CLIENT_ID_OFFSET
+        
     def __str__(self):
-        return f"IB Gateway Config: {self.host}:{self.port} (Client ID: {self.client_id})"
+        account = f", Account: {self.account}" if self.account else ""
+        return f"IB Gateway Config: {self.host}:{self.port} (Client ID: {self.client_id}{account})"
+
+
+def parse_order_number(order_id):
+    """IB order ID as an integer, or None if it isn't one"""
+    try:
+        return int(order_id)
+    except (TypeError, ValueError):
+        return None
+
+
+class OrderQuerySet(models.QuerySet):
+    """
+    Order ID range queries on the integer order_number column
+    
+    IB order IDs are only unique per gateway, so narrow these to one with
+    filter(config=...) first.
+    """
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.order_number = parse_order_number(obj.order_id)
+        created = super().bulk_create(objs, *args, **kwargs)
+        # bulk_create sends no post_save, so count the orders here
+        if kwargs.get('ignore_conflicts') or kwargs.get('update_conflicts'):
+            # Rows skipped or updated instead of inserted can't be told apart
+            OrderCount.recount()
+        else:
+            OrderCount.objects.filter(pk=1).update(total=models.F('total') + len(created))
+        return created
+    
+    def with_order_id(self, order_id):
+        """Orders with this IB order ID, compared as an integer (e.g. 42 matches '0042')"""
+        order_number = parse_order_number(order_id)
+        if order_number is None:
+            return self.filter(order_id=order_id)
+        return self.filter(order_number=order_number)
+    
+    def order_id_range(self, low=None, high=None):
+        """Orders with an integer order ID in [low, high)"""
+        queryset = self.filter(order_number__isnull=False)
+        if low is not None:
+            queryset = queryset.filter(order_number__gte=low)
+        if high is not None:
+            queryset = queryset.filter(order_number__lt=high)
+        return queryset
+    
+    def max_order_id(self):
+        """Highest integer order ID, or None"""
+        return self.order_id_range().aggregate(highest=models.Max('order_number'))['highest']
+    
+    def order_id_gaps(self, low=None, high=None):
+        """
+        Unused runs of order IDs between the orders with IDs in [low, high)
+        
+        Returns:
+            list: (first, last) missing order ID of every gap, lowest first
+        """
+        previous = models.Window(Lag('order_number'), order_by=models.F('order_number').asc())
+        rows = self.order_id_range(low, high).annotate(previous=previous).filter(
+            order_number__gt=models.F('previous') + 1
+        ).order_by('order_number').values_list('previous', 'order_number')
+        return [(previous + 1, order_number - 1) for previous, order_number in rows]
 
 
 class Order(models.Model):
@@ -23,6 +104,7 @@ class Order(models.Model):
     ORDER_STATUSES = [
         ('SUBMITTED', 'Submitted'),
         ('ACCEPTED', 'Accepted'),
+        ('INACTIVE', 'Inactive'),
         ('FILLED', 'Filled'),
         ('CANCELLED', 'Cancelled'),
         ('REJECTED', 'Rejected'),
@@ -41,7 +123,8 @@ class Order(models.Model):
         ('SELL', 'Sell'),
     ]
     
-    order_id = models.CharField(max_length=50, unique=True, help_text="IB Order ID")
+    order_id = models.CharField(max_length=50, help_text="IB Order ID (unique per gateway, IB hands them out per client session)")
+    order_number = models.BigIntegerField(null=True, blank=True, editable=False, help_text="IB Order ID as an integer, for range queries (empty if not numeric)")
     action = models.CharField(max_length=10, choices=ACTIONS, help_text="Buy or Sell")
     symbol = models.CharField(max_length=20, help_text="Ticker symbol")
     sec_type = models.CharField(max_length=10, default="STK", help_text="Security type (STK, OPT, FUT, CASH)")
@@ -54,14 +137,115 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=ORDER_STATUSES, default='PENDING', help_text="Order status")
     filled_quantity = models.DecimalField(max_digits=15, decimal_places=5, default=0, help_text="Quantity filled")
     avg_fill_price = models.DecimalField(max_digits=15, decimal_places=5, null=True, blank=True, help_text="Average fill price")
+    version = models.PositiveIntegerField(default=0, help_text="Bumped by every status or fill update (compare-and-swap)")
+    config = models.ForeignKey(IBConfig, on_delete=models.SET_NULL, null=True, blank=True, related_name='orders', help_text="Gateway the order was placed through")
+    account = models.CharField(max_length=32, blank=True, default='', help_text="IB account")
     webhook = models.ForeignKey('broker.Webhook', on_delete=models.SET_NULL, null=True, blank=True, help_text="Related webhook that triggered this order")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = OrderQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "IB Order"
         verbose_name_plural = "IB Orders"
         ordering = ['-created_at']
+        indexes = [
+            # Open order sync (status__in) and admin status filter, newest first
+            models.Index(fields=['status', 'created_at', 'id'], name='order_status_created_idx'),
+            # Per-symbol lookups, newest first
+            models.Index(fields=['symbol', 'created_at', 'id'], name='order_symbol_created_idx'),
+            # Order list API (keyset pagination on created_at, id) and admin changelist ordering
+            models.Index(fields=['created_at', 'id'], name='order_created_idx'),
+            # Per-gateway open order sync
+            models.Index(fields=['config', 'status'], name='order_config_status_idx'),
+            # Per-gateway order ID lookups, ranges, max and gaps (check_next_order_id.py)
+            models.Index(fields=['config', 'order_number'], name='order_config_number_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['config', 'order_id'], name='order_config_order_id_uniq'),
+            # NULLs are distinct in the constraint above
+            models.UniqueConstraint(fields=['order_id'], condition=models.Q(config__isnull=True),
+                                    name='order_no_config_order_id_uniq'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        self.order_number = parse_order_number(self.order_id)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'order_id' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'order_number'}
+        super().save(*args, **kwargs)
         
     def __str__(self):
-        return f"Order {self.order_id}: {self.action} {self.quantity} {self.symbol} @ {self.order_type}" 
\ No newline at end of file
+        return f"Order {self.order_id}: {self.action} {self.quantity} {self.symbol} @ {self.order_type}" 
+
+
+class OrderEvent(models.Model):
+    """Status or fill change of an order; rows are only ever inserted, Order holds the latest state"""
+    EVENT_KINDS = [
+        ('CREATED', 'Created'),
+        ('STATUS', 'Status update'),
+        ('EXECUTION', 'Execution'),
+    ]
+    
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='events', help_text="Order that changed")
+    kind = models.CharField(max_length=10, choices=EVENT_KINDS, help_text="What reported the change")
+    status = models.CharField(max_length=20, choices=Order.ORDER_STATUSES, help_text="Order status after the change")
+    filled_quantity = models.DecimalField(max_digits=15, decimal_places=5, default=0, help_text="Quantity filled after the change")
+    avg_fill_price = models.DecimalField(max_digits=15, decimal_places=5, null=True, blank=True, help_text="Average fill price after the change")
+    ib_time = models.DateTimeField(help_text="When IB reported the change (execution time, or when the update was received)")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = "IB Order Event"
+        verbose_name_plural = "IB Order Events"
+        ordering = ['ib_time', 'id']
+        indexes = [
+            # Order timeline
+            models.Index(fields=['order', 'ib_time', 'id'], name='orderevent_order_time_idx'),
+        ]
+        
+    def __str__(self):
+        return f"Order {self.order_id} {self.kind}: {self.status}, {self.filled_quantity} filled"
+
+
+class PositionAggregate(models.Model):
+    """Net position and realized P&L per account and symbol, updated with every fill"""
+    account = models.CharField(max_length=32, blank=True, default='', help_text="IB account")
+    symbol = models.CharField(max_length=20, help_text="Ticker symbol")
+    quantity = models.DecimalField(max_digits=15, decimal_places=5, default=0, help_text="Net position (negative when short)")
+    avg_cost = models.DecimalField(max_digits=15, decimal_places=5, default=0, help_text="Average cost of the open position")
+    realized_pnl = models.DecimalField(max_digits=20, decimal_places=5, default=0, help_text="Realized P&L of closed quantity")
+    fill_count = models.PositiveIntegerField(default=0, help_text="Fills applied")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Position"
+        verbose_name_plural = "Positions"
+        ordering = ['account', 'symbol']
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'symbol'], name='position_account_symbol_uniq'),
+        ]
+        
+    def __str__(self):
+        account = f"{self.account} " if self.account else ""
+        return f"{account}{self.symbol}: {self.quantity} @ {self.avg_cost}"
+
+
+class OrderCount(models.Model):
+    """Running total of orders, kept up to date by signals so listing orders needs no COUNT(*)"""
+    total = models.BigIntegerField(default=0)
+    
+    class Meta:
+        verbose_name = "Order Count"
+        
+    @classmethod
+    def recount(cls):
+        """Set the total to a fresh COUNT(*), fixing drift from writes that bypass the ORM"""
+        total = Order.objects.count()
+        cls.objects.update_or_create(pk=1, defaults={'total': total})
+        return total
+        
+    def __str__(self):
+        return f"{self.total} orders"
+
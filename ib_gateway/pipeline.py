@@ -0,0 +1,365 @@
+"""
+Order pipeline: turns a webhook signal into an IB order.
+
+A signal is a webhook payload carrying the same fields as the order API
+(symbol, action, quantity and optionally order_type, limit_price,
+stop_price, sec_type, exchange, currency, account). Payloads without those
+fields (e.g. free-text TradingView alerts) are not order signals.
+"""
+
+import datetime
+import decimal
+import logging
+import time
+import zoneinfo
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from broker import metrics
+from broker.models import Webhook
+
+from .cache import invalidate_orders_on_commit
+from .models import Order, OrderEvent
+from .positions import record_fills
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_SIGNAL_FIELDS = ('symbol', 'action', 'quantity')
+
+# Map IB order statuses to our database statuses
+IB_STATUS_MAPPING = {
+    'PendingSubmit': 'PENDING',
+    'PendingCancel': 'PENDING',
+    'PreSubmitted': 'SUBMITTED',
+    'Submitted': 'SUBMITTED',
+    'ApiPending': 'SUBMITTED',
+    'ApiCancelled': 'CANCELLED',
+    'Cancelled': 'CANCELLED',
+    'Filled': 'FILLED',
+    # Often transient (e.g. outside trading hours or a margin check), IB may still submit or fill the order
+    'Inactive': 'INACTIVE',
+}
+
+
+def map_ib_status(ib_status):
+    """Map IB status to our database status"""
+    return IB_STATUS_MAPPING.get(ib_status, 'PENDING')
+
+
+# Order state recorded by every OrderEvent and written by status updates
+ORDER_EVENT_FIELDS = ('status', 'filled_quantity', 'avg_fill_price')
+
+# Order status state machine: the statuses an order may move on to from each
+# status. Statuses only move forward, except that an INACTIVE order may become
+# active again; FILLED, CANCELLED and REJECTED are final.
+ORDER_STATUS_TRANSITIONS = {
+    'PENDING': {'SUBMITTED', 'ACCEPTED', 'INACTIVE', 'FILLED', 'CANCELLED', 'REJECTED'},
+    'SUBMITTED': {'ACCEPTED', 'INACTIVE', 'FILLED', 'CANCELLED', 'REJECTED'},
+    'ACCEPTED': {'INACTIVE', 'FILLED', 'CANCELLED', 'REJECTED'},
+    'INACTIVE': {'SUBMITTED', 'ACCEPTED', 'FILLED', 'CANCELLED', 'REJECTED'},
+    'FILLED': set(),
+    'CANCELLED': set(),
+    'REJECTED': set(),
+}
+
+# Times an update is retried when the order changed under it
+MAX_UPDATE_ATTEMPTS = 3
+
+
+class OrderSubmissionError(Exception):
+    """Raised when an order could not be placed with IB Gateway"""
+
+
+def _to_decimal(value):
+    """Convert a payload value to a Decimal, or None if it isn't a number"""
+    if value in (None, ''):
+        return None
+    try:
+        return decimal.Decimal(str(value))
+    except decimal.InvalidOperation:
+        return None
+
+
+def parse_signal(payload):
+    """
+    Extract order parameters from a webhook payload
+
+    Args:
+        payload (dict): Stored webhook payload
+
+    Returns:
+        dict: Order parameters or None if the payload is not an order signal
+    """
+    if not isinstance(payload, dict):
+        return None
+    if any(field not in payload for field in REQUIRED_SIGNAL_FIELDS):
+        return None
+
+    action = str(payload['action']).upper()
+    if action not in ('BUY', 'SELL'):
+        return None
+
+    quantity = _to_decimal(payload['quantity'])
+    if quantity is None or quantity <= 0:
+        return None
+
+    return {
+        'symbol': str(payload['symbol']).upper(),
+        'action': action,
+        'quantity': quantity,
+        'order_type': str(payload.get('order_type', 'MKT')).upper(),
+        'limit_price': _to_decimal(payload.get('limit_price')),
+        'stop_price': _to_decimal(payload.get('stop_price')),
+        'sec_type': payload.get('sec_type', 'STK'),
+        'exchange': payload.get('exchange', 'SMART'),
+        'currency': payload.get('currency', 'USD'),
+        'account': payload.get('account', ''),
+    }
+
+
+def can_transition(old_status, new_status):
+    """Whether an order may move from old_status to new_status"""
+    return new_status == old_status or new_status in ORDER_STATUS_TRANSITIONS.get(old_status, ())
+
+
+def _apply_fill(order, filled, avg_price):
+    """
+    Copy a cumulative fill onto an Order unless it is older than the one it has
+
+    A fill without its average price (e.g. from a completed order) is left
+    for a later update that has it; otherwise that update would add nothing to
+    the position.
+    """
+    if filled > 0 and filled >= (order.filled_quantity or 0) and avg_price > 0:
+        order.filled_quantity = filled
+        order.avg_fill_price = avg_price
+
+
+def apply_order_status(order, order_status):
+    """
+    Copy an IB order status update onto an Order (without saving)
+
+    Statuses only move forward (see ORDER_STATUS_TRANSITIONS) and fills only
+    grow, so a late or replayed update never regresses the order.
+    """
+    status = map_ib_status(order_status['status'])
+    if can_transition(order.status, status):
+        order.status = status
+    else:
+        logger.debug(f"Ignoring status {status} for order {order.order_id} in status {order.status}")
+
+    _apply_fill(order, decimal.Decimal(order_status['filled']), decimal.Decimal(order_status['avgFillPrice']))
+
+
+def apply_execution(order, execution):
+    """Copy the cumulative fill of an IB execution onto an Order (without saving)"""
+    _apply_fill(order, decimal.Decimal(str(execution['cumQty'])), decimal.Decimal(str(execution['avgPrice'])))
+    if order.filled_quantity >= order.quantity and can_transition(order.status, 'FILLED'):
+        order.status = 'FILLED'
+
+
+def compare_and_swap(order, fields):
+    """
+    Write fields of an order only if nobody else updated it since it was read
+
+    Runs UPDATE ... WHERE id = ? AND version = ?, bumping the version.
+
+    Returns:
+        bool: True if the order was written, False if its version was stale
+    """
+    now = timezone.now()
+    updated = Order.objects.filter(pk=order.pk, version=order.version).update(
+        version=F('version') + 1,
+        updated_at=now,
+        **{field: getattr(order, field) for field in fields}
+    )
+    if updated:
+        order.version += 1
+        order.updated_at = now
+    return bool(updated)
+
+
+def parse_ib_time(value):
+    """
+    Parse a timestamp reported by IB
+
+    Args:
+        value: Epoch seconds, or an IB time string like '20240315  14:30:00'
+            or '20240315 14:30:00 US/Eastern' (no zone means UTC)
+
+    Returns:
+        datetime: Aware datetime, or None if the value can't be parsed
+    """
+    if value in (None, ''):
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(value, tz=datetime.timezone.utc)
+    parts = str(value).split()
+    try:
+        parsed = datetime.datetime.strptime(' '.join(parts[:2]), '%Y%m%d %H:%M:%S')
+        tz = zoneinfo.ZoneInfo(parts[2]) if len(parts) > 2 else datetime.timezone.utc
+    except (ValueError, zoneinfo.ZoneInfoNotFoundError):
+        return None
+    return parsed.replace(tzinfo=tz)
+
+
+def order_event(order, kind, ib_time=None):
+    """Build (without saving) an OrderEvent recording the current state of an order"""
+    return OrderEvent(
+        order=order,
+        kind=kind,
+        ib_time=ib_time or timezone.now(),
+        **{field: getattr(order, field) for field in ORDER_EVENT_FIELDS}
+    )
+
+
+def observe_fill_latency(order):
+    """Record the time from placing an order to its fill in the order_fill_latency_seconds metric"""
+    if order.created_at is not None:
+        metrics.ORDER_FILL_LATENCY.observe((timezone.now() - order.created_at).total_seconds())
+
+
+def save_order_status(order, order_status):
+    """
+    Record an IB status update as an OrderEvent and project it onto the order
+
+    The order is written with compare_and_swap(), changed columns only. If
+    another worker updated it first, the order is reloaded and the update
+    applied again on top of the newer state. After MAX_UPDATE_ATTEMPTS lost
+    races the last attempt waits for a row lock (select_for_update, never
+    skip_locked) instead, so an update such as a fill is never dropped.
+    The event is inserted and the order's position updated in the same
+    transaction as the winning write.
+
+    Args:
+        order (Order): Order to update, left with the saved state
+        order_status (dict): Status update from IBApi
+
+    Returns:
+        bool: True if the update changed the order
+    """
+    for attempt in range(MAX_UPDATE_ATTEMPTS + 1):
+        with transaction.atomic():
+            if attempt == MAX_UPDATE_ATTEMPTS:
+                # Still contended: hold the row while the update is applied
+                Order.objects.select_for_update().filter(pk=order.pk).exists()
+                order.refresh_from_db(fields=ORDER_EVENT_FIELDS + ('version', 'updated_at'))
+
+            before = {field: getattr(order, field) for field in ORDER_EVENT_FIELDS}
+            apply_order_status(order, order_status)
+            fields = [field for field in ORDER_EVENT_FIELDS if getattr(order, field) != before[field]]
+            if not fields:
+                return False
+
+            if compare_and_swap(order, fields):
+                order_event(order, 'STATUS', parse_ib_time(order_status.get('time'))).save()
+                record_fills([(order, before['filled_quantity'], before['avg_fill_price'])])
+                # QuerySet.update() sends no post_save
+                invalidate_orders_on_commit([order])
+                if order.status == 'FILLED' and before['status'] != 'FILLED':
+                    observe_fill_latency(order)
+                return True
+
+        # Another worker got there first, start over from its state
+        order.refresh_from_db(fields=ORDER_EVENT_FIELDS + ('version', 'updated_at'))
+
+    logger.error(f"Failed to update order {order.order_id} even while holding its row lock")
+    return False
+
+
+def mark_webhooks_processed(webhook_ids):
+    """Record that the signals of webhooks were consumed, so replays skip them"""
+    webhook_ids = [webhook_id for webhook_id in webhook_ids if webhook_id is not None]
+    if webhook_ids:
+        Webhook.objects.filter(id__in=webhook_ids, processed_at__isnull=True).update(processed_at=timezone.now())
+
+
+def submit_order(ib, signal, webhook_id=None, wait=5, config=None, webhook_ids=None):
+    """
+    Place an order for a signal and record it in the database
+
+    Must not be called inside a transaction: the order is saved and committed
+    as soon as IB accepted it, so the row survives anything that fails later,
+    and no write lock is held while waiting for IB.
+
+    Args:
+        ib (IBConnection): Connected gateway session
+        signal (dict): Order parameters from parse_signal()
+        webhook_id (int): Webhook that triggered the order
+        wait (int): Seconds to wait for the first order status
+        config (IBConfig): Gateway the session is connected to
+        webhook_ids (list): Webhooks whose signals went into the order, marked
+            processed once it is saved (e.g. a coalesced burst)
+
+    Returns:
+        tuple: (Order, order status dict or None)
+    """
+    contract = ib.create_contract(
+        symbol=signal['symbol'],
+        sec_type=signal['sec_type'],
+        exchange=signal['exchange'],
+        currency=signal['currency']
+    )
+
+    order_type = signal['order_type']
+    order_args = {
+        'action': signal['action'],
+        'quantity': signal['quantity'],
+        'order_type': order_type
+    }
+
+    if signal['limit_price'] and order_type in ('LMT', 'STP_LMT'):
+        order_args['limit_price'] = signal['limit_price']
+
+    if signal['stop_price'] and order_type in ('STP', 'STP_LMT'):
+        order_args['stop_price'] = signal['stop_price']
+
+    order_obj = ib.create_order(**order_args)
+    if not order_obj:
+        raise OrderSubmissionError("Failed to create order")
+
+    account = signal['account'] or (config.account if config else '')
+    if account:
+        order_obj.account = account
+
+    placed_at = time.time()
+    order_id = ib.place_order(contract, order_obj)
+    if not order_id:
+        raise OrderSubmissionError("Failed to place order")
+    metrics.ORDERS_PLACED.inc()
+
+    db_order = Order(
+        order_id=str(order_id),
+        action=signal['action'],
+        symbol=signal['symbol'],
+        sec_type=signal['sec_type'],
+        exchange=signal['exchange'],
+        currency=signal['currency'],
+        quantity=signal['quantity'],
+        order_type=order_type,
+        status='SUBMITTED',
+        config=config,
+        account=account,
+        webhook_id=webhook_id
+    )
+
+    if 'limit_price' in order_args:
+        db_order.limit_price = order_args['limit_price']
+
+    if 'stop_price' in order_args:
+        db_order.stop_price = order_args['stop_price']
+
+    db_order.save()
+    if webhook_ids:
+        with transaction.atomic():
+            mark_webhooks_processed(webhook_ids)
+
+    order_status = ib.wait_for_order_status(order_id, timeout=wait)
+    if order_status:
+        if order_status.get('time'):
+            metrics.ORDER_STATUS_LATENCY.observe(max(0.0, order_status['time'] - placed_at))
+        save_order_status(db_order, order_status)
+
+    return db_order, order_status
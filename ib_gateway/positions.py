@@ -0,0 +1,122 @@
+"""
+Per-account, per-symbol positions and realized P&L.
+
+Every fill (an increase of an order's filled quantity) is applied to the
+PositionAggregate row of its account and symbol, in the same transaction
+that writes the order. Reading positions is then one row per symbol instead
+of an aggregate over the whole order history.
+
+Positions use the average cost method: adding to a position moves the
+average cost, reducing it realizes (fill price - average cost) on the
+closed quantity, and flipping it opens the remainder at the fill price.
+"""
+
+import collections
+import decimal
+import logging
+
+from django.utils import timezone
+
+from .models import PositionAggregate
+
+logger = logging.getLogger(__name__)
+
+QUANTUM = decimal.Decimal('0.00001')
+
+
+def _decimal(value):
+    """Order quantities and prices as Decimals (unsaved orders may hold floats)"""
+    return decimal.Decimal(str(value)) if value else decimal.Decimal(0)
+
+
+def apply_fill(position, quantity, price):
+    """
+    Apply a fill to a position (without saving)
+
+    Args:
+        position (PositionAggregate): Position to update
+        quantity (Decimal): Filled quantity, positive for buys and negative for sells
+        price (Decimal): Fill price
+    """
+    held = position.quantity
+    if held == 0 or (held > 0) == (quantity > 0):
+        # Opening or adding to the position
+        position.avg_cost = ((position.avg_cost * abs(held) + price * abs(quantity)) / abs(held + quantity)).quantize(QUANTUM)
+    else:
+        closed = min(abs(quantity), abs(held))
+        direction = 1 if held > 0 else -1
+        position.realized_pnl = (position.realized_pnl + closed * (price - position.avg_cost) * direction).quantize(QUANTUM)
+        if abs(quantity) > abs(held):
+            # Flipped from long to short or back
+            position.avg_cost = price
+        elif abs(quantity) == abs(held):
+            position.avg_cost = decimal.Decimal(0)
+    position.quantity = held + quantity
+    position.fill_count += 1
+
+
+def fill_of_change(order, old_filled, old_avg_price):
+    """
+    The fill that took an order from old_filled at old_avg_price to its current fill
+
+    Returns:
+        tuple: (signed quantity, price), or None if the order didn't fill more
+    """
+    filled, avg_price = _decimal(order.filled_quantity), _decimal(order.avg_fill_price)
+    old_filled, old_avg_price = _decimal(old_filled), _decimal(old_avg_price)
+    delta = filled - old_filled
+    if delta <= 0:
+        return None
+    if not avg_price:
+        logger.warning(f"Order {order.order_id} filled {delta} more without an average fill price, position not updated")
+        return None
+    # The cumulative average price includes the earlier fills
+    price = (filled * avg_price - old_filled * old_avg_price) / delta
+    return (delta if order.action == 'BUY' else -delta), price.quantize(QUANTUM)
+
+
+def record_fills(changes):
+    """
+    Apply the fills of changed orders to their positions
+
+    Must run in the transaction that writes the orders. Position rows are
+    locked (SELECT ... FOR UPDATE) until it commits.
+
+    Args:
+        changes (iterable): (order, filled_quantity before, avg_fill_price before) per changed order
+
+    Returns:
+        int: Number of fills applied
+    """
+    fills = collections.defaultdict(list)
+    for order, old_filled, old_avg_price in changes:
+        fill = fill_of_change(order, old_filled, old_avg_price)
+        if fill:
+            fills[(order.account, order.symbol)].append(fill)
+    if not fills:
+        return 0
+
+    PositionAggregate.objects.bulk_create(
+        [PositionAggregate(account=account, symbol=symbol) for account, symbol in fills],
+        ignore_conflicts=True
+    )
+    positions = {
+        (position.account, position.symbol): position
+        # Always locked in the same order, so concurrent batches can't deadlock
+        for position in PositionAggregate.objects.select_for_update().filter(
+            account__in={account for account, _ in fills},
+            symbol__in={symbol for _, symbol in fills},
+        ).order_by('account', 'symbol')
+    }
+    now = timezone.now()
+    for key, key_fills in fills.items():
+        for quantity, price in key_fills:
+            apply_fill(positions[key], quantity, price)
+        # bulk_update doesn't set auto_now fields
+        positions[key].updated_at = now
+
+    PositionAggregate.objects.bulk_update(
+        [positions[key] for key in fills],
+        ['quantity', 'avg_cost', 'realized_pnl', 'fill_count', 'updated_at']
+    )
+    return sum(len(key_fills) for key_fills in fills.values())
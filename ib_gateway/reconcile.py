@@ -0,0 +1,245 @@
+"""
+Set-based order reconciliation.
+
+OrderReconciler loads all open orders in one query, applies IB status
+updates to them in memory and writes back only the orders (and columns) that
+actually changed, together with one OrderEvent per change and their fills
+applied to the positions. The write is one compare-and-swap UPDATE per
+batch: rows whose version moved on since they were loaded are left alone,
+reloaded and retried.
+"""
+
+import collections
+
+from django.db import connections, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .cache import invalidate_orders_on_commit
+from .models import Order, OrderEvent
+from .pipeline import (MAX_UPDATE_ATTEMPTS, apply_execution, apply_order_status, observe_fill_latency, order_event,
+                       parse_ib_time)
+from .positions import record_fills
+
+# INACTIVE orders are still followed, IB may submit or fill them later
+OPEN_ORDER_STATUSES = ('PENDING', 'SUBMITTED', 'ACCEPTED', 'INACTIVE')
+
+# Columns an IB status update can change
+RECONCILED_FIELDS = ('status', 'filled_quantity', 'avg_fill_price')
+
+# Columns loaded with the orders
+LOADED_FIELDS = ('id', 'order_id', 'config', 'action', 'symbol', 'account', 'quantity', 'version', 'created_at',
+                 *RECONCILED_FIELDS)
+
+
+def _case(orders, field):
+    """CASE expression giving each order's value of field, one WHEN per distinct value"""
+    pks_by_value = collections.defaultdict(list)
+    for order in orders:
+        pks_by_value[getattr(order, field)].append(order.pk)
+    return Case(
+        *[When(pk__in=pks, then=Value(value)) for value, pks in pks_by_value.items()],
+        output_field=Order._meta.get_field(field)
+    )
+
+
+class OrderReconciler:
+    """Applies IB status updates to the open orders in memory and saves them in bulk"""
+
+    def __init__(self, statuses=OPEN_ORDER_STATUSES, batch_size=500, config=None):
+        """
+        Args:
+            statuses (tuple): Order statuses to load
+            config (IBConfig): Only load orders placed through this gateway
+            batch_size (int): Rows per UPDATE statement when saving
+        """
+        self.statuses = statuses
+        self.batch_size = batch_size
+        self.config = config
+        self.orders = {}
+        # Fill of each order as last read from the database, for position updates
+        self.loaded_fills = {}
+        self.changed = {}
+        # IB order IDs of the orders written by save()
+        self.saved = []
+        self.updates = collections.defaultdict(list)
+        self.events = collections.defaultdict(list)
+        self.transitions = collections.Counter()
+        self.unknown = set()
+        self.conflicts = 0
+
+    def load(self, order_ids=None, pks=None):
+        """
+        Load the open orders, keyed by IB order ID
+
+        IB order IDs are only unique per gateway, so narrow the orders down
+        to one with config or pks.
+
+        Args:
+            order_ids (iterable): Only load these IB order IDs
+            pks (iterable): Only load these orders
+        """
+        queryset = Order.objects.filter(status__in=self.statuses)
+        if self.config is not None:
+            queryset = queryset.filter(config=self.config)
+        if pks is not None:
+            queryset = queryset.filter(pk__in=list(pks))
+        if order_ids is not None:
+            queryset = queryset.filter(order_id__in=list(order_ids))
+        queryset = queryset.only(*LOADED_FIELDS)
+        self.orders = {order.order_id: order for order in queryset}
+        self.loaded_fills = {order_id: (order.filled_quantity, order.avg_fill_price)
+                             for order_id, order in self.orders.items()}
+        return self.orders
+
+    def apply(self, update):
+        """
+        Apply an IB status update to the loaded order it refers to
+
+        Args:
+            update (dict): Status update from IBApi (orderId, status, filled, avgFillPrice)
+
+        Returns:
+            bool: True if the order changed
+        """
+        return self._record(str(update['orderId']), apply_order_status, update, 'STATUS')
+
+    def apply_execution(self, execution):
+        """
+        Apply an execution to the loaded order it refers to
+
+        Args:
+            execution (dict): Execution details from IBApi (orderId, cumQty, avgPrice)
+
+        Returns:
+            bool: True if the order changed
+        """
+        return self._record(str(execution['orderId']), apply_execution, execution, 'EXECUTION')
+
+    def _record(self, order_id, apply, update, kind):
+        """Keep an update for retries and apply it"""
+        if order_id in self.orders:
+            self.updates[order_id].append((apply, update, kind))
+        return self._change(order_id, apply, update, kind)
+
+    def _change(self, order_id, apply, update, kind):
+        """Apply an update with apply(order, update) and track what changed"""
+        order = self.orders.get(order_id)
+        if order is None:
+            self.unknown.add(order_id)
+            return False
+
+        before = {field: getattr(order, field) for field in RECONCILED_FIELDS}
+        apply(order, update)
+        fields = {field for field in RECONCILED_FIELDS if getattr(order, field) != before[field]}
+        if not fields:
+            return False
+
+        self.events[order_id].append(order_event(order, kind, parse_ib_time(update.get('time'))))
+        if order_id in self.changed:
+            self.changed[order_id][1].update(fields)
+        else:
+            # Transitions are counted from the status loaded to the final one
+            self.changed[order_id] = (before['status'], fields)
+        return True
+
+    def pending(self):
+        """IB order IDs of loaded orders that haven't changed"""
+        return [order_id for order_id in self.orders if order_id not in self.changed]
+
+    def save(self):
+        """
+        Write the changed orders back and record their events
+
+        Orders updated by someone else since they were loaded are reloaded
+        and their updates applied again, up to MAX_UPDATE_ATTEMPTS times;
+        orders still conflicting after that are counted in conflicts.
+
+        Returns:
+            int: Number of orders saved
+        """
+        pending = list(self.changed)
+        saved = []
+        for attempt in range(MAX_UPDATE_ATTEMPTS):
+            if not pending:
+                break
+            stale = self._write(pending)
+            saved += [order_id for order_id in pending if order_id not in stale]
+            pending = self._reapply(stale) if attempt + 1 < MAX_UPDATE_ATTEMPTS else list(stale)
+        self.conflicts = len(pending)
+        self.saved = saved
+
+        for order_id in saved:
+            original_status, _ = self.changed[order_id]
+            new_status = self.orders[order_id].status
+            if original_status != new_status:
+                self.transitions[(original_status, new_status)] += 1
+                if new_status == 'FILLED':
+                    observe_fill_latency(self.orders[order_id])
+        return len(saved)
+
+    def _write(self, order_ids):
+        """
+        Compare-and-swap the changed columns of orders, one UPDATE per batch
+
+        Returns:
+            set: IB order IDs of the orders whose version was stale
+        """
+        orders = [self.orders[order_id] for order_id in order_ids]
+        fields = sorted(set().union(*(self.changed[order_id][1] for order_id in order_ids)))
+        # Parameters per order: pk IN, version CASE and one CASE per column
+        batch_size = min(self.batch_size, connections['default'].ops.bulk_batch_size(['pk'] * 3 + fields * 2, orders))
+        now = timezone.now()
+        written = []
+
+        with transaction.atomic():
+            for start in range(0, len(orders), batch_size):
+                batch = orders[start:start + batch_size]
+                pks = [order.pk for order in batch]
+                updated = Order.objects.filter(pk__in=pks, version=_case(batch, 'version')).update(
+                    version=F('version') + 1,
+                    updated_at=now,
+                    **{field: _case(batch, field) for field in fields}
+                )
+                if updated == len(batch):
+                    written += batch
+                    continue
+                # Orders written by this statement moved on by one version, at this timestamp
+                current = {pk: (version, updated_at) for pk, version, updated_at in
+                           Order.objects.filter(pk__in=pks).values_list('pk', 'version', 'updated_at')}
+                written += [order for order in batch if current.get(order.pk) == (order.version + 1, now)]
+
+            OrderEvent.objects.bulk_create(
+                [event for order in written for event in self.events[order.order_id]],
+                batch_size=self.batch_size
+            )
+            record_fills([(order, *self.loaded_fills[order.order_id]) for order in written])
+            # QuerySet.update() sends no post_save
+            invalidate_orders_on_commit(written)
+
+        for order in written:
+            order.version += 1
+            order.updated_at = now
+            self.loaded_fills[order.order_id] = (order.filled_quantity, order.avg_fill_price)
+        return set(order_ids) - {order.order_id for order in written}
+
+    def _reapply(self, order_ids):
+        """
+        Reload stale orders and apply their updates again
+
+        Returns:
+            list: IB order IDs of the reloaded orders that still change
+        """
+        fresh = Order.objects.filter(pk__in=[self.orders[order_id].pk for order_id in order_ids]).only(*LOADED_FIELDS)
+        retry = []
+        for order in fresh:
+            original_status, _ = self.changed.pop(order.order_id)
+            self.orders[order.order_id] = order
+            self.loaded_fills[order.order_id] = (order.filled_quantity, order.avg_fill_price)
+            self.events[order.order_id] = []
+            for apply, update, kind in self.updates[order.order_id]:
+                self._change(order.order_id, apply, update, kind)
+            if order.order_id in self.changed:
+                self.changed[order.order_id] = (original_status, self.changed[order.order_id][1])
+                retry.append(order.order_id)
+        return retry
@@ -0,0 +1,127 @@
+"""
+Worker side of the replay_webhooks command.
+
+Workers are started with the 'spawn' method, so this module must be
+importable before Django is set up: Django and the models are only imported
+once init_worker() has called django.setup().
+"""
+
+import logging
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Per-process gateway session, set up by init_worker
+_worker = {}
+
+
+def replayable_webhooks(since, until, include_processed=False):
+    """
+    Webhooks received in [since, until] to replay, in ID order
+
+    Webhooks already consumed by the pipeline (linked to an order, or
+    absorbed into another webhook's order or netted out by coalescing) are
+    left out unless include_processed is set.
+    """
+    from broker.models import Webhook
+
+    webhooks = Webhook.objects.filter(received_at__gte=since, received_at__lte=until)
+    if not include_processed:
+        webhooks = webhooks.filter(order__isnull=True, processed_at__isnull=True)
+    return webhooks.order_by('id')
+
+
+def partition_of(signal, partitions):
+    """
+    Partition of a signal, the same for every signal of its account and symbol
+
+    Each partition is replayed by one worker at a time, in webhook order, so
+    the signals of a symbol (e.g. a BUY and the SELL closing it) are never
+    placed out of order.
+    """
+    key = f"{signal['account']}|{signal['symbol']}".encode('utf-8')
+    return zlib.crc32(key) % partitions
+
+
+def init_worker(dry_run, gateway, worker_counter, wait, window=0):
+    """Set up Django and a gateway session in a replay worker process"""
+    import django
+    django.setup()
+
+    from multiprocessing.util import Finalize
+    from .connection import IBConnection
+    from .configs import config_by_id
+    from .simulator import SimulatedConnection
+
+    with worker_counter.get_lock():
+        worker_index = worker_counter.value
+        worker_counter.value += 1
+
+    # Every worker needs its own client ID
+    client_id = gateway['client_id'] + worker_index
+    if dry_run:
+        # Keep simulated order IDs of different workers apart
+        ib = SimulatedConnection(client_id=client_id, first_order_id=(worker_index + 1) * 10_000_000)
+    else:
+        ib = IBConnection(gateway['host'], gateway['port'], client_id)
+    if not ib.connect():
+        raise RuntimeError(f"Worker {worker_index} failed to connect to IB Gateway")
+    Finalize(ib, ib.disconnect, exitpriority=10)
+
+    config = config_by_id(gateway['config_id']) if gateway['config_id'] else None
+    _worker.update(ib=ib, config=config, dry_run=dry_run, wait=wait, window=window)
+
+
+def process_chunk(rows):
+    """
+    Push a chunk of (webhook id, payload, received_at) rows through the order pipeline
+
+    Signals are netted per symbol and account when a coalescing window is set;
+    windows are measured on received_at and don't span chunks.
+
+    Returns:
+        dict: counts and per-order latencies in seconds
+    """
+    from django.db import transaction
+    from .coalesce import SignalCoalescer
+    from .pipeline import mark_webhooks_processed, parse_signal, submit_order
+
+    result = {'placed': 0, 'coalesced': 0, 'skipped': 0, 'failed': 0, 'latencies': []}
+
+    def submit(ib, signal, webhook_ids):
+        start_time = time.perf_counter()
+        # The order is linked to the last webhook, all of them are marked processed
+        if _worker['dry_run']:
+            # Exercise the database writes without keeping them; only the simulated gateway runs in the transaction
+            with transaction.atomic():
+                submit_order(ib, signal, webhook_id=webhook_ids[-1], wait=_worker['wait'], config=_worker['config'],
+                             webhook_ids=webhook_ids)
+                transaction.set_rollback(True)
+        else:
+            # Outside any transaction: the order is committed as soon as IB took it
+            submit_order(ib, signal, webhook_id=webhook_ids[-1], wait=_worker['wait'], config=_worker['config'],
+                         webhook_ids=webhook_ids)
+        result['latencies'].append(time.perf_counter() - start_time)
+
+    def netted_out(webhook_ids):
+        if not _worker['dry_run']:
+            mark_webhooks_processed(webhook_ids)
+
+    coalescer = SignalCoalescer(_worker['ib'], window=_worker['window'], submit=submit, netted_out=netted_out)
+
+    for webhook_id, payload, received_at in rows:
+        signal = parse_signal(payload)
+        if signal is None:
+            result['skipped'] += 1
+            continue
+
+        at = received_at.timestamp()
+        coalescer.flush_due(at)
+        coalescer.add(signal, webhook_id=webhook_id, at=at)
+    coalescer.flush()
+
+    result['placed'] = coalescer.stats['orders']
+    result['coalesced'] = coalescer.stats['netted_out']
+    result['failed'] = coalescer.stats['failed']
+    return result
@@ -0,0 +1,47 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_orders_on_commit
+from .configs import bump_config_version, clear_config_cache
+from .models import IBConfig, Order, OrderCount
+from .pipeline import order_event
+from .positions import record_fills
+
+
+@receiver(post_save, sender=IBConfig)
+@receiver(post_delete, sender=IBConfig)
+def invalidate_config_cache(sender, **kwargs):
+    """Reload the active gateway configs in this process now and in all others once committed"""
+    clear_config_cache()
+    transaction.on_commit(bump_config_version)
+
+
+@receiver(post_save, sender=Order)
+def count_created_order(sender, created, **kwargs):
+    """Keep the running order total up to date (OrderQuerySet.bulk_create counts its own inserts)"""
+    if created:
+        OrderCount.objects.filter(pk=1).update(total=F('total') + 1)
+
+
+@receiver(post_save, sender=Order)
+def record_created_order(sender, instance, created, **kwargs):
+    """Start the order's event history and count fills it was created with"""
+    if created:
+        order_event(instance, 'CREATED', instance.created_at).save()
+        if instance.filled_quantity:
+            with transaction.atomic():
+                record_fills([(instance, 0, None)])
+
+
+@receiver(post_delete, sender=Order)
+def count_deleted_order(sender, **kwargs):
+    OrderCount.objects.filter(pk=1).update(total=F('total') - 1)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def invalidate_order_cache(sender, instance, **kwargs):
+    """Drop the cached API responses showing the order"""
+    invalidate_orders_on_commit([instance])
@@ -0,0 +1,151 @@
+"""
+Simulated IB Gateway session for dry runs and benchmarks.
+
+SimulatedConnection has the same interface as IBConnection but never opens a
+socket: every placed order is filled immediately at its limit price (or a
+fixed price for other order types), reported through the regular IBApi
+execDetails and orderStatus callbacks. The simulated orders also answer
+reqOpenOrders, reqAllOpenOrders, reqCompletedOrders, reqExecutions,
+cancelOrder and reqCurrentTime.
+"""
+
+import logging
+import time
+
+from ibapi.execution import Execution
+from ibapi.common import UNSET_DOUBLE
+from ibapi.order_state import OrderState
+
+from .connection import IBConnection
+
+logger = logging.getLogger(__name__)
+
+# IB statuses of orders that are done
+FINAL_STATUSES = ('Filled', 'Cancelled', 'ApiCancelled', 'Inactive')
+
+
+class SimulatedConnection(IBConnection):
+    """IBConnection stand-in that fills every order without IB Gateway"""
+
+    def __init__(self, host='simulated', port=0, client_id=1, fill_price=100.0,
+                 latency=0.0, first_order_id=1, account='SIMULATED'):
+        """
+        Args:
+            fill_price (float): Fill price for orders without a limit price
+            latency (float): Seconds to wait before an order is filled
+            first_order_id (int): First order ID handed out
+            account (str): Account reported on executions
+        """
+        super().__init__(host, port, client_id)
+        self.fill_price = fill_price
+        self.latency = latency
+        self.first_order_id = first_order_id
+        self.account = account
+        # Simulated orders by order ID: contract, order, status, fill and executions
+        self.orders = {}
+        self.api.reqAllOpenOrders = self.req_all_open_orders
+        self.api.reqOpenOrders = self.req_all_open_orders
+        self.api.reqCompletedOrders = self.req_completed_orders
+        self.api.reqExecutions = self.req_executions
+        self.api.cancelOrder = self.cancel_order
+        self.api.reqCurrentTime = lambda: self.api.currentTime(int(time.time()))
+
+    def connect(self):
+        """Pretend to connect"""
+        self.api.connected = True
+        if not self.api.next_order_id:
+            self.api.nextValidId(self.first_order_id)
+        return True
+
+    def disconnect(self):
+        """Pretend to disconnect"""
+        self.api.connected = False
+
+    def request_account_updates(self, account=""):
+        return self.api.connected
+
+    def place_order(self, contract, order):
+        """Assign an order ID and fill the order immediately"""
+        if not self.api.connected:
+            logger.error("Not connected to simulated gateway")
+            return False
+
+        order_id = self.api.next_order_id
+        self.api.next_order_id += 1
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        price = self.fill_price
+        if order.orderType in ('LMT', 'STP_LMT') and order.lmtPrice != UNSET_DOUBLE:
+            price = float(order.lmtPrice)
+        shares = float(order.totalQuantity)
+
+        execution = Execution()
+        execution.orderId = order_id
+        execution.execId = f"sim.{self.client_id}.{order_id}"
+        execution.time = time.strftime('%Y%m%d  %H:%M:%S')
+        execution.acctNumber = self.account
+        execution.exchange = contract.exchange
+        execution.side = 'BOT' if order.action == 'BUY' else 'SLD'
+        execution.shares = shares
+        execution.price = price
+        execution.permId = order_id
+        execution.clientId = self.client_id
+        execution.cumQty = shares
+        execution.avgPrice = price
+
+        self.orders[order_id] = {'contract': contract, 'order': order, 'status': 'Filled', 'filled': shares,
+                                 'price': price, 'executions': [execution]}
+        self.api.execDetails(-1, contract, execution)
+        self.api.orderStatus(order_id, 'Filled', shares, 0.0, price, order_id, 0, price, self.client_id, '', 0.0)
+        return order_id
+
+    def add_open_order(self, contract, order, order_id=None):
+        """Add an order that rests at the simulated gateway without filling"""
+        if order_id is None:
+            order_id = self.api.next_order_id
+            self.api.next_order_id += 1
+        self.orders[order_id] = {'contract': contract, 'order': order, 'status': 'Submitted', 'filled': 0.0,
+                                 'price': 0.0, 'executions': []}
+        return order_id
+
+    def _send_status(self, order_id):
+        state = self.orders[order_id]
+        remaining = float(state['order'].totalQuantity) - state['filled']
+        self.api.orderStatus(order_id, state['status'], state['filled'], remaining, state['price'], order_id, 0,
+                             state['price'], self.client_id, '', 0.0)
+
+    def _order_state(self, order_id):
+        order_state = OrderState()
+        order_state.status = self.orders[order_id]['status']
+        return order_state
+
+    def req_all_open_orders(self):
+        for order_id, state in list(self.orders.items()):
+            if state['status'] not in FINAL_STATUSES:
+                self.api.openOrder(order_id, state['contract'], state['order'], self._order_state(order_id))
+                self._send_status(order_id)
+        self.api.openOrderEnd()
+
+    def req_completed_orders(self, apiOnly):
+        for order_id, state in list(self.orders.items()):
+            if state['status'] in FINAL_STATUSES:
+                state['order'].orderId = order_id
+                state['order'].filledQuantity = state['filled']
+                self.api.completedOrder(state['contract'], state['order'], self._order_state(order_id))
+        self.api.completedOrdersEnd()
+
+    def req_executions(self, reqId, execFilter):
+        for state in list(self.orders.values()):
+            for execution in state['executions']:
+                self.api.execDetails(reqId, state['contract'], execution)
+        self.api.execDetailsEnd(reqId)
+
+    def cancel_order(self, orderId, *args):
+        state = self.orders.get(orderId)
+        if state is None or state['status'] in FINAL_STATUSES:
+            self.api.error(orderId, 10148, f"OrderId {orderId} that needs to be cancelled cannot be cancelled")
+            return
+        state['status'] = 'Cancelled'
+        self._send_status(orderId)
@@ -0,0 +1,243 @@
+"""
+Order status push channel (long polling on /api/ib/stream/).
+
+Every status and fill change is already an OrderEvent, written by whoever
+holds the gateway session (the update_orders daemon, order submission, the
+admin). The OrderEvent ID is the stream cursor: a client asks for the
+events after its cursor and the request is held until there are some.
+
+Each process runs one watcher thread. It checks the orders list version in
+the shared cache (bumped by every order change, see cache.py) a few times a
+second and, when it moved, reads the new events once into an in-memory
+buffer and wakes all waiting requests. Waiting clients therefore cost no
+database queries and no IB traffic, however many there are.
+
+IDs are handed out when a row is inserted, not when it commits, so on
+PostgreSQL an event can become visible after one with a higher ID. The
+stream never moves a cursor past a gap in the IDs until the event after the
+gap is STREAM_SETTLE_TIME seconds old; by then the write that took the
+missing ID has committed or rolled back.
+"""
+
+import collections
+import datetime
+import logging
+import os
+import threading
+import time
+
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .cache import LIST_VERSION_KEY, get_order_cache
+from .models import OrderEvent, parse_order_number
+
+logger = logging.getLogger(__name__)
+
+# Events kept in memory per process for clients that are nearly caught up
+STREAM_BUFFER_SIZE = 5000
+
+# Seconds between checks of the orders list version
+STREAM_POLL_INTERVAL = 0.25
+
+# Longest a request is held waiting for events
+MAX_STREAM_WAIT = 25
+
+# Most events returned at once
+MAX_STREAM_EVENTS = 500
+
+# Seconds after which a gap in the event IDs is taken for a rolled back write
+STREAM_SETTLE_TIME = 10
+
+STREAM_EVENT_FIELDS = ('id', 'order__order_id', 'order__account', 'kind', 'status', 'filled_quantity', 'avg_fill_price', 'ib_time')
+
+
+def _event_rows(queryset, limit=MAX_STREAM_EVENTS):
+    """The first limit events of queryset by ID, with when they were written"""
+    return list(queryset.order_by('id').values(*STREAM_EVENT_FIELDS, 'created_at')[:limit])
+
+
+def _event_dict(row):
+    """Stream event of an event row"""
+    return {
+        'id': row['id'],
+        'order_id': row['order__order_id'],
+        'account': row['order__account'],
+        'kind': row['kind'],
+        'status': row['status'],
+        'filled_quantity': row['filled_quantity'],
+        'avg_fill_price': row['avg_fill_price'],
+        'ib_time': row['ib_time'],
+    }
+
+
+def _settled(rows, after=None):
+    """
+    Leading rows (by ID) that no event still being written can come before
+
+    A gap in the IDs, after the row with ID after if given, may be an event
+    that hasn't committed yet. Rows past it are held back until the row
+    after the gap is STREAM_SETTLE_TIME seconds old.
+    """
+    cutoff = timezone.now() - datetime.timedelta(seconds=STREAM_SETTLE_TIME)
+    previous = after
+    for i, row in enumerate(rows):
+        if previous is not None and row['id'] != previous + 1 and row['created_at'] > cutoff:
+            return rows[:i]
+        previous = row['id']
+    return rows
+
+
+def _order_id_filter(order_id):
+    """Match stream events of this IB order ID, compared as an integer like Order.objects.with_order_id()"""
+    order_number = parse_order_number(order_id)
+    if order_number is None:
+        return lambda event: event['order_id'] == order_id
+    return lambda event: parse_order_number(event['order_id']) == order_number
+
+
+class OrderEventStream:
+    """Per-process buffer of new order events that requests can wait on"""
+
+    def __init__(self, buffer_size=STREAM_BUFFER_SIZE, poll_interval=STREAM_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.events = collections.deque(maxlen=buffer_size)
+        # Highest event ID read so far, None until the first poll
+        self.last_id = None
+        self.version = None
+        # Events after a gap in the IDs were held back by the last poll
+        self.held = False
+        self.condition = threading.Condition()
+        self.pid = None
+        self._lock = threading.Lock()
+
+    def head(self):
+        """ID of the newest event with no event still being written before it, the cursor of a client that starts now"""
+        if self.last_id is not None:
+            return self.last_id
+        rows = list(OrderEvent.objects.order_by('-id').values('id', 'created_at')[:MAX_STREAM_EVENTS])
+        settled = _settled(rows[::-1])
+        return settled[-1]['id'] if settled else 0
+
+    def poll(self):
+        """Read the events added since the last poll, if the orders changed, and wake the waiting requests"""
+        version = get_order_cache().get(LIST_VERSION_KEY)
+        if self.last_id is not None and version == self.version and not self.held:
+            return 0
+        self.version = version
+
+        if self.last_id is None:
+            # Start from now, older events are read from the database on request
+            with self.condition:
+                self.last_id = self.head()
+            return 0
+
+        new_events = []
+        self.held = False
+        while True:
+            rows = _event_rows(OrderEvent.objects.filter(id__gt=self.last_id))
+            batch = [_event_dict(row) for row in _settled(rows, self.last_id)]
+            if batch:
+                new_events += batch
+                with self.condition:
+                    self.events.extend(batch)
+                    self.last_id = batch[-1]['id']
+            if len(batch) < len(rows):
+                # Read them again on the next poll, whether or not the orders change
+                self.held = True
+                break
+            if len(rows) < MAX_STREAM_EVENTS:
+                break
+        if new_events:
+            with self.condition:
+                self.condition.notify_all()
+        return len(new_events)
+
+    def _ensure_thread(self):
+        """Start the watcher thread (again after a fork, e.g. in gunicorn workers)"""
+        if self.pid == os.getpid():
+            return
+        with self._lock:
+            if self.pid != os.getpid():
+                self.events.clear()
+                self.last_id = None
+                self.held = False
+                threading.Thread(target=self._run, name='order-event-stream', daemon=True).start()
+                self.pid = os.getpid()
+
+    def _run(self):
+        while True:
+            try:
+                close_old_connections()
+                self.poll()
+            except Exception as e:
+                logger.error(f"Error reading order events for the stream: {str(e)}")
+            time.sleep(self.poll_interval)
+
+    def read(self, cursor, order_id=None, limit=MAX_STREAM_EVENTS, account=None):
+        """
+        Events after cursor, from the buffer if it reaches back that far
+
+        IB order IDs are only unique per gateway, so pass the account along
+        with order_id when several gateways are in use.
+
+        Returns:
+            tuple: (events, cursor to ask with next)
+        """
+        with self.condition:
+            buffered = self.last_id is not None and self.events and self.events[0]['id'] <= cursor + 1
+            if buffered or (self.last_id is not None and not self.events and cursor >= self.last_id):
+                events = [event for event in self.events if event['id'] > cursor]
+                next_cursor = max(cursor, self.last_id)
+            else:
+                events = None
+        if events is None:
+            # Behind the buffer: read from the database, up to the newest event that can't be overtaken
+            newest = self.head()
+            queryset = OrderEvent.objects.filter(id__gt=cursor, id__lte=newest)
+            if order_id is not None:
+                order_number = parse_order_number(order_id)
+                if order_number is None:
+                    queryset = queryset.filter(order__order_id=order_id)
+                else:
+                    queryset = queryset.filter(order__order_number=order_number)
+            if account is not None:
+                queryset = queryset.filter(order__account=account)
+            events = [_event_dict(row) for row in _event_rows(queryset, limit)]
+            return events, events[-1]['id'] if len(events) == limit else max(cursor, newest)
+
+        if order_id is not None:
+            events = list(filter(_order_id_filter(order_id), events))
+        if account is not None:
+            events = [event for event in events if event['account'] == account]
+        if len(events) > limit:
+            events = events[:limit]
+            next_cursor = events[-1]['id']
+        return events, next_cursor
+
+    def wait(self, cursor, timeout=MAX_STREAM_WAIT, order_id=None, limit=MAX_STREAM_EVENTS, account=None):
+        """
+        Events after cursor, waiting up to timeout seconds for some to arrive
+
+        Returns:
+            tuple: (events, cursor to ask with next)
+        """
+        events, next_cursor = self.read(cursor, order_id, limit, account)
+        if events or timeout <= 0:
+            return events, next_cursor
+
+        self._ensure_thread()
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return events, next_cursor
+            with self.condition:
+                if self.last_id is None or self.last_id <= next_cursor:
+                    self.condition.wait(remaining)
+            events, next_cursor = self.read(next_cursor, order_id, limit, account)
+            if events:
+                return events, next_cursor
+
+
+order_event_stream = OrderEventStream()
@@ -0,0 +1,1107 @@
+import datetime
+import decimal
+import io
+import os
+import pathlib
+import tempfile
+import threading
+import time
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from broker.models import Webhook
+from broker.tests import QueryPlanMixin
+from .bulk import run_bulk_action
+from .cache import ORDER_CACHE_ALIAS, get_order_cache
+from .coalesce import SignalCoalescer
+from .configs import clear_config_cache, config_for_account, config_for_order, default_config, run_per_config
+from .daemon import OrderSnapshot, OrderSyncDaemon
+from .health import Heartbeat, gateway_health, record_disconnected
+from .live import ORDER_SORT_FIELDS, fetch_live_orders, live_page, store_live_orders
+from .models import IBConfig, Order, OrderCount, OrderEvent, PositionAggregate
+from .pipeline import parse_ib_time, parse_signal, save_order_status, submit_order
+from .reconcile import OrderReconciler
+from . import pipeline, replay
+from .replay import partition_of, replayable_webhooks
+from .simulator import SimulatedConnection
+from .stream import STREAM_SETTLE_TIME, OrderEventStream, order_event_stream
+
+
+class OrderIndexTests(QueryPlanMixin, TestCase):
+    """Order list, sync and admin queries must stay index scans"""
+    
+    def test_open_order_sync_uses_index(self):
+        queryset = Order.objects.filter(status__in=['PENDING', 'SUBMITTED', 'ACCEPTED'])
+        self.assertUsesIndex(queryset, 'order_status_created_idx')
+        
+    def test_status_filter_uses_index(self):
+        queryset = Order.objects.filter(status='FILLED').order_by('-created_at', '-pk')
+        self.assertUsesIndex(queryset, 'order_status_created_idx')
+        
+    def test_symbol_filter_uses_index(self):
+        queryset = Order.objects.filter(symbol='AAPL')
+        self.assertUsesIndex(queryset, 'order_symbol_created_idx')
+        
+    def test_order_list_uses_index(self):
+        queryset = Order.objects.all().order_by('-created_at')[:10]
+        self.assertUsesIndex(queryset, 'order_created_idx')
+        
+    def test_order_list_cursor_uses_index(self):
+        now = timezone.now()
+        queryset = (Order.objects.filter(status='FILLED', created_at__lte=now)
+                    .exclude(created_at=now, id__gte=100).order_by('-created_at', '-id')[:10])
+        self.assertUsesIndex(queryset, 'order_status_created_idx')
+        
+    def test_order_timeline_uses_index(self):
+        queryset = OrderEvent.objects.filter(order_id=1).order_by('ib_time', 'id')
+        self.assertUsesIndex(queryset, 'orderevent_order_time_idx')
+        
+    def test_admin_changelist_uses_index(self):
+        queryset = Order.objects.order_by('-created_at', '-pk')[:100]
+        self.assertUsesIndex(queryset, 'order_created_idx')
+
+
+class PipelineTests(TestCase):
+    """Tests for the webhook order pipeline against the simulated gateway"""
+
+    def test_parse_signal(self):
+        signal = parse_signal({'symbol': 'aapl', 'action': 'buy', 'quantity': '10', 'order_type': 'lmt', 'limit_price': 187.5})
+        self.assertEqual(signal['symbol'], 'AAPL')
+        self.assertEqual(signal['action'], 'BUY')
+        self.assertEqual(signal['quantity'], decimal.Decimal('10'))
+        self.assertEqual(signal['limit_price'], decimal.Decimal('187.5'))
+
+    def test_parse_signal_rejects_non_signals(self):
+        self.assertIsNone(parse_signal({'message': 'AAPL crossed 200'}))
+        self.assertIsNone(parse_signal({'symbol': 'AAPL', 'action': 'HOLD', 'quantity': 1}))
+        self.assertIsNone(parse_signal({'symbol': 'AAPL', 'action': 'BUY', 'quantity': 0}))
+
+    def test_submit_order_simulated(self):
+        ib = SimulatedConnection(first_order_id=500)
+        ib.connect()
+        signal = parse_signal({'symbol': 'MSFT', 'action': 'SELL', 'quantity': 5, 'order_type': 'LMT', 'limit_price': 410})
+
+        order, order_status = submit_order(ib, signal, wait=1)
+
+        self.assertEqual(order.order_id, '500')
+        self.assertEqual(order.status, 'FILLED')
+        self.assertEqual(order.filled_quantity, decimal.Decimal('5'))
+        self.assertEqual(order.avg_fill_price, decimal.Decimal('410'))
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'FILLED')
+
+
+class ReplayWebhooksTests(TestCase):
+    """Tests for the safety and ordering of replay_webhooks"""
+
+    def test_live_replay_needs_confirmation(self):
+        IBConfig.objects.create(host='127.0.0.1', port=4002, client_id=1)
+        with self.assertRaisesMessage(CommandError, "--yes"):
+            call_command('replay_webhooks', since='2024-01-01', live=True, interactive=False)
+
+    def replay(self, since):
+        rows = list(replayable_webhooks(since, timezone.now()).values_list('id', 'payload', 'received_at'))
+        return rows, replay.process_chunk(rows)
+
+    def test_rerun_of_coalesced_replay_places_no_orders(self):
+        ib = SimulatedConnection(first_order_id=900)
+        ib.connect()
+        replay._worker.update(ib=ib, config=None, dry_run=False, wait=1, window=5)
+        self.addCleanup(replay._worker.clear)
+        since = timezone.now() - datetime.timedelta(minutes=1)
+        for action, quantity, symbol in [('BUY', 10, 'AAPL'), ('BUY', 5, 'AAPL'), ('BUY', 2, 'MSFT'), ('SELL', 2, 'MSFT')]:
+            Webhook.objects.create(payload={'symbol': symbol, 'action': action, 'quantity': quantity}, headers={})
+
+        rows, result = self.replay(since)
+        self.assertEqual((len(rows), result['placed'], result['coalesced']), (4, 1, 3))
+        self.assertEqual(Order.objects.get().quantity, decimal.Decimal('15'))
+        self.assertFalse(Webhook.objects.filter(processed_at__isnull=True).exists())
+
+        rows, result = self.replay(since)
+        self.assertEqual((rows, result['placed']), ([], 0))
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_signals_of_a_symbol_share_a_partition(self):
+        buy = parse_signal({'symbol': 'AAPL', 'action': 'BUY', 'quantity': 10, 'account': 'DU1'})
+        sell = parse_signal({'symbol': 'AAPL', 'action': 'SELL', 'quantity': 10, 'order_type': 'LMT',
+                             'limit_price': 190, 'account': 'DU1'})
+        partitions = {partition_of(parse_signal({'symbol': symbol, 'action': 'BUY', 'quantity': 1}), 8)
+                      for symbol in ('AAPL', 'MSFT', 'NVDA', 'TSLA', 'AMZN', 'META')}
+
+        self.assertEqual(partition_of(buy, 8), partition_of(sell, 8))
+        self.assertGreater(len(partitions), 1)
+
+
+class SignalCoalescerTests(TestCase):
+    """Tests for per-symbol signal netting"""
+
+    def setUp(self):
+        self.submitted = []
+        self.coalescer = SignalCoalescer(None, window=0.5, submit=self.record)
+
+    def record(self, ib, signal, webhook_ids):
+        self.submitted.append((signal['action'], signal['quantity'], signal['symbol'], webhook_ids))
+
+    def signal(self, action, quantity, symbol='AAPL', **fields):
+        return parse_signal(dict(symbol=symbol, action=action, quantity=quantity, **fields))
+
+    def test_burst_nets_into_one_order(self):
+        self.coalescer.add(self.signal('BUY', 10), webhook_id=1, at=0.0)
+        self.coalescer.add(self.signal('BUY', 10), webhook_id=2, at=0.2)
+        self.coalescer.add(self.signal('SELL', 5), webhook_id=3, at=0.4)
+        self.coalescer.flush_due(0.49)
+        self.assertEqual(self.submitted, [])
+
+        self.coalescer.flush_due(0.5)
+        self.assertEqual(self.submitted, [('BUY', decimal.Decimal('15'), 'AAPL', [1, 2, 3])])
+        self.assertEqual(self.coalescer.stats['orders'], 1)
+        self.assertEqual(self.coalescer.stats['netted_out'], 2)
+
+    def test_order_placed_at_ib_is_kept_when_waiting_fails(self):
+        ib = SimulatedConnection(first_order_id=700)
+        ib.connect()
+        ib.wait_for_order_status = mock.Mock(side_effect=ConnectionError("connection lost"))
+        webhook_ids = [Webhook.objects.create(payload={}, headers={}).id for _ in range(2)]
+        coalescer = SignalCoalescer(ib, window=0.5)
+
+        coalescer.add(self.signal('BUY', 10), webhook_id=webhook_ids[0], at=0.0)
+        coalescer.add(self.signal('BUY', 5), webhook_id=webhook_ids[1], at=0.1)
+        coalescer.flush()
+
+        # IB has the order, so its row and the processed webhooks stay
+        self.assertEqual(coalescer.stats['failed'], 1)
+        self.assertEqual(Order.objects.get().order_id, '700')
+        self.assertFalse(Webhook.objects.filter(processed_at__isnull=True).exists())
+
+    def test_flat_burst_places_no_order(self):
+        self.coalescer.add(self.signal('SELL', 3), webhook_id=1, at=0.0)
+        self.coalescer.add(self.signal('BUY', 3), webhook_id=2, at=0.1)
+        self.coalescer.flush()
+        self.assertEqual(self.submitted, [])
+        self.assertEqual(self.coalescer.stats['netted_out'], 2)
+
+    def test_signals_net_per_symbol_and_order_type(self):
+        self.coalescer.add(self.signal('BUY', 1, 'AAPL'), webhook_id=1, at=0.0)
+        self.coalescer.add(self.signal('SELL', 2, 'MSFT'), webhook_id=2, at=0.0)
+        self.coalescer.add(self.signal('BUY', 1, 'AAPL', order_type='LMT', limit_price=180), webhook_id=3, at=0.0)
+        self.coalescer.flush()
+        self.assertEqual(sorted(self.submitted), [
+            ('BUY', decimal.Decimal('1'), 'AAPL', [1]),
+            ('BUY', decimal.Decimal('1'), 'AAPL', [3]),
+            ('SELL', decimal.Decimal('2'), 'MSFT', [2]),
+        ])
+
+    def test_disabled_window_submits_immediately(self):
+        coalescer = SignalCoalescer(None, window=0, submit=self.record)
+        coalescer.add(self.signal('SELL', 4), webhook_id=7)
+        self.assertEqual(self.submitted, [('SELL', decimal.Decimal('4'), 'AAPL', [7])])
+
+
+class SaveOrderStatusTests(TestCase):
+    """Tests for status updates of existing orders"""
+
+    def test_only_status_fields_are_written(self):
+        order = Order.objects.create(order_id='900', action='BUY', symbol='AAPL', quantity=10, status='SUBMITTED')
+        Order.objects.filter(pk=order.pk).update(symbol='MSFT')
+
+        saved = save_order_status(order, {'status': 'Filled', 'filled': 10.0, 'avgFillPrice': 187.5})
+
+        self.assertTrue(saved)
+        self.assertEqual(order.status, 'FILLED')
+        order.refresh_from_db()
+        self.assertEqual(order.symbol, 'MSFT')
+        self.assertEqual(order.status, 'FILLED')
+        self.assertEqual(order.avg_fill_price, decimal.Decimal('187.5'))
+
+
+    def test_inactive_order_can_still_fill(self):
+        order = Order.objects.create(order_id='901', action='BUY', symbol='AAPL', quantity=10, status='SUBMITTED')
+
+        self.assertTrue(save_order_status(order, {'status': 'Inactive', 'filled': 0.0, 'avgFillPrice': 0.0}))
+        self.assertEqual(order.status, 'INACTIVE')
+        self.assertTrue(save_order_status(order, {'status': 'Filled', 'filled': 10.0, 'avgFillPrice': 187.5}))
+
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.filled_quantity), ('FILLED', 10))
+
+
+class OrderReconcilerTests(TestCase):
+    """Tests for set-based reconciliation of open orders"""
+
+    def setUp(self):
+        Order.objects.bulk_create([
+            Order(order_id=str(i), action='BUY', symbol='AAPL', quantity=10, status='SUBMITTED')
+            for i in range(1, 21)
+        ])
+        Order.objects.create(order_id='99', action='BUY', symbol='AAPL', quantity=10, status='FILLED')
+
+    def update(self, order_id, status, filled=0.0, price=0.0):
+        return {'orderId': str(order_id), 'status': status, 'filled': filled, 'avgFillPrice': price}
+
+    def test_updates_are_applied_in_memory(self):
+        reconciler = OrderReconciler()
+        with self.assertNumQueries(1):
+            reconciler.load()
+            self.assertTrue(reconciler.apply(self.update(1, 'Filled', 10.0, 187.5)))
+            self.assertFalse(reconciler.apply(self.update(2, 'Submitted')))
+            self.assertFalse(reconciler.apply(self.update(99, 'Filled', 10.0, 187.5)))
+        self.assertEqual(reconciler.unknown, {'99'})
+        self.assertEqual(len(reconciler.pending()), 19)
+
+    def test_inactive_orders_are_still_followed(self):
+        Order.objects.filter(order_id='1').update(status='INACTIVE')
+        reconciler = OrderReconciler()
+        reconciler.load()
+        reconciler.apply(self.update(1, 'Filled', 10.0, 187.5))
+        reconciler.save()
+
+        self.assertEqual(reconciler.transitions, {('INACTIVE', 'FILLED'): 1})
+        self.assertEqual(Order.objects.get(order_id='1').status, 'FILLED')
+
+    def test_changed_orders_saved_in_bulk(self):
+        reconciler = OrderReconciler()
+        reconciler.load()
+        for order_id in range(1, 11):
+            reconciler.apply(self.update(order_id, 'PreSubmitted'))
+            reconciler.apply(self.update(order_id, 'Filled', 10.0, 187.5))
+        reconciler.apply(self.update(11, 'Cancelled'))
+
+        # One UPDATE, one INSERT of the events and three position queries, inside a savepoint
+        with self.assertNumQueries(7):
+            saved = reconciler.save()
+
+        self.assertEqual(saved, 11)
+        self.assertEqual(reconciler.transitions, {('SUBMITTED', 'FILLED'): 10, ('SUBMITTED', 'CANCELLED'): 1})
+        self.assertEqual(Order.objects.filter(status='FILLED', avg_fill_price=decimal.Decimal('187.5')).count(), 10)
+        self.assertEqual(Order.objects.filter(status='SUBMITTED').count(), 9)
+
+
+class OrderSyncDaemonTests(TestCase):
+    """Tests for the update_orders --daemon event handling"""
+
+    def setUp(self):
+        self.addCleanup(clear_config_cache)
+        config = IBConfig.objects.create(host='simulated', port=0, client_id=1)
+        for order_id in ('1', '2', '3'):
+            Order.objects.create(order_id=order_id, action='BUY', symbol='AAPL', quantity=10, status='SUBMITTED',
+                                 config=config)
+        self.daemon = OrderSyncDaemon(config, flush_interval=0, connection_class=SimulatedConnection)
+        self.daemon.connect()
+        # No full diff during these tests
+        self.daemon.last_diff = time.monotonic()
+
+    def test_daemon_connects_with_its_own_client_id(self):
+        # Order placement and the admin keep using client_id while the daemon is connected
+        self.assertEqual(self.daemon.ib.client_id, 101)
+        config = IBConfig(host='simulated', port=0, client_id=1, sync_client_id=0)
+        self.assertEqual(config.get_sync_client_id(), 0)
+        config.sync_client_id = 1
+        with self.assertRaises(ValidationError):
+            config.clean()
+
+    def test_events_are_saved_in_bulk(self):
+        api = self.daemon.ib.api
+        api.order_status_updates.put({'orderId': '1', 'status': 'Cancelled', 'filled': 0.0, 'avgFillPrice': 0.0})
+        api.execution_updates.put({'orderId': '2', 'cumQty': 4.0, 'avgPrice': 101.5})
+        api.execution_updates.put({'orderId': '2', 'cumQty': 10.0, 'avgPrice': 101.25})
+
+        self.daemon.step(timeout=0)
+
+        self.assertEqual(self.daemon.persister.totals, {'events': 3, 'saved': 2})
+        self.assertEqual(Order.objects.get(order_id='1').status, 'CANCELLED')
+        order = Order.objects.get(order_id='2')
+        self.assertEqual(order.status, 'FILLED')
+        self.assertEqual(order.filled_quantity, decimal.Decimal('10'))
+        self.assertEqual(order.avg_fill_price, decimal.Decimal('101.25'))
+
+    def test_snapshot_diff(self):
+        snapshot = OrderSnapshot()
+        snapshot.open_orders['2'] = {'orderId': '2', 'status': 'PreSubmitted', 'filled': 0, 'avgFillPrice': 0}
+        snapshot.completed_orders['1'] = {'orderId': '1', 'status': 'Filled', 'filled': 10.0, 'avgFillPrice': 0}
+        snapshot.completed_orders['3'] = {'orderId': '3', 'status': 'Cancelled', 'filled': 0, 'avgFillPrice': 0}
+
+        reconciler = self.daemon.apply_snapshot(snapshot)
+
+        self.assertEqual(reconciler.transitions, {('SUBMITTED', 'FILLED'): 1, ('SUBMITTED', 'CANCELLED'): 1})
+        self.assertEqual(dict(Order.objects.values_list('order_id', 'status')),
+                         {'1': 'FILLED', '2': 'SUBMITTED', '3': 'CANCELLED'})
+
+    def test_periodic_diff_waits_for_the_executions(self):
+        self.daemon.last_diff = None
+        self.daemon.step(timeout=0)
+        self.assertTrue(self.daemon.snapshot.executions_done.is_set())
+
+        with mock.patch.object(self.daemon, 'apply_snapshot') as apply_snapshot:
+            self.daemon.step(timeout=0)
+
+        apply_snapshot.assert_called_once()
+        self.assertIsNone(self.daemon.snapshot)
+
+    def test_snapshot_fill_price_comes_from_the_executions(self):
+        snapshot = OrderSnapshot()
+        snapshot.completed_orders['1'] = {'orderId': '1', 'status': 'Filled', 'filled': 10.0, 'avgFillPrice': 0}
+        self.daemon.ib.api.execution_details['1'] = [{'cumQty': 4.0, 'avgPrice': 100.0},
+                                                      {'cumQty': 10.0, 'avgPrice': 101.0}]
+
+        self.daemon.apply_snapshot(snapshot)
+
+        order = Order.objects.get(order_id='1')
+        self.assertEqual((order.status, order.filled_quantity, order.avg_fill_price), ('FILLED', 10, 101))
+        self.assertEqual(PositionAggregate.objects.get(symbol='AAPL').quantity, 10)
+
+
+class GatewayConfigTests(TestCase):
+    """Tests for routing orders to and syncing multiple gateways"""
+
+    def setUp(self):
+        # Configs created by a test are rolled back without a post_delete
+        self.addCleanup(clear_config_cache)
+        self.default = IBConfig.objects.create(host='gw1', port=4001, client_id=1, account='DU111')
+        self.second = IBConfig.objects.create(host='gw2', port=4001, client_id=1, account='DU222')
+
+    def test_orders_are_routed_by_account(self):
+        self.assertEqual(config_for_account('DU222'), self.second)
+        self.assertEqual(config_for_account('DU999'), self.default)
+        self.assertEqual(config_for_account(), self.default)
+
+        order = Order(order_id='1', action='BUY', symbol='AAPL', quantity=10, config=self.second)
+        self.assertEqual(config_for_order(order), self.second)
+        self.second.is_active = False
+        self.second.save()
+        self.assertEqual(config_for_order(order), self.default)
+
+    def test_run_per_config_collects_results_and_errors(self):
+        def sync(config):
+            if config == self.second:
+                raise ConnectionError('gateway down')
+            return config.host
+
+        results = run_per_config(sync, [self.default, self.second])
+
+        self.assertEqual([(config, result) for config, result, _ in results],
+                         [(self.default, 'gw1'), (self.second, None)])
+        self.assertIsInstance(results[1][2], ConnectionError)
+
+    def test_reconciler_only_loads_orders_of_its_gateway(self):
+        Order.objects.create(order_id='1', action='BUY', symbol='AAPL', quantity=10, config=self.default)
+        Order.objects.create(order_id='2', action='BUY', symbol='AAPL', quantity=10, config=self.second)
+
+        reconciler = OrderReconciler(config=self.second)
+
+        self.assertEqual(list(reconciler.load()), ['2'])
+
+    def test_lookups_are_cached(self):
+        default_config()
+        order = Order(order_id='1', action='BUY', symbol='AAPL', quantity=10, config=self.second)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(default_config(), self.default)
+            self.assertEqual(config_for_account('DU222'), self.second)
+            self.assertEqual(config_for_order(order), self.second)
+
+    def test_saving_a_config_invalidates_the_cache(self):
+        default_config()
+
+        third = IBConfig.objects.create(host='gw3', port=4001, client_id=1, account='DU333')
+        self.assertEqual(config_for_account('DU333'), third)
+        third.delete()
+        self.assertEqual(config_for_account('DU333'), self.default)
+
+    def test_version_file_change_reloads_the_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            version_file = pathlib.Path(directory) / 'ib_config.version'
+            version_file.touch()
+            with self.settings(IB_CONFIG_VERSION_FILE=version_file):
+                default_config()
+                # Changed by another process
+                IBConfig.objects.filter(pk=self.default.pk).update(is_active=False)
+                self.assertEqual(default_config(), self.default)
+
+                os.utime(version_file, ns=(time.time_ns() + 10**9, time.time_ns() + 10**9))
+                with self.assertNumQueries(1):
+                    self.assertEqual(default_config(), self.second)
+
+
+class OrderListTests(TestCase):
+    """Tests for the orders list API"""
+
+    def setUp(self):
+        get_order_cache().clear()
+        for i in range(25):
+            Order.objects.create(order_id=str(i), action='BUY', symbol='AAPL' if i % 2 else 'MSFT', quantity=1,
+                                 status='FILLED' if i % 5 == 0 else 'SUBMITTED')
+
+    def test_cursor_pages_cover_all_orders_once(self):
+        order_ids = []
+        url = '/api/ib/orders/?limit=10'
+        while url:
+            data = self.client.get(url).json()
+            order_ids += [order['order_id'] for order in data['orders']]
+            pagination = data['pagination']
+            url = f"/api/ib/orders/?limit=10&cursor={pagination['next_cursor']}" if pagination['has_more'] else None
+
+        self.assertEqual(order_ids, [str(i) for i in reversed(range(25))])
+
+    def test_total_is_the_running_count(self):
+        self.assertEqual(OrderCount.objects.get().total, 25)
+        Order.objects.get(order_id='0').delete()
+
+        data = self.client.get('/api/ib/orders/?page=2&limit=10').json()
+
+        self.assertEqual(data['pagination']['total'], 24)
+        self.assertEqual(data['pagination']['pages'], 3)
+        self.assertEqual(data['orders'][0]['order_id'], '14')
+
+    def test_bulk_create_and_recount_keep_the_total(self):
+        Order.objects.bulk_create([Order(order_id=str(i), action='BUY', symbol='AAPL', quantity=1)
+                                   for i in range(100, 105)])
+        self.assertEqual(OrderCount.objects.get().total, 30)
+        # Queryset deletes send post_delete for every order
+        Order.objects.filter(order_id__in=['100', '101']).delete()
+        self.assertEqual(OrderCount.objects.get().total, 28)
+
+        # Bypasses the ORM
+        OrderCount.objects.update(total=0)
+        call_command('recount_orders', stdout=io.StringIO())
+        self.assertEqual(OrderCount.objects.get().total, 28)
+
+    def test_page_fields_without_page_parameter(self):
+        pagination = self.client.get('/api/ib/orders/?limit=10').json()['pagination']
+
+        self.assertEqual((pagination['page'], pagination['pages'], pagination['total']), (1, 3, 25))
+
+    def test_filters(self):
+        data = self.client.get('/api/ib/orders/?status=filled&symbol=MSFT').json()
+        self.assertEqual([order['order_id'] for order in data['orders']], ['20', '10', '0'])
+        self.assertIsNone(data['pagination']['total'])
+
+        data = self.client.get('/api/ib/orders/?status=filled&count=exact').json()
+        self.assertEqual(data['pagination']['total'], 5)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/ib/orders/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 400)
+
+
+class OrderCacheTests(TestCase):
+    """Tests for cached order API responses"""
+
+    def setUp(self):
+        get_order_cache().clear()
+        self.order = Order.objects.create(order_id='1', action='BUY', symbol='AAPL', quantity=10, status='SUBMITTED')
+
+    def test_test_run_leaves_the_deployments_cache_alone(self):
+        location = settings.CACHES[ORDER_CACHE_ALIAS]['LOCATION']
+        self.assertFalse(pathlib.Path(location).is_relative_to(settings.BASE_DIR))
+
+    def test_repeat_polls_are_served_from_the_cache(self):
+        first = self.client.get('/api/ib/orders/1/')
+        self.client.get('/api/ib/orders/?limit=5&status=submitted')
+
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/ib/orders/1/')
+            self.client.get('/api/ib/orders/?status=submitted&limit=5')
+
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_if_none_match(self):
+        etag = self.client.get('/api/ib/orders/1/')['ETag']
+
+        response = self.client.get('/api/ib/orders/1/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_status_change_invalidates(self):
+        etag = self.client.get('/api/ib/orders/1/')['ETag']
+        self.client.get('/api/ib/orders/')
+
+        save_order_status(self.order, {'orderId': '1', 'status': 'Filled', 'filled': 10.0, 'avgFillPrice': 150.0})
+
+        response = self.client.get('/api/ib/orders/1/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['order']['status'], 'FILLED')
+        self.assertEqual(self.client.get('/api/ib/orders/').json()['orders'][0]['status'], 'FILLED')
+
+    def test_zero_padded_order_id_shares_the_entry(self):
+        etag = self.client.get('/api/ib/orders/0001/')['ETag']
+
+        save_order_status(self.order, {'orderId': '1', 'status': 'Filled', 'filled': 10.0, 'avgFillPrice': 150.0})
+
+        response = self.client.get('/api/ib/orders/0001/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['order']['status'], 'FILLED')
+        self.assertEqual(self.client.get('/api/ib/orders/1/')['ETag'], response['ETag'])
+
+    def test_bulk_reconciliation_invalidates(self):
+        self.client.get('/api/ib/orders/1/')
+
+        reconciler = OrderReconciler()
+        reconciler.load()
+        reconciler.apply({'orderId': '1', 'status': 'Cancelled', 'filled': 0.0, 'avgFillPrice': 0.0})
+        reconciler.save()
+
+        self.assertEqual(self.client.get('/api/ib/orders/1/').json()['order']['status'], 'CANCELLED')
+
+
+class OrderEventTests(TestCase):
+    """Tests for the append-only order history"""
+
+    def setUp(self):
+        self.order = Order.objects.create(order_id='1', action='BUY', symbol='AAPL', quantity=10, status='SUBMITTED')
+
+    def history(self):
+        return list(self.order.events.order_by('id').values_list('kind', 'status', 'filled_quantity'))
+
+    def test_status_changes_are_recorded(self):
+        update = {'orderId': '1', 'status': 'Filled', 'filled': 10.0, 'avgFillPrice': 150.0, 'time': 1710513000.0}
+
+        self.assertTrue(save_order_status(self.order, update))
+        self.assertFalse(save_order_status(self.order, update))
+
+        self.assertEqual(self.history(), [('CREATED', 'SUBMITTED', 0), ('STATUS', 'FILLED', 10)])
+        self.assertEqual(self.order.events.get(kind='STATUS').ib_time,
+                         datetime.datetime(2024, 3, 15, 14, 30, tzinfo=datetime.timezone.utc))
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, 'FILLED')
+
+    def test_reconciler_records_every_change(self):
+        reconciler = OrderReconciler()
+        reconciler.load()
+        reconciler.apply_execution({'orderId': '1', 'cumQty': 4.0, 'avgPrice': 150.0, 'time': '20240315  14:30:00'})
+        reconciler.apply_execution({'orderId': '1', 'cumQty': 10.0, 'avgPrice': 150.5, 'time': '20240315  14:30:01'})
+        reconciler.save()
+
+        self.assertEqual(self.history(),
+                         [('CREATED', 'SUBMITTED', 0), ('EXECUTION', 'SUBMITTED', 4), ('EXECUTION', 'FILLED', 10)])
+
+    def test_parse_ib_time(self):
+        self.assertEqual(parse_ib_time('20240315 10:30:00 US/Eastern'),
+                         datetime.datetime(2024, 3, 15, 14, 30, tzinfo=datetime.timezone.utc))
+        self.assertIsNone(parse_ib_time('yesterday'))
+
+
+class OrderConcurrencyTests(TestCase):
+    """Tests for the order status state machine and compare-and-swap updates"""
+
+    def setUp(self):
+        Order.objects.create(order_id='1', action='BUY', symbol='AAPL', quantity=10, status='SUBMITTED')
+
+    def update(self, status, filled=0.0, price=0.0):
+        return {'orderId': '1', 'status': status, 'filled': filled, 'avgFillPrice': price}
+
+    def test_status_never_regresses(self):
+        order = Order.objects.get(order_id='1')
+        save_order_status(order, self.update('Filled', 10.0, 150.0))
+
+        self.assertFalse(save_order_status(order, self.update('Submitted', 4.0, 149.0)))
+
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.filled_quantity, order.version), ('FILLED', 10, 1))
+
+    def test_stale_update_is_applied_on_top_of_the_newer_state(self):
+        stale = Order.objects.get(order_id='1')
+        save_order_status(Order.objects.get(order_id='1'), self.update('Filled', 10.0, 150.0))
+
+        self.assertFalse(save_order_status(stale, self.update('Submitted', 4.0, 149.0)))
+        self.assertEqual((stale.status, stale.version), ('FILLED', 1))
+        self.assertTrue(save_order_status(stale, self.update('Filled', 10.0, 150.25)))
+
+        order = Order.objects.get(order_id='1')
+        self.assertEqual((order.avg_fill_price, order.version), (decimal.Decimal('150.25'), 2))
+
+    def test_contended_fill_is_written_under_row_lock(self):
+        order = Order.objects.get(order_id='1')
+        real_compare_and_swap = pipeline.compare_and_swap
+        calls = []
+
+        def lose_unless_locked(order, fields):
+            # Every optimistic attempt loses to another worker
+            calls.append(order.version)
+            if len(calls) <= pipeline.MAX_UPDATE_ATTEMPTS:
+                Order.objects.filter(pk=order.pk).update(version=F('version') + 1)
+                return False
+            return real_compare_and_swap(order, fields)
+
+        with mock.patch.object(pipeline, 'compare_and_swap', lose_unless_locked):
+            self.assertTrue(save_order_status(order, self.update('Filled', 10.0, 150.0)))
+
+        self.assertEqual(len(calls), pipeline.MAX_UPDATE_ATTEMPTS + 1)
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.filled_quantity), ('FILLED', 10))
+        self.assertEqual(order.events.filter(kind='STATUS').count(), 1)
+
+    def test_reconciler_retries_orders_changed_under_it(self):
+        Order.objects.create(order_id='2', action='BUY', symbol='AAPL', quantity=10, status='SUBMITTED')
+        reconciler = OrderReconciler()
+        reconciler.load()
+        reconciler.apply(self.update('Submitted', 4.0, 149.0))
+        reconciler.apply({'orderId': '2', 'status': 'Cancelled', 'filled': 0.0, 'avgFillPrice': 0.0})
+        # Filled by another worker in the meantime
+        save_order_status(Order.objects.get(order_id='1'), self.update('Filled', 10.0, 150.0))
+
+        saved = reconciler.save()
+
+        self.assertEqual(saved, 1)
+        self.assertEqual(reconciler.conflicts, 0)
+        self.assertEqual(dict(Order.objects.values_list('order_id', 'status')), {'1': 'FILLED', '2': 'CANCELLED'})
+        self.assertEqual(Order.objects.get(order_id='1').filled_quantity, 10)
+        self.assertEqual(Order.objects.get(order_id='2').version, 1)
+
+
+class PositionAggregateTests(TestCase):
+    """Tests for incrementally maintained positions"""
+
+    def fill(self, order_id, action, quantity, price, account='DU1'):
+        order = Order.objects.create(order_id=order_id, action=action, symbol='AAPL', quantity=quantity,
+                                     status='SUBMITTED', account=account)
+        save_order_status(order, {'status': 'Filled', 'filled': quantity, 'avgFillPrice': price})
+
+    def position(self, account='DU1'):
+        return PositionAggregate.objects.get(account=account, symbol='AAPL')
+
+    def test_average_cost_and_realized_pnl(self):
+        self.fill('1', 'BUY', 10, 100.0)
+        self.fill('2', 'BUY', 10, 110.0)
+        self.fill('3', 'SELL', 15, 120.0)
+
+        position = self.position()
+        self.assertEqual((position.quantity, position.avg_cost, position.realized_pnl, position.fill_count),
+                         (5, 105, 225, 3))
+
+        # Flip to short: closes 5 at 100, opens 5 short at 100
+        self.fill('4', 'SELL', 10, 100.0)
+        position = self.position()
+        self.assertEqual((position.quantity, position.avg_cost, position.realized_pnl), (-5, 100, 200))
+
+    def test_fill_without_price_waits_for_the_price(self):
+        order = Order.objects.create(order_id='1', action='BUY', symbol='AAPL', quantity=10, status='SUBMITTED',
+                                     account='DU1')
+        save_order_status(order, {'status': 'Filled', 'filled': 10.0, 'avgFillPrice': 0.0})
+        self.assertEqual((order.status, order.filled_quantity), ('FILLED', 0))
+
+        save_order_status(order, {'status': 'Filled', 'filled': 10.0, 'avgFillPrice': 100.0})
+
+        position = self.position()
+        self.assertEqual((position.quantity, position.avg_cost), (10, 100))
+
+    def test_partial_fills_use_the_incremental_price(self):
+        order = Order.objects.create(order_id='1', action='BUY', symbol='AAPL', quantity=10, status='SUBMITTED',
+                                     account='DU1')
+        save_order_status(order, {'status': 'Submitted', 'filled': 4.0, 'avgFillPrice': 100.0})
+
+        reconciler = OrderReconciler()
+        reconciler.load()
+        reconciler.apply_execution({'orderId': '1', 'cumQty': 10.0, 'avgPrice': 106.0})
+        reconciler.save()
+
+        position = self.position()
+        self.assertEqual((position.quantity, position.avg_cost, position.fill_count), (10, 106, 2))
+        self.fill('2', 'SELL', 6, 110.0)
+        # The second fill was 6 at 110
+        self.assertEqual(self.position().realized_pnl, 24)
+
+    def test_accounts_are_kept_apart(self):
+        self.fill('1', 'BUY', 10, 100.0, account='DU1')
+        self.fill('2', 'SELL', 3, 100.0, account='DU2')
+
+        self.assertEqual(self.position('DU1').quantity, 10)
+        self.assertEqual(self.position('DU2').quantity, -3)
+
+
+    def test_positions_endpoint(self):
+        self.fill('1', 'BUY', 10, 100.0, account='DU1')
+        self.fill('2', 'SELL', 10, 105.0, account='DU1')
+        self.fill('3', 'BUY', 5, 100.0, account='DU2')
+
+        data = self.client.get('/api/ib/positions/').json()
+        self.assertEqual([(row['account'], row['symbol']) for row in data['positions']], [('DU1', 'AAPL'), ('DU2', 'AAPL')])
+        self.assertEqual(float(data['realized_pnl']), 50)
+
+        data = self.client.get('/api/ib/positions/?open=true').json()
+        self.assertEqual([row['account'] for row in data['positions']], ['DU2'])
+
+
+class OrderNumberTests(TestCase):
+    """Tests for the integer order ID column"""
+
+    def setUp(self):
+        for order_id in ('998', '999', '1000', '1003', '1007', 'manual-1'):
+            Order.objects.create(order_id=order_id, action='BUY', symbol='AAPL', quantity=1)
+
+    def test_order_number_kept_in_sync(self):
+        self.assertIsNone(Order.objects.get(order_id='manual-1').order_number)
+        order = Order.objects.get(order_id='1000')
+        self.assertEqual(order.order_number, 1000)
+
+        order.order_id = '1001'
+        order.save(update_fields=['order_id'])
+        self.assertEqual(Order.objects.get(pk=order.pk).order_number, 1001)
+
+        Order.objects.bulk_create([Order(order_id='2000', action='BUY', symbol='AAPL', quantity=1)])
+        self.assertEqual(Order.objects.get(order_id='2000').order_number, 2000)
+
+    def test_range_queries_compare_integers(self):
+        # As strings '999' > '1000'
+        self.assertEqual(Order.objects.max_order_id(), 1007)
+        self.assertEqual(sorted(Order.objects.order_id_range(999, 1004).values_list('order_number', flat=True)),
+                         [999, 1000, 1003])
+        self.assertEqual(Order.objects.order_id_gaps(), [(1001, 1002), (1004, 1006)])
+        self.assertEqual(Order.objects.order_id_gaps(998, 1004), [(1001, 1002)])
+        self.assertEqual(Order.objects.with_order_id(1000).get().order_id, '1000')
+        self.assertEqual(Order.objects.with_order_id('manual-1').count(), 1)
+
+    def test_range_queries_use_the_index(self):
+        plan = Order.objects.filter(config=None).order_id_range(999, 1004).order_by('-order_number').explain()
+        self.assertIn('order_config_number_idx', plan)
+
+
+class OrderIdPerGatewayTests(TestCase):
+    """Tests for IB order IDs reused by different gateways"""
+
+    def setUp(self):
+        self.addCleanup(clear_config_cache)
+        get_order_cache().clear()
+        self.first = IBConfig.objects.create(host='simulated', port=0, client_id=1, account='DU1')
+        self.second = IBConfig.objects.create(host='simulated', port=1, client_id=1, account='DU2')
+        self.orders = [Order.objects.create(order_id='7', action='BUY', symbol='AAPL', quantity=10,
+                                            status='SUBMITTED', config=config, account=config.account)
+                       for config in (self.first, self.second)]
+
+    def test_order_ids_are_unique_per_gateway(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Order.objects.create(order_id='7', action='SELL', symbol='MSFT', quantity=1, config=self.second)
+
+    def test_detail_needs_the_account_when_ambiguous(self):
+        self.assertEqual(self.client.get('/api/ib/orders/7/').status_code, 409)
+        self.assertEqual(self.client.get('/api/ib/orders/7/?account=DU2').json()['order']['account'], 'DU2')
+
+        save_order_status(self.orders[1], {'orderId': '7', 'status': 'Filled', 'filled': 10.0, 'avgFillPrice': 150.0})
+
+        self.assertEqual(self.client.get('/api/ib/orders/7/?account=DU2').json()['order']['status'], 'FILLED')
+        self.assertEqual(self.client.get('/api/ib/orders/7/?account=DU1').json()['order']['status'], 'SUBMITTED')
+
+    def test_sync_only_touches_its_gateway(self):
+        reconciler = OrderReconciler(config=self.second)
+        reconciler.load()
+        reconciler.apply({'orderId': '7', 'status': 'Cancelled', 'filled': 0.0, 'avgFillPrice': 0.0})
+        reconciler.save()
+
+        self.assertEqual(list(Order.objects.order_by('config').values_list('status', flat=True)),
+                         ['SUBMITTED', 'CANCELLED'])
+
+
+class BulkActionTests(TestCase):
+    """Tests for the admin bulk refresh, cancel and resync over one connection"""
+
+    def setUp(self):
+        self.addCleanup(clear_config_cache)
+        IBConfig.objects.create(host='simulated', port=0, client_id=1)
+        self.ib = SimulatedConnection(first_order_id=100)
+        self.connections = 0
+        contract = self.ib.create_contract('AAPL')
+        self.ib.connect()
+        # 100 rests at IB, 101 is filled there, 102 isn't known to IB
+        self.ib.add_open_order(contract, self.ib.create_order('BUY', 10))
+        self.ib.place_order(contract, self.ib.create_order('BUY', 10, 'LMT', limit_price=99.5))
+        self.ib.api.order_states.clear()
+        self.ib.api.execution_details.clear()
+        for order_id in ('100', '101', '102'):
+            Order.objects.create(order_id=order_id, action='BUY', symbol='AAPL', quantity=10, status='SUBMITTED')
+
+    def connect(self, host, port, client_id):
+        self.connections += 1
+        return self.ib
+
+    def run_bulk_action(self, orders, action):
+        """Outcomes keyed by IB order ID"""
+        results = run_bulk_action(orders, action, connection_class=self.connect)
+        return {order.order_id: outcome for order, outcome in results.items()}
+
+    def test_refresh(self):
+        # Orders and gateways, the open orders, then one UPDATE, the events and the position inside a savepoint
+        with self.assertNumQueries(10):
+            results = self.run_bulk_action(Order.objects.order_by('order_id'), 'refresh')
+
+        self.assertEqual(self.connections, 1)
+        self.assertEqual(results, {
+            '100': ('unchanged', 'SUBMITTED'),
+            '101': ('updated', 'SUBMITTED -> FILLED'),
+            '102': ('not found', ''),
+        })
+        order = Order.objects.get(order_id='101')
+        self.assertEqual((order.filled_quantity, order.avg_fill_price), (10, decimal.Decimal('99.5')))
+
+    def test_cancel(self):
+        Order.objects.filter(order_id='101').update(status='FILLED')
+        results = self.run_bulk_action(Order.objects.all(), 'cancel')
+
+        self.assertEqual(results['100'], ('updated', 'SUBMITTED -> CANCELLED'))
+        self.assertEqual(results['101'], ('skipped', 'already FILLED'))
+        self.assertEqual(self.ib.orders[100]['status'], 'Cancelled')
+        self.assertEqual(Order.objects.get(order_id='100').status, 'CANCELLED')
+
+    def test_resync_includes_finished_orders(self):
+        Order.objects.filter(order_id='101').update(status='FILLED', filled_quantity=10)
+        orders = Order.objects.filter(order_id='101')
+        self.assertEqual(self.run_bulk_action(orders, 'refresh'), {'101': ('skipped', 'already FILLED')})
+
+        results = self.run_bulk_action(orders, 'resync')
+
+        self.assertEqual(results, {'101': ('updated', '10.0 filled at 99.5')})
+
+    def test_connection_failure_is_reported_per_order(self):
+        self.ib.connect = lambda: False
+        results = self.run_bulk_action(Order.objects.all(), 'refresh')
+
+        self.assertEqual({outcome for outcome, _ in results.values()}, {'failed'})
+        self.assertEqual(Order.objects.filter(status='SUBMITTED').count(), 3)
+
+
+class LiveOrdersTests(TestCase):
+    """Tests for the admin live orders page"""
+
+    def setUp(self):
+        get_order_cache().clear()
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.user)
+
+    def test_fetch_waits_for_end_markers_only(self):
+        ib = SimulatedConnection(first_order_id=10)
+        ib.connect()
+        contract = ib.create_contract('AAPL')
+        ib.add_open_order(contract, ib.create_order('BUY', 5))
+        ib.place_order(contract, ib.create_order('SELL', 3))
+
+        start = time.monotonic()
+        orders, executions, complete = fetch_live_orders(ib, timeout=5)
+
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertTrue(complete)
+        self.assertEqual([(order['orderId'], order['status'], order['remaining']) for order in orders],
+                         [(10, 'Submitted', 5.0)])
+        self.assertEqual([(execution['orderId'], execution['shares']) for execution in executions], [(11, 3.0)])
+
+    def test_live_page_sorts_and_pages(self):
+        rows = [{'orderId': order_id, 'symbol': symbol} for order_id, symbol in ((3, 'B'), (1, 'A'), (2, ''))]
+        page = live_page(rows, ORDER_SORT_FIELDS, sort='symbol', direction='asc', page=1, limit=2)
+        self.assertEqual([row['orderId'] for row in page['rows']], [1, 3])
+        self.assertEqual((page['total'], page['pages']), (3, 2))
+        page = live_page(rows, ORDER_SORT_FIELDS, sort='orderId', direction='desc', page=9, limit=2)
+        self.assertEqual((page['page'], [row['orderId'] for row in page['rows']]), (2, [1]))
+        self.assertIsNone(live_page(rows, ORDER_SORT_FIELDS, sort='nope')['sort'])
+
+    def test_page_and_data_endpoint(self):
+        data_url = reverse('admin:ib_gateway_live_orders_data')
+        self.assertEqual(self.client.get(data_url).status_code, 404)
+
+        store_live_orders(self.user.pk, [{'orderId': i, 'symbol': f"S{i:04d}", 'executions': i % 2}
+                                         for i in range(2000)],
+                          [{'orderId': 1, 'execId': 'e1', 'time': '20260101 10:00:00'},
+                           {'orderId': 3, 'execId': 'e3', 'time': '20260101 10:00:01'}])
+
+        response = self.client.get(reverse('admin:ib_gateway_live_orders'))
+        self.assertContains(response, 'Open Orders (2000)')
+        # Rows are loaded by the page, not rendered
+        self.assertNotContains(response, 'S0001')
+
+        data = self.client.get(data_url, {'sort': 'orderId', 'dir': 'desc', 'page': 2, 'limit': 100}).json()
+        self.assertEqual((data['total'], data['pages'], data['rows'][0]['orderId']), (2000, 20, 1899))
+        data = self.client.get(data_url, {'kind': 'executions', 'order_id': '3'}).json()
+        self.assertEqual([row['execId'] for row in data['rows']], ['e3'])
+
+
+class OrderStreamTests(TestCase):
+    """Tests for the order event long-poll"""
+
+    def setUp(self):
+        get_order_cache().clear()
+        self.order = Order.objects.create(order_id='1', action='BUY', symbol='AAPL', quantity=10, status='SUBMITTED')
+        self.stream = OrderEventStream(buffer_size=10)
+
+    def update(self, status, filled=0.0):
+        save_order_status(self.order, {'status': status, 'filled': filled, 'avgFillPrice': 100.0 if filled else 0.0})
+
+    def test_events_after_cursor_come_from_the_buffer(self):
+        self.stream.poll()
+        cursor = self.stream.head()
+        self.assertEqual(self.stream.read(cursor), ([], cursor))
+
+        self.update('Submitted', 4.0)
+        self.update('Filled', 10.0)
+        self.assertEqual(self.stream.poll(), 2)
+
+        with self.assertNumQueries(0):
+            events, next_cursor = self.stream.read(cursor)
+        self.assertEqual([(event['order_id'], event['status'], event['filled_quantity']) for event in events],
+                         [('1', 'SUBMITTED', 4), ('1', 'FILLED', 10)])
+        self.assertEqual(next_cursor, events[-1]['id'])
+        # Nothing changed: only the cache is read
+        with self.assertNumQueries(0):
+            self.assertEqual(self.stream.poll(), 0)
+
+    def test_old_cursor_reads_the_database(self):
+        self.update('Submitted', 4.0)
+        self.stream.poll()
+        self.update('Filled', 10.0)
+        self.stream.poll()
+
+        events, next_cursor = self.stream.read(0, limit=2)
+        self.assertEqual([event['kind'] for event in events], ['CREATED', 'STATUS'])
+        events, next_cursor = self.stream.read(next_cursor)
+        self.assertEqual([event['status'] for event in events], ['FILLED'])
+
+    def test_event_committed_after_a_later_one_is_not_skipped(self):
+        self.stream.poll()
+        cursor = self.stream.head()
+        self.update('Submitted', 2.0)
+        self.update('Submitted', 4.0)
+        self.update('Filled', 10.0)
+        # The middle event took its ID first but hasn't committed yet
+        late = self.order.events.order_by('id')[2]
+        late_id = late.id
+        late.delete()
+
+        self.assertEqual(self.stream.poll(), 1)
+        self.assertEqual(self.stream.read(cursor)[1], late_id - 1)
+        self.assertEqual(self.stream.read(0)[1], late_id - 1)
+
+        late.id = late_id
+        late.save(force_insert=True)
+        self.assertEqual(self.stream.poll(), 2)
+        events, _ = self.stream.read(cursor)
+        self.assertEqual([event['filled_quantity'] for event in events], [2, 4, 10])
+
+    def test_gap_of_a_rolled_back_event_is_passed_once_settled(self):
+        self.stream.poll()
+        self.update('Submitted', 4.0)
+        self.update('Filled', 10.0)
+        rolled_back, last = self.order.events.order_by('id')[1:]
+        rolled_back.delete()
+
+        self.assertEqual(self.stream.poll(), 0)
+        OrderEvent.objects.filter(pk=last.pk).update(
+            created_at=timezone.now() - datetime.timedelta(seconds=STREAM_SETTLE_TIME + 1))
+        self.assertEqual(self.stream.poll(), 1)
+        self.assertEqual(self.stream.head(), last.id)
+
+    def test_zero_padded_order_id(self):
+        self.stream.poll()
+        cursor = self.stream.head()
+        self.update('Filled', 10.0)
+        self.stream.poll()
+
+        self.assertEqual([event['status'] for event in self.stream.read(cursor, order_id='0001')[0]], ['FILLED'])
+        self.assertEqual([event['status'] for event in self.stream.read(0, order_id='0001')[0]], ['SUBMITTED', 'FILLED'])
+
+    def test_wait_returns_when_events_arrive(self):
+        self.stream.poll()
+        cursor = self.stream.head()
+        # Polled by hand below instead of by the watcher thread
+        self.stream.pid = os.getpid()
+        result = {}
+        waiter = threading.Thread(target=lambda: result.update(events=self.stream.wait(cursor, timeout=5)[0]))
+        start = time.monotonic()
+        waiter.start()
+
+        self.update('Filled', 10.0)
+        self.stream.poll()
+        waiter.join()
+
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual([event['status'] for event in result['events']], ['FILLED'])
+
+    def test_stream_endpoint(self):
+        data = self.client.get('/api/ib/stream/').json()
+        self.assertEqual(data['events'], [])
+        cursor = data['cursor']
+
+        self.update('Filled', 10.0)
+        data = self.client.get('/api/ib/stream/', {'cursor': cursor, 'timeout': 0, 'order_id': '1'}).json()
+        self.assertEqual([event['status'] for event in data['events']], ['FILLED'])
+        data = self.client.get('/api/ib/stream/', {'cursor': data['cursor'], 'timeout': 0}).json()
+        self.assertEqual(data['events'], [])
+        self.assertEqual(self.client.get('/api/ib/stream/', {'cursor': 'x'}).status_code, 400)
+
+
+class GatewayHealthTests(TestCase):
+    """Tests for the heartbeat and the status and health endpoints"""
+
+    def setUp(self):
+        get_order_cache().clear()
+        self.addCleanup(clear_config_cache)
+        self.config = IBConfig.objects.create(host='simulated', port=0, client_id=1)
+        self.ib = SimulatedConnection()
+        self.ib.connect()
+        self.now = 1000.0
+        self.heartbeat = Heartbeat(self.config, self.ib, interval=10, timeout=5, clock=lambda: self.now)
+
+    def test_heartbeat_records_latency_and_misses(self):
+        # The simulator answers right away, with the wall clock
+        self.now = time.time()
+        self.heartbeat.tick()
+        self.heartbeat.tick()
+        health = gateway_health(self.config)
+        self.assertTrue(health['connected'] and health['responding'])
+        self.assertIsNotNone(health['latency_ms'])
+        self.assertFalse(health['stale'])
+
+        # No answer to the next heartbeat
+        self.ib.api.reqCurrentTime = lambda: None
+        self.now += 11
+        self.heartbeat.tick()
+        self.now += 6
+        self.heartbeat.tick()
+        health = gateway_health(self.config)
+        self.assertFalse(health['responding'])
+        self.assertEqual(health['missed_heartbeats'], 1)
+
+        self.ib.api.error(-1, 1100, 'Connectivity between IB and TWS has been lost')
+        self.heartbeat.record()
+        self.assertEqual(gateway_health(self.config)['error_counts'], {'1100': 1})
+        self.assertTrue(gateway_health(self.config, now=time.time() + 60)['stale'])
+
+    def test_daemon_step_sends_heartbeats(self):
+        daemon = OrderSyncDaemon(self.config, flush_interval=0, connection_class=SimulatedConnection)
+        daemon.connect()
+        daemon.last_diff = time.monotonic()
+        daemon.step(timeout=0)
+        daemon.step(timeout=0)
+        self.assertTrue(gateway_health(self.config)['responding'])
+
+    def test_status_reads_the_recorded_health(self):
+        data = self.client.get('/api/ib/status/').json()
+        self.assertFalse(data['success'])
+        self.assertIn('No heartbeat recorded', data['message'])
+
+        self.now = time.time()
+        self.heartbeat.tick()
+        self.heartbeat.tick()
+        start = time.monotonic()
+        data = self.client.get('/api/ib/status/').json()
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertTrue(data['success'])
+        self.assertEqual(len(data['gateways']), 1)
+
+        record_disconnected(self.config, 'Failed to connect')
+        data = self.client.get('/api/ib/status/').json()
+        self.assertEqual((data['success'], data['message']), (False, 'Not connected: Failed to connect'))
+
+    def test_liveness_and_readiness(self):
+        self.assertEqual(self.client.get('/api/ib/health/live/').status_code, 200)
+
+        response = self.client.get('/api/ib/health/ready/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['checks'], {'database': 'ok', 'gateway simulated:0': 'no heartbeat'})
+        self.assertEqual(self.client.get('/api/ib/health/ready/?gateways=false').status_code, 200)
+
+        self.now = time.time()
+        self.heartbeat.tick()
+        self.heartbeat.tick()
+        self.assertEqual(self.client.get('/api/ib/health/ready/').status_code, 200)
@@ -5,6 +5,10 @@ app_name = 'ib_gateway'
 
 urlpatterns = [
     path('status/', views.connection_status, name='connection_status'),
+    path('health/live/', views.liveness, name='liveness'),
+    path('health/ready/', views.readiness, name='readiness'),
     path('orders/', views.OrderView.as_view(), name='orders'),
     path('orders/<str:order_id>/', views.OrderView.as_view(), name='order_detail'),
+    path('stream/', views.OrderStreamView.as_view(), name='order_stream'),
+    path('positions/', views.PositionView.as_view(), name='positions'),
 ] 
\ No newline at end of file
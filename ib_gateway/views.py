@@ -5,67 +5,189 @@ from django.views.decorators.http import require_http_methods
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .models import IBConfig, Order
+from .models import Order, OrderCount, PositionAggregate
+from .cache import cached_response, detail_cache_key, list_cache_key
+from .configs import active_configs, config_for_account, config_for_order, run_per_config
 from .connection import IBConnection, test_connection
+from .health import gateway_health, is_healthy
+from .pipeline import IB_STATUS_MAPPING, map_ib_status, save_order_status
+from .stream import MAX_STREAM_EVENTS, MAX_STREAM_WAIT, order_event_stream
+import base64
 import json
 import logging
 import decimal
 import time
 import datetime
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 
 logger = logging.getLogger(__name__)
 
 def connection_status(request):
-    """View to check IB Gateway connection status"""
+    """
+    View to check the status of every active IB Gateway
+    
+    Returns the health recorded by the update_orders daemon's heartbeat
+    (health.py) without contacting IB. ?probe=true opens a test session to
+    each gateway instead, which takes a few seconds.
+    """
     try:
-        # Get the active configuration
-        config = IBConfig.objects.filter(is_active=True).first()
-        if not config:
+        # Get the active configurations
+        configs = active_configs()
+        if not configs:
             return JsonResponse({
                 'success': False,
                 'message': 'No active IB Gateway configuration found'
             })
-            
-        # Test the connection
-        success, message = test_connection(
-            host=config.host,
-            port=config.port,
-            client_id=config.client_id
-        )
         
+        if request.GET.get('probe', 'false').lower() == 'true':
+            return probe_connections(configs)
+        
+        gateways = []
+        for config in configs:
+            health = gateway_health(config)
+            if health is None:
+                message = "No heartbeat recorded, is the sync daemon (update_orders --daemon) running?"
+            elif health['stale']:
+                message = f"Last heartbeat {health['age']:.0f}s ago, is the sync daemon running?"
+            elif not health['connected']:
+                message = f"Not connected: {health.get('error', 'unknown error')}"
+            elif not health['responding']:
+                message = "Connected, but not answering heartbeats"
+            else:
+                message = f"Connected, heartbeat round trip {health['latency_ms']} ms"
+            gateways.append({
+                'success': is_healthy(health),
+                'message': message,
+                'health': health,
+                'config': {
+                    'host': config.host,
+                    'port': config.port,
+                    'client_id': config.client_id,
+                    'sync_client_id': config.get_sync_client_id(),
+                    'account': config.account
+                }
+            })
+        
+        # Top-level fields describe the default gateway
+        return JsonResponse(dict(gateways[0], gateways=gateways))
+    except Exception as e:
+        logger.error(f"Error checking IB Gateway connection: {str(e)}")
         return JsonResponse({
+            'success': False,
+            'message': f"Error: {str(e)}"
+        }, status=500)
+
+
+def probe_connections(configs):
+    """Test the connection to every gateway with a new session, in parallel"""
+    results = run_per_config(lambda config: test_connection(
+        host=config.host,
+        port=config.port,
+        client_id=config.client_id
+    ), configs)
+    
+    gateways = []
+    for config, result, error in results:
+        success, message = result if error is None else (False, f"Error: {str(error)}")
+        gateways.append({
             'success': success,
             'message': message,
             'config': {
                 'host': config.host,
                 'port': config.port,
-                'client_id': config.client_id
+                'client_id': config.client_id,
+                'account': config.account
             }
         })
+    
+    # Top-level fields describe the default gateway
+    return JsonResponse(dict(gateways[0], gateways=gateways))
+
+
+def liveness(request):
+    """Liveness check: the process answers requests (touches nothing else)"""
+    return JsonResponse({'status': 'ok'})
+
+
+def readiness(request):
+    """
+    Readiness check: the database answers and every active gateway has a live heartbeat
+    
+    ?gateways=false leaves the gateways out, for checks of the web app alone.
+    """
+    checks = {}
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        checks['database'] = 'ok'
     except Exception as e:
-        logger.error(f"Error checking IB Gateway connection: {str(e)}")
-        return JsonResponse({
-            'success': False,
-            'message': f"Error: {str(e)}"
-        }, status=500)
+        checks['database'] = f"error: {str(e)}"
+    
+    if request.GET.get('gateways', 'true').lower() != 'false' and checks['database'] == 'ok':
+        for config in active_configs():
+            health = gateway_health(config)
+            checks[f"gateway {config.host}:{config.port}"] = 'ok' if is_healthy(health) else (
+                'no heartbeat' if health is None or health['stale'] else 'down')
+    
+    ready = all(result == 'ok' for result in checks.values())
+    return JsonResponse({'status': 'ok' if ready else 'unavailable', 'checks': checks}, status=200 if ready else 503)
+
+
+# Fields returned by the order API. Decimals and datetimes are left to the
+# JSON renderer (broker.fastjson), which encodes them natively.
+ORDER_FIELDS = ('id', 'order_id', 'action', 'symbol', 'quantity', 'order_type', 'status', 'filled_quantity', 'avg_fill_price')
+ORDER_DETAIL_FIELDS = ORDER_FIELDS + ('account', 'created_at')
+ORDER_LIST_FIELDS = ('id', 'order_id', 'action', 'symbol', 'quantity', 'order_type', 'status', 'filled_quantity', 'created_at')
+
+def order_to_dict(order, fields=ORDER_FIELDS):
+    """Build the API representation of an order"""
+    return {field: getattr(order, field) for field in fields}
+
 
+MAX_PAGE_SIZE = 500
 
-# Map IB order statuses to our database statuses
-IB_STATUS_MAPPING = {
-    'PendingSubmit': 'PENDING',
-    'PendingCancel': 'PENDING',
-    'PreSubmitted': 'SUBMITTED',
-    'Submitted': 'SUBMITTED',
-    'ApiPending': 'SUBMITTED',
-    'ApiCancelled': 'CANCELLED',
-    'Cancelled': 'CANCELLED',
-    'Filled': 'FILLED',
-    'Inactive': 'REJECTED',
-}
+def encode_cursor(created_at, pk):
+    """Opaque cursor pointing just past an order in the (created_at, id) ordering"""
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{pk}".encode()).decode().rstrip('=')
 
-def map_ib_status(ib_status):
-    """Map IB status to our database status"""
-    return IB_STATUS_MAPPING.get(ib_status, 'PENDING')
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor from encode_cursor()
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        value = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = value.split('|')
+        created_at = parse_datetime(created_at)
+        pk = int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if created_at is None:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return created_at, pk
+
+
+def parse_time_param(value, end_of_day=False):
+    """
+    Parse an ISO date or datetime query parameter
+
+    Raises:
+        ValueError: If the value is not a date or datetime
+    """
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date or datetime: {value}")
+        parsed = datetime.datetime.combine(day, datetime.time.max if end_of_day else datetime.time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, datetime.timezone.utc)
+    return parsed
 
 
 class OrderView(APIView):
@@ -92,13 +214,15 @@ class OrderView(APIView):
             limit_price = data.get('limit_price', None)
             stop_price = data.get('stop_price', None)
             
-            # Get the active configuration
-            config = IBConfig.objects.filter(is_active=True).first()
+            # Get the gateway of the account (or the default one)
+            account = data.get('account', '')
+            config = config_for_account(account)
             if not config:
                 return Response({
                     'success': False,
                     'message': 'No active IB Gateway configuration found'
                 }, status=status.HTTP_400_BAD_REQUEST)
+            account = account or config.account
                 
             # Connect to IB Gateway
             ib = IBConnection(config.host, config.port, config.client_id)
@@ -138,6 +262,9 @@ class OrderView(APIView):
                     'message': 'Failed to create order'
                 }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
                 
+            if account:
+                order_obj.account = account
+                
             # Use a unique order ID based on timestamp if needed
             if data.get('use_timestamp_id', False):
                 # Generate a shorter timestamp-based ID 
@@ -176,6 +303,8 @@ class OrderView(APIView):
                 quantity=decimal.Decimal(data['quantity']),
                 order_type=order_type,
                 status='SUBMITTED',
+                config=config,
+                account=account,
                 webhook=webhook
             )
             
@@ -194,16 +323,7 @@ class OrderView(APIView):
             if order_status:
                 logger.info(f"Received order status: {order_status}")
                 # Update the order in the database
-                status_name = map_ib_status(order_status['status'])
-                db_order.status = status_name
-                
-                if order_status['filled'] > 0:
-                    db_order.filled_quantity = decimal.Decimal(order_status['filled'])
-                    
-                if order_status['avgFillPrice'] > 0:
-                    db_order.avg_fill_price = decimal.Decimal(order_status['avgFillPrice'])
-                    
-                db_order.save()
+                save_order_status(db_order, order_status)
             
             # Disconnect from IB Gateway
             ib.disconnect()
@@ -212,17 +332,7 @@ class OrderView(APIView):
                 'success': True,
                 'message': f'Order placed successfully with ID: {order_id}',
                 'order_id': order_id,
-                'order': {
-                    'id': db_order.id,
-                    'order_id': db_order.order_id,
-                    'action': db_order.action,
-                    'symbol': db_order.symbol,
-                    'quantity': float(db_order.quantity),
-                    'order_type': db_order.order_type,
-                    'status': db_order.status,
-                    'filled_quantity': float(db_order.filled_quantity) if db_order.filled_quantity else 0,
-                    'avg_fill_price': float(db_order.avg_fill_price) if db_order.avg_fill_price else None
-                }
+                'order': order_to_dict(db_order)
             }, status=status.HTTP_201_CREATED)
             
         except Exception as e:
@@ -235,90 +345,193 @@ class OrderView(APIView):
     def get(self, request, order_id=None, *args, **kwargs):
         """Get order information"""
         if order_id:
-            # Get a specific order
+            # IB order IDs are only unique per gateway; the account picks the gateway like placing an order does
+            config = config_for_account(request.GET['account']) if request.GET.get('account') else None
+            # If requested, check for real-time updates
+            refresh = request.GET.get('refresh', 'false').lower() == 'true'
+            if refresh:
+                return self.order_detail(order_id, config, refresh=True)
+            return cached_response(request, detail_cache_key(order_id, config.pk if config else None),
+                                   lambda: self.order_detail(order_id, config))
+        else:
+            return cached_response(request, list_cache_key(request.GET), lambda: self.list_orders(request))
+            
+    def order_detail(self, order_id, config=None, refresh=False):
+        """Get a specific order, optionally refreshing its status from IB first"""
+        orders = Order.objects.with_order_id(order_id)
+        if config is not None:
+            orders = orders.filter(config=config)
+        try:
+            order = orders.get()
+        except Order.DoesNotExist:
+            return Response({
+                'success': False,
+                'message': f"Order with ID {order_id} not found"
+            }, status=status.HTTP_404_NOT_FOUND)
+        except Order.MultipleObjectsReturned:
+            return Response({
+                'success': False,
+                'message': f"Order ID {order_id} was used on several gateways, pass the account"
+            }, status=status.HTTP_409_CONFLICT)
+            
+        if refresh:
             try:
-                order = Order.objects.get(order_id=order_id)
-                
-                # If requested, check for real-time updates
-                refresh = request.GET.get('refresh', 'false').lower() == 'true'
-                
-                if refresh:
-                    try:
-                        # Connect to IB Gateway and check order status
-                        config = IBConfig.objects.filter(is_active=True).first()
-                        if config:
-                            ib = IBConnection(config.host, config.port, config.client_id)
-                            if ib.connect():
-                                order_status = ib.get_order_status(order_id)
-                                if order_status:
-                                    # Update the order in the database
-                                    status_name = map_ib_status(order_status['status'])
-                                    order.status = status_name
-                                    
-                                    if order_status['filled'] > 0:
-                                        order.filled_quantity = decimal.Decimal(order_status['filled'])
-                                        
-                                    if order_status['avgFillPrice'] > 0:
-                                        order.avg_fill_price = decimal.Decimal(order_status['avgFillPrice'])
-                                        
-                                    order.save()
-                                
-                                # Get execution details
-                                execution_details = ib.get_execution_details(order_id)
-                                
-                                # Disconnect
-                                ib.disconnect()
-                    except Exception as e:
-                        logger.error(f"Error refreshing order status: {str(e)}")
+                # Connect to the order's IB Gateway and check order status
+                config = config_for_order(order)
+                if config:
+                    ib = IBConnection(config.host, config.port, config.client_id)
+                    if ib.connect():
+                        order_status = ib.get_order_status(order_id)
+                        if order_status:
+                            # Update the order in the database
+                            save_order_status(order, order_status)
+                        
+                        # Get execution details
+                        execution_details = ib.get_execution_details(order_id)
+                        
+                        # Disconnect
+                        ib.disconnect()
+            except Exception as e:
+                logger.error(f"Error refreshing order status: {str(e)}")
                 
-                return Response({
-                    'success': True,
-                    'order': {
-                        'id': order.id,
-                        'order_id': order.order_id,
-                        'action': order.action,
-                        'symbol': order.symbol,
-                        'quantity': float(order.quantity),
-                        'order_type': order.order_type,
-                        'status': order.status,
-                        'filled_quantity': float(order.filled_quantity) if order.filled_quantity else 0,
-                        'avg_fill_price': float(order.avg_fill_price) if order.avg_fill_price else None,
-                        'created_at': order.created_at
-                    }
-                })
-            except Order.DoesNotExist:
-                return Response({
-                    'success': False,
-                    'message': f"Order with ID {order_id} not found"
-                }, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            'success': True,
+            'order': order_to_dict(order, ORDER_DETAIL_FIELDS)
+        })
+            
+    def list_orders(self, request):
+        """
+        List orders, newest first
+        
+        Pages are fetched by cursor (keyset on created_at, id), so every page
+        costs the same index range scan. Query parameters:
+            limit: Orders per page (at most MAX_PAGE_SIZE)
+            cursor: next_cursor of the previous page
+            page: Page number, the old offset pagination (used without cursor)
+            status, symbol: Exact filters
+            since, until: Creation time range (ISO date or datetime)
+            count: 'exact' to count the filtered orders; otherwise the total
+                is the running order total, and left out when filtering
+        """
+        try:
+            limit = min(max(int(request.GET.get('limit', 10)), 1), MAX_PAGE_SIZE)
+            page = int(request.GET['page']) if 'page' in request.GET else None
+            cursor = decode_cursor(request.GET['cursor']) if request.GET.get('cursor') else None
+            since = parse_time_param(request.GET['since']) if request.GET.get('since') else None
+            until = parse_time_param(request.GET['until'], end_of_day=True) if request.GET.get('until') else None
+        except ValueError as e:
+            return Response({
+                'success': False,
+                'message': f"Invalid query parameter: {str(e)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+            
+        orders = Order.objects.all()
+        if request.GET.get('status'):
+            orders = orders.filter(status=request.GET['status'].upper())
+        if request.GET.get('symbol'):
+            orders = orders.filter(symbol=request.GET['symbol'].upper())
+        if since:
+            orders = orders.filter(created_at__gte=since)
+        if until:
+            orders = orders.filter(created_at__lte=until)
+        filtered = orders.query.has_filters()
+        
+        if request.GET.get('count') == 'exact':
+            total = orders.count()
+        elif not filtered:
+            total = OrderCount.objects.values_list('total', flat=True).first()
         else:
-            # List all orders, with pagination
-            page = int(request.GET.get('page', 1))
-            limit = int(request.GET.get('limit', 10))
+            total = None
             
-            start = (page - 1) * limit
-            end = page * limit
+        if cursor:
+            created_at, pk = cursor
+            # The redundant created_at bound keeps this an index range scan
+            orders = orders.filter(created_at__lte=created_at).exclude(created_at=created_at, id__gte=pk)
             
-            orders = Order.objects.all().order_by('-created_at')[start:end]
-            total = Order.objects.count()
+        # Plain dicts, no model instances needed for a read-only list
+        orders = orders.order_by('-created_at', '-id').values(*ORDER_LIST_FIELDS)
+        if page is not None and cursor is None:
+            start = (max(page, 1) - 1) * limit
+            orders = list(orders[start:start + limit + 1])
+        else:
+            orders = list(orders[:limit + 1])
+        has_more = len(orders) > limit
+        orders = orders[:limit]
+        
+        pagination = {
+            'limit': limit,
+            'total': total,
+            'has_more': has_more,
+            'next_cursor': encode_cursor(orders[-1]['created_at'], orders[-1]['id']) if has_more else None,
+        }
+        # Kept for clients of the old offset pagination; there are no page numbers when paging by cursor
+        pagination['page'] = max(page or 1, 1) if cursor is None else None
+        pagination['pages'] = (total + limit - 1) // limit if total is not None else None
             
+        return Response({
+            'success': True,
+            'orders': orders,
+            'pagination': pagination
+        })
+
+
+POSITION_FIELDS = ('account', 'symbol', 'quantity', 'avg_cost', 'realized_pnl', 'fill_count', 'updated_at')
+
+class PositionView(APIView):
+    """Net positions and realized P&L, one row per account and symbol"""
+    
+    def get(self, request, *args, **kwargs):
+        """
+        List positions
+        
+        Query parameters:
+            account, symbol: Exact filters
+            open: 'true' to leave out closed (flat) positions
+        """
+        positions = PositionAggregate.objects.all()
+        for field in ('account', 'symbol'):
+            if request.GET.get(field):
+                positions = positions.filter(**{field: request.GET[field]})
+        if request.GET.get('open', 'false').lower() == 'true':
+            positions = positions.exclude(quantity=0)
+        
+        rows = list(positions.values(*POSITION_FIELDS))
+        return Response({
+            'success': True,
+            'positions': rows,
+            'realized_pnl': sum((row['realized_pnl'] for row in rows), decimal.Decimal(0))
+        })
+
+
+class OrderStreamView(APIView):
+    """Long-poll for order status and fill changes"""
+    
+    def get(self, request, *args, **kwargs):
+        """
+        Order events after a cursor, held until there are some
+        
+        Query parameters:
+            cursor: cursor of the previous response; without it the response
+                is the current cursor and no events, right away
+            order_id: Only events of this order
+            account: Only events of orders of this account
+            timeout: Most seconds to wait (at most MAX_STREAM_WAIT)
+            limit: Most events (at most MAX_STREAM_EVENTS)
+        """
+        try:
+            cursor = request.GET.get('cursor')
+            cursor = int(cursor) if cursor not in (None, '') else None
+            timeout = min(float(request.GET.get('timeout', MAX_STREAM_WAIT)), MAX_STREAM_WAIT)
+            limit = max(1, min(int(request.GET.get('limit', MAX_STREAM_EVENTS)), MAX_STREAM_EVENTS))
+        except ValueError:
             return Response({
-                'success': True,
-                'orders': [{
-                    'id': order.id,
-                    'order_id': order.order_id,
-                    'action': order.action,
-                    'symbol': order.symbol,
-                    'quantity': float(order.quantity),
-                    'order_type': order.order_type,
-                    'status': order.status,
-                    'filled_quantity': float(order.filled_quantity) if order.filled_quantity else 0,
-                    'created_at': order.created_at
-                } for order in orders],
-                'pagination': {
-                    'page': page,
-                    'limit': limit,
-                    'total': total,
-                    'pages': (total + limit - 1) // limit
-                }
-            }) 
\ No newline at end of file
+                'success': False,
+                'message': 'cursor, timeout and limit must be numbers'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if cursor is None:
+            return Response({'success': True, 'cursor': order_event_stream.head(), 'events': []})
+        
+        events, next_cursor = order_event_stream.wait(cursor, timeout=timeout, order_id=request.GET.get('order_id'),
+                                                      limit=limit, account=request.GET.get('account'))
+        return Response({'success': True, 'cursor': next_cursor, 'events': events})
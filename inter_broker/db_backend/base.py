@@ -0,0 +1,44 @@
+"""
+SQLite backend with the connection options added in Django 5.1.
+
+Supports the 'init_command' and 'transaction_mode' OPTIONS the same way
+Django 5.1's sqlite3 backend does, so settings keep working unchanged once
+ENGINE is switched back to 'django.db.backends.sqlite3' after upgrading.
+"""
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'EXCLUSIVE', 'IMMEDIATE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+
+        transaction_mode = kwargs.pop('transaction_mode', None)
+        if transaction_mode is not None and transaction_mode.upper() not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"settings.DATABASES['{self.alias}']['OPTIONS']['transaction_mode'] is "
+                f"improperly configured to '{transaction_mode}'. Use one of "
+                f"{', '.join(TRANSACTION_MODES)}, or None."
+            )
+        self.transaction_mode = transaction_mode.upper() if transaction_mode else None
+        self.init_command = kwargs.pop('init_command', '')
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for statement in self.init_command.split(';'):
+            statement = statement.strip()
+            if statement:
+                conn.execute(statement)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        """Start a transaction in the configured mode (DEFERRED by default)"""
+        if self.transaction_mode is None:
+            self.cursor().execute("BEGIN")
+        else:
+            self.cursor().execute(f"BEGIN {self.transaction_mode}")
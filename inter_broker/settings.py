@@ -10,17 +10,25 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+import django
+from dotenv import load_dotenv
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Deployment settings can be provided through environment variables or a
+# .env file next to manage.py (see .env.example)
+load_dotenv(BASE_DIR / '.env')
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.0/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-nn5g%nta#)h%wlt)yt4mwut6lqmoz=mdxv8vqat#&=hws+n%64'
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', 'django-insecure-nn5g%nta#)h%wlt)yt4mwut6lqmoz=mdxv8vqat#&=hws+n%64')
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
@@ -48,6 +56,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'broker.middleware.WebhookIPAllowlistMiddleware',
+    'broker.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -78,16 +88,79 @@ TEMPLATES = [
 WSGI_APPLICATION = 'inter_broker.wsgi.application'
 
 
+# Django REST framework
+# JSON is parsed and rendered with orjson when installed (stdlib json otherwise)
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'broker.fastjson.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'broker.fastjson.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
+
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # django.db.backends.sqlite3 plus the init_command and transaction_mode
+        # options of Django 5.1
+        'ENGINE': 'inter_broker.db_backend',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections open across requests, checked before reuse
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Seconds to wait for a lock held by another process (busy timeout)
+            'timeout': 20,
+            # Take the write lock when a transaction starts, so it waits for
+            # other writers instead of failing with "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+            # WAL lets readers run alongside a writer; synchronous=NORMAL is
+            # durable across app crashes in WAL mode
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA cache_size=-64000;'  # KiB (about 64 MB)
+                'PRAGMA mmap_size=268435456;'
+                'PRAGMA temp_store=MEMORY'
+            ),
+        },
     }
 }
 
+# PostgreSQL, selected with DB_ENGINE=postgresql. Django 5.1+ pools connections
+# per worker process (psycopg 3); older versions keep persistent connections.
+if os.environ.get('DB_ENGINE', 'sqlite') == 'postgresql':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('DB_NAME', 'inter_broker'),
+        'USER': os.environ.get('DB_USER', 'inter_broker'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+        'HOST': os.environ.get('DB_HOST', '127.0.0.1'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+    }
+    if django.VERSION >= (5, 1):
+        # Pooled connections replace persistent ones
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 1)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 4)),
+        }
+
+# Funnel webhook writes through one writer thread per process (broker.db.run_write,
+# SQLite only)
+SQLITE_WRITE_QUEUE = False
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -126,6 +199,110 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# TradingView webhook IP allowlist
+# Checked by broker.middleware.WebhookIPAllowlistMiddleware before any other
+# middleware runs. X-Forwarded-For is only trusted from TRUSTED_PROXIES (nginx).
+
+WEBHOOK_IP_ALLOWLIST_ENABLED = False  # Disabled for testing, enabled in settings_prod
+
+WEBHOOK_IP_ALLOWLIST = [
+    '52.89.214.238/32',
+    '34.212.75.30/32',
+    '54.218.53.128/32',
+    '52.32.178.7/32',
+    '127.0.0.1/32',
+    '172.31.31.33/32',  # EC2 instance private IP
+    '16.170.148.120/32',  # EC2 instance public IP
+]
+
+WEBHOOK_IP_ALLOWLIST_PATHS = ['/api/webhook/']
+
+TRUSTED_PROXIES = ['127.0.0.1/32', '::1/128']
+
+# Lean webhook endpoint
+# When enabled, inter_broker.wsgi serves POSTs to WEBHOOK_LEAN_PATH with
+# broker.lean.LeanWebhookApp instead of the DRF WebhookView
+
+WEBHOOK_LEAN_ENDPOINT = False
+
+WEBHOOK_LEAN_PATH = '/api/webhook/'
+
+WEBHOOK_MAX_BODY_SIZE = 64 * 1024  # bytes
+
+# Webhook header storage
+# 'full' stores every request header on each webhook row, 'compact' keeps only
+# the allowlisted headers and shares identical sets through broker.HeaderSet
+
+WEBHOOK_HEADER_STORAGE = 'compact'
+
+WEBHOOK_HEADER_ALLOWLIST = [
+    'Host',
+    'User-Agent',
+    'Content-Type',
+    'X-Forwarded-Proto',
+]
+
+# Allowlisted headers that differ per request (client addresses), kept on the
+# webhook row in 'compact' mode instead of in the shared header set
+
+WEBHOOK_REQUEST_HEADER_ALLOWLIST = [
+    'X-Forwarded-For',
+    'X-Real-Ip',
+]
+
+# Webhook retention
+# Webhooks older than WEBHOOK_RETENTION_DAYS are moved into one compressed
+# NDJSON file per day by `manage.py archive_webhooks` (see inter_broker_archive.timer)
+
+WEBHOOK_RETENTION_DAYS = 30
+
+WEBHOOK_ARCHIVE_DIR = BASE_DIR / 'archive' / 'webhooks'
+
+WEBHOOK_ARCHIVE_COMPRESSION = 'gzip'  # 'gzip' or 'lzma'
+
+# Order signal coalescing
+# Signals for the same symbol and account arriving within this window are
+# netted into one order by ib_gateway.coalesce.SignalCoalescer (0 disables it)
+
+ORDER_COALESCE_WINDOW_MS = 0
+
+# IB Gateway config cache
+# Active IBConfig rows are cached per process; saving or deleting one touches
+# this file so every process (gunicorn workers, update_orders --daemon) reloads
+
+IB_CONFIG_VERSION_FILE = BASE_DIR / 'run' / 'ib_config.version'
+
+# Metrics
+# Each process writes its metrics to a file in METRICS_DIR, /metrics adds them
+# up over all processes (broker.metrics). Only METRICS_ALLOWLIST may scrape.
+
+METRICS_DIR = BASE_DIR / 'run' / 'metrics'
+
+METRICS_ALLOWLIST = ['127.0.0.1/32', '::1/128']
+
+# Caches
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Order API responses are shared by all gunicorn workers and the sync daemon
+# through a file cache, invalidated whenever an order changes (ib_gateway.cache)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'orders': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'run' / 'cache' / 'orders',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Tests
+# The test runner moves the run/ files above (order cache, metrics, config
+# version file) to a temporary directory for the test run
+
+TEST_RUNNER = 'inter_broker.test_runner.TempRunDirTestRunner'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -8,6 +8,12 @@ ALLOWED_HOSTS = [
     '16.170.148.120'
 ]
 
+# Only accept webhooks from TradingView
+WEBHOOK_IP_ALLOWLIST_ENABLED = True
+
+# One writer thread per gunicorn worker commits webhook writes in batches
+SQLITE_WRITE_QUEUE = True
+
 # Security settings
 SECURE_SSL_REDIRECT = True
 SESSION_COOKIE_SECURE = True
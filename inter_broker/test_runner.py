@@ -0,0 +1,39 @@
+import copy
+import pathlib
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TempRunDirTestRunner(DiscoverRunner):
+    """
+    Test runner that keeps the tests out of run/
+
+    The order cache, the metric files and the config version file are moved
+    to a temporary directory for the test run, so running the tests next to
+    a live deployment never clears its cache or adds to its metrics.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.run_dir = tempfile.TemporaryDirectory(prefix='inter_broker_test_')
+        run_dir = pathlib.Path(self.run_dir.name)
+        caches = copy.deepcopy(settings.CACHES)
+        caches['orders']['LOCATION'] = run_dir / 'cache' / 'orders'
+        self.run_settings = override_settings(
+            CACHES=caches,
+            METRICS_DIR=run_dir / 'metrics',
+            IB_CONFIG_VERSION_FILE=run_dir / 'ib_config.version',
+        )
+        self.run_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        from broker.metrics import REGISTRY
+
+        # Otherwise the exit flush would write the values recorded by the tests to METRICS_DIR
+        REGISTRY.stop()
+        self.run_settings.disable()
+        self.run_dir.cleanup()
+        super().teardown_test_environment(**kwargs)
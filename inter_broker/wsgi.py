@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inter_broker.settings')
 
 application = get_wsgi_application()
+
+# Optionally serve the webhook endpoint without the Django middleware stack and DRF
+from django.conf import settings
+
+if getattr(settings, 'WEBHOOK_LEAN_ENDPOINT', False):
+    from broker.lean import LeanWebhookApp
+
+    application = LeanWebhookApp(application)
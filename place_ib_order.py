@@ -11,7 +11,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inter_broker.settings')
 django.setup()
 
-from ib_gateway.models import IBConfig, Order
+from ib_gateway.configs import default_config
+from ib_gateway.models import Order
 from ib_gateway.connection import IBConnection
 
 # Set up logging
@@ -24,7 +25,7 @@ def place_order_to_ib(symbol="AAPL", action="BUY", quantity=1, order_type="MKT",
     """Place an order directly to IB Gateway and check status"""
     
     # Get the active configuration
-    config = IBConfig.objects.filter(is_active=True).first()
+    config = default_config()
     if not config:
         logger.error("No active IB Gateway configuration found")
         return
@@ -100,7 +101,7 @@ def place_order_to_ib(symbol="AAPL", action="BUY", quantity=1, order_type="MKT",
             
         # Check if order already exists in database
         try:
-            db_order = Order.objects.get(order_id=str(order_id))
+            db_order = Order.objects.filter(config=config).with_order_id(order_id).get()
             logger.info(f"Order with ID {order_id} already exists in database. Updating...")
             
             # Update existing order
@@ -121,6 +122,7 @@ def place_order_to_ib(symbol="AAPL", action="BUY", quantity=1, order_type="MKT",
             # Create the order in the database
             db_order = Order(
                 order_id=str(order_id),
+                config=config,
                 symbol=symbol,
                 action=action,
                 quantity=quantity,